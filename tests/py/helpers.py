@@ -1,6 +1,8 @@
 
 # some helpers to print matrix strings.
 
+import threading
+
 def str2(m, fmt='%7.2e', rowmajor=True):
     s = ''
     if isinstance(m, list):
@@ -94,77 +96,83 @@ def run_go_test(name, refvals):
     subprocess.call(args)
 
 
+# Savepoint state of the calling thread (see sp_context()).  Each thread
+# has its own state, so solves running in different threads do not mix 
+# their savepoint variables and counters.
+spstate = threading.local()
 
-spvariables = {}
-spmajor = 0
-spminor = 0
-sppath = '.'
-spactive = False
-spstack = []
+def sp_context():
+    """
+    Returns the savepoint state of the calling thread, a dictionary with
+    the registered variables ('variables'), the major and minor counters
+    ('major', 'minor'), the output directory ('path'), the minor stack 
+    ('stack') and the flag 'active'.
+    """
+    try:
+        return spstate.context
+    except AttributeError:
+        spstate.context = {'variables': {}, 'major': 0, 'minor': 0, 
+            'path': '.', 'active': False, 'stack': []}
+        return spstate.context
 
 def sp_reset(path):
-    global spmajor, spminor, sppath, spvariables
-    spvariables = {}
-    spmajor = 0
-    spminor = 0
-    sppath = path
-    spactive = False
+    sp = sp_context()
+    sp['variables'] = {}
+    sp['major'] = 0
+    sp['minor'] = 0
+    sp['path'] = path
+    sp['active'] = False
 
 def sp_activate():
-    global spactive
-    spactive = True
+    sp_context()['active'] = True
 
 def sp_major():
-    global spmajor
-    return spmajor
+    return sp_context()['major']
 
 def sp_major_next():
-    if spactive:
-        global spmajor, spminor
-        spmajor += 1
-        spminor = 0
+    sp = sp_context()
+    if sp['active']:
+        sp['major'] += 1
+        sp['minor'] = 0
 
 def sp_minor_push(val):
-    if spactive:
-        global spstack
-        spstack.append(val)
+    sp = sp_context()
+    if sp['active']:
+        sp['stack'].append(val)
 
 def sp_minor_pop():
-    if spactive:
-        global spstack
-        minor = spstack[-1]
-        del spstack[-1]
-        return minor
+    sp = sp_context()
+    if sp['active']:
+        return sp['stack'].pop()
 
 def sp_minor_empty():
-    global spstack
-    return len(spstack) == 0
+    return len(sp_context()['stack']) == 0
 
 def sp_minor_top():
-    if spactive:
-        global spstack
-        return spstack[-1]
+    sp = sp_context()
+    if sp['active']:
+        return sp['stack'][-1]
     return 0
 
 def sp_add_var(name, var):
-    global spvariables
-    spvariables[name] = var
+    sp_context()['variables'][name] = var
 
 
 def sp_create(name, minor, singletons={}):
     import os.path
     from cvxopt import matrix
 
-    global spactive
-    if not spactive:
+    sp = sp_context()
+    if not sp['active']:
         return
 
-    path = os.path.join(sppath, "%04d-%04d." % (spmajor, minor) + name)
+    path = os.path.join(sp['path'], "%04d-%04d." % (sp['major'], minor) + 
+        name)
     #print "sp_create: path=", path
     try:
         with open(path, "w+") as fp:
             fp.write("name: "+name+"\n")
-            for k, v in spvariables.items():
+            for k, v in sp['variables'].items():
                 if isinstance(v, matrix):
                     # normal matrix
                     fp.write("%s matrix 1: %s\n" % (k, strSpe(v)))
@@ -197,9 +205,8 @@ def sp_create(name, minor, singletons={}):
         
                 
 def sp_create_next(name):
-    global spactive
     #print "sp_create_next: spactive=", str(spactive)
-    if spactive:
+    if sp_context()['active']:
         sp_minor_next()
         sp_create(name)
 
@@ -26,17 +26,227 @@ options = {}
 
 import localmisc
 import helpers
+import threading
 
 options = {}
 
+# Workspaces of conelp() and coneqp() that are not in use, most recently
+# used first.  Solves with a default kktsolver take a workspace for the 
+# problem shape from this pool, and return it when they finish.
+workspaces = []
+WORKSPACES_SIZE = 4
+workspaces_lock = threading.Lock()
+
+# A warm start of conelp_solve() starts from the first iterate of the 
+# last solve with a relative gap and residuals of at most WARMSTART_GAP,
+# moved into the interior to a distance WARMSTART_SHIFT * sqrt(mu) of 
+# the boundary of the cone.
+WARMSTART_GAP = 0.2
+WARMSTART_SHIFT = 0.3
+
+# conelp() and coneqp() solve problems with 'l' constraints only, fewer 
+# than SMALL_SIZE variables and fewer than SMALL_ROWS constraints with
+# conelp_small() and coneqp_small(), unless a KKT solver other than 'ldl'
+# is requested, a workspace, starting points, iterative refinement or 
+# correctors are used, or savepoints are written (see 
+# helpers.sp_activate()).  For these problems the time is spent 
+# mostly in the interpreter, not in the linear algebra.
+SMALL_SIZE = 20
+SMALL_ROWS = 200
+
+# qp_batch() solves its problems in chunks of BATCH_SIZE problems.
+BATCH_SIZE = 1000
+
+
+def workspace_new(n, p, dims, kktsolver = None):
+    """
+    Returns an empty workspace for conelp() or coneqp() with n variables,
+    p equality constraints, cone dimensions dims and kktsolver.
+
+    The workspace is a dictionary.  The work vectors of the solver and 
+    the dense buffers of the KKT solvers kkt_ldl(), kkt_qr() and 
+    kkt_chol() are stored in it in the first solve that uses it, and 
+    reused by later solves.  A workspace can be used by one solve at a 
+    time.
+    """
+
+    return {'key': workspace_key(n, p, dims, kktsolver)}
+
+
+def workspace_key(n, p, dims, kktsolver = None):
+    """
+    Returns the key of the workspaces for conelp() or coneqp() with n 
+    variables, p equality constraints, cone dimensions dims and 
+    kktsolver.  A workspace can only be used for problems with its key.
+    """
+
+    return (n, p, dims['l'], tuple(dims['q']), tuple(dims['s']), kktsolver)
+
+
+def workspace_get(n, p, dims, kktsolver):
+    """
+    Removes a workspace for the problem shape from the pool workspaces 
+    and returns it, or returns a new workspace if there is none.
+    """
+
+    key = workspace_key(n, p, dims, kktsolver)
+    workspaces_lock.acquire()
+    try:
+        for k in xrange(len(workspaces)):
+            if workspaces[k]['key'] == key:
+                return workspaces.pop(k)
+    finally:
+        workspaces_lock.release()
+    return workspace_new(n, p, dims, kktsolver)
+
+
+def workspace_put(ws):
+    """
+    Returns a workspace to the pool.  The least recently used workspaces
+    are dropped if the pool has more than WORKSPACES_SIZE entries.
+    """
+
+    workspaces_lock.acquire()
+    try:
+        workspaces.insert(0, ws)
+        del workspaces[WORKSPACES_SIZE:]
+    finally:
+        workspaces_lock.release()
+
+
+def cone_presolve(G, h, dims):
+    """
+    Rewrites 1-dimensional 'q' cones and 1 x 1 's' blocks as 'l' cones,
+    and 2 x 2 's' blocks as 3-dimensional 'q' cones, using 
+
+        [ a  b ] 
+        [ b  c ] >= 0  <==>  ((a+c)/sqrt(2), (a-c)/sqrt(2), sqrt(2)*b) 
+                             in Q_3.
+
+    The map T from a 2 x 2 block to Q_3 is an isometry for the inner 
+    product of S, so it maps s and z in the same way.
+
+    Returns None if no cone is rewritten.  Otherwise returns a 
+    dictionary with the new 'G', 'h' and 'dims', and the maps 'T' 
+    (original to new coordinates, using the lower triangular entries) 
+    and 'B' (new to original coordinates, filling both triangles).
+    """
+
+    import math
+    from cvxopt import matrix, spmatrix
+
+    mq, ms = dims['q'], dims['s']
+    if 1 not in mq and 1 not in ms and 2 not in ms: return None
+
+    indq = [ dims['l'] ]
+    for m in mq: indq.append(indq[-1] + m)
+    inds = [ indq[-1] ]
+    for m in ms: inds.append(inds[-1] + m**2)
+
+    # T[i,j] = TV, B[i,j] = BV.
+    TI, TJ, TV, BI, BJ, BV = [], [], [], [], [], []
+    def copy(i, j):
+        TI.append(i);  TJ.append(j);  TV.append(1.0)
+        BI.append(j);  BJ.append(i);  BV.append(1.0)
+
+    ind = 0
+    for k in xrange(dims['l']):
+        copy(ind, k);  ind += 1
+    for k in xrange(len(mq)):
+        if mq[k] == 1: 
+            copy(ind, indq[k]);  ind += 1
+    for k in xrange(len(ms)):
+        if ms[k] == 1: 
+            copy(ind, inds[k]);  ind += 1
+    nl, nq = ind, []
+    for k in xrange(len(mq)):
+        if mq[k] == 1: continue
+        for i in xrange(mq[k]): copy(ind + i, indq[k] + i)
+        ind += mq[k]
+        nq.append(mq[k])
+    r = math.sqrt(0.5)
+    for k in xrange(len(ms)):
+        if ms[k] != 2: continue
+        a, bl, bu, c = inds[k], inds[k] + 1, inds[k] + 2, inds[k] + 3
+        TI += [ ind, ind, ind+1, ind+1, ind+2 ]
+        TJ += [ a, c, a, c, bl ]
+        TV += [ r, r, r, -r, 2.0*r ]
+        BI += [ a, a, c, c, bl, bu ]
+        BJ += [ ind, ind+1, ind, ind+1, ind+2, ind+2 ]
+        BV += [ r, r, r, -r, r, r ]
+        ind += 3
+        nq.append(3)
+    ns = []
+    for k in xrange(len(ms)):
+        if ms[k] < 3: continue
+        for i in xrange(ms[k]**2): copy(ind + i, inds[k] + i)
+        ind += ms[k]**2
+        ns.append(ms[k])
+
+    T = spmatrix(TV, TI, TJ, (ind, h.size[0]))
+    B = spmatrix(BV, BI, BJ, (h.size[0], ind))
+    return {'G': T * G, 'h': matrix(T * h), 'dims': {'l': nl, 'q': nq, 
+        's': ns}, 'T': T, 'B': B}
+
+
+def cone_postsolve(sol, pre):
+    """
+    Maps 's' and 'z' in the solution of the problem returned by 
+    cone_presolve() back to the original cones.
+    """
+
+    from cvxopt import matrix
+
+    for key in ('s', 'z'):
+        if sol[key] is not None: sol[key] = matrix(pre['B'] * sol[key])
+
+
+def iterate_best(best, dims, iters, xscal = None, yscal = None):
+    """
+    Returns the iterate best stored by localmisc.iterate_save() as a 
+    solution of conelp() or coneqp() with status 'time_limit', after 
+    iters iterations:  x, y, s, z are divided by tau, and the slacks are
+    added.
+    """
+
+    from cvxopt import blas, misc
+
+    if xscal is None: xscal = blas.scal
+    if yscal is None: yscal = blas.scal
+    tau = best.pop('tau')
+    del best['rank']
+    xscal(1.0/tau, best['x'])
+    yscal(1.0/tau, best['y'])
+    blas.scal(1.0/tau, best['s'])
+    blas.scal(1.0/tau, best['z'])
+    ind = dims['l'] + sum(dims['q'])
+    for m in dims['s']:
+        misc.symm(best['s'], m, ind)
+        misc.symm(best['z'], m, ind)
+        ind += m**2
+    best['primal slack'] = -misc.max_step(best['s'], dims)
+    best['dual slack'] = -misc.max_step(best['z'], dims)
+    best['status'] = 'time_limit'
+    best['iterations'] = iters
+    return best
+
+
 def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None, 
     dualstart = None, kktsolver = None, xnewcopy = None, xdot = None,
     xaxpy = None, xscal = None, ynewcopy = None, ydot = None, yaxpy = None,
-    yscal = None):
+    yscal = None, workspace = None, warmstart = None, options = None):
 
-    import math
+    import math, time
     from cvxopt import base, blas, misc, matrix, spmatrix
 
+    starttime = time.time()
+
+    # The options of this solve:  the dictionary options of the module if
+    # None.  A solve reads no other module state that changes between 
+    # calls, so that solves with different options can run concurrently 
+    # in separate threads.
+    if options is None: options = globals()['options']
+
     EXPON = 3
     STEP = 0.99
 
@@ -77,13 +287,41 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
     try: show_progress = options['show_progress']
     except KeyError: show_progress = True
 
-    if kktsolver is None: 
+    # With options['time_limit'], the solver returns the best iterate 
+    # with status 'time_limit' when the next iteration is not expected to 
+    # finish within options['time_limit'] seconds of the call (see 
+    # localmisc.time_out() and localmisc.iterate_save()).
+    try: TIMELIMIT = options['time_limit']
+    except KeyError: TIMELIMIT = None
+    else:
+        if TIMELIMIT is not None and ((type(TIMELIMIT) is not float and 
+            type(TIMELIMIT) is not int) or TIMELIMIT <= 0.0):
+            raise ValueError("options['time_limit'] must be None or a "\
+                "positive scalar")
+
+    try: MEMORY = options['memory']
+    except KeyError: MEMORY = 'normal'
+    else:
+        if MEMORY not in ('normal', 'low'):
+            raise ValueError("options['memory'] must be 'normal' or 'low'")
+    LOWMEM = MEMORY == 'low'
+
+    # The small problems of conelp_small() are solved with a dense LDL 
+    # factorization, so only if kktsolver is None or 'ldl'.
+    smallkkt = kktsolver is None or kktsolver == 'ldl'
+
+    # With options['memory'] = 'low', the default KKT solver is the one
+    # with the smallest storage (see localmisc.kkt_select()).
+    if kktsolver is None and LOWMEM:
+        kktsolver = 'auto'
+    elif kktsolver is None: 
         if dims and (dims['q'] or dims['s']):  
             kktsolver = 'qr'            
         else:
             kktsolver = 'chol2'
     defaultsolvers = ('ldl', 'ldl2', 'qr', 'chol', 'chol2')
-    if type(kktsolver) is str and kktsolver not in defaultsolvers:
+    if type(kktsolver) is str and kktsolver != 'auto' and \
+        kktsolver not in defaultsolvers:
         raise ValueError("'%s' is not a valid value for kktsolver" \
             %kktsolver)
 
@@ -131,6 +369,37 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
             raise ValueError("options['refinement'] must be a "\
                 "nonnegative integer")
 
+    try: REFTOL = options['refinement_tol']
+    except KeyError: REFTOL = None
+    else:
+        if (type(REFTOL) is not float and type(REFTOL) is not int) or \
+            REFTOL < 0.0:
+            raise ValueError("options['refinement_tol'] must be a "\
+                "nonnegative scalar")
+
+    try: correctors = options['correctors']
+    except KeyError: correctors = 0
+    else:
+        if type(correctors) is not int or correctors < 0: 
+            raise ValueError("options['correctors'] must be a "\
+                "nonnegative integer")
+
+    try: RESFREQ = options['residual_refresh']
+    except KeyError: RESFREQ = 1
+    else:
+        if type(RESFREQ) is not int or RESFREQ < 1: 
+            raise ValueError("options['residual_refresh'] must be a "\
+                "positive integer")
+
+    # With options['scaling_threads'] > 1, the 's' blocks of the scaling
+    # are updated in that many threads by localmisc.local_update_scaling().
+    try: SCALING_THREADS = options['scaling_threads']
+    except KeyError: SCALING_THREADS = 1
+    else:
+        if type(SCALING_THREADS) is not int or SCALING_THREADS < 1: 
+            raise ValueError("options['scaling_threads'] must be a "\
+                "positive integer")
+
 
     cdim = dims['l'] + sum(dims['q']) + sum([k**2 for k in dims['s']])
     cdim_pckd = dims['l'] + sum(dims['q']) + sum([k*(k+1)/2 for k in 
@@ -188,24 +457,86 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
         if b is None: 
             raise ValueError("use of non vector type for y requires b")
 
+    # Presolve, if options['presolve'] is true:  1-dimensional 'q' cones 
+    # and 1 x 1 's' blocks are solved as 'l' cones, 2 x 2 's' blocks as 
+    # 3-dimensional 'q' cones.  A workspace is created for the cones of 
+    # the problem as given, so it cannot be used for the rewritten one.
+    try: presolve = options['presolve']
+    except KeyError: presolve = False
+    if presolve and matrixG and matrixA and not customkkt:
+        pre = cone_presolve(G, h, dims)
+        if pre is not None and workspace is not None:
+            raise ValueError("a workspace cannot be used when "\
+                "options['presolve'] rewrites the cones")
+        if pre is not None:
+            ps, ds = primalstart, dualstart
+            if ps is not None:
+                ps = dict(ps)
+                ps['s'] = matrix(pre['T'] * ps['s'])
+            if ds is not None:
+                ds = dict(ds)
+                ds['z'] = matrix(pre['T'] * ds['z'])
+            sol = conelp(c, pre['G'], pre['h'], pre['dims'], A, b, ps, ds,
+                kktsolver, warmstart = warmstart, options = options)
+            cone_postsolve(sol, pre)
+            if warmstart: cone_postsolve(warmstart, pre)
+            return sol
+
+    # Small problems with 'l' constraints only are solved by 
+    # conelp_small() (see SMALL_SIZE).
+    if c.size[0] < SMALL_SIZE and 0 < cdim < SMALL_ROWS and smallkkt \
+        and not dims['q'] and not dims['s'] and primalstart is None and \
+        dualstart is None and workspace is None and warmstart is None and \
+        not refinement and not correctors and not DEBUG and \
+        not helpers.sp_context()['active']:
+        return conelp_small(c, G, h, A, b, MAXITERS, ABSTOL, RELTOL, 
+            FEASTOL, show_progress, TIMELIMIT, starttime)
 
     # kktsolver(W) returns a routine for solving 3x3 block KKT system 
     #
     #     [ 0   A'  G'*W^{-1} ] [ ux ]   [ bx ]
     #     [ A   0   0         ] [ uy ] = [ by ].
     #     [ G   0   -W'       ] [ uz ]   [ bz ]
-
+    #
+    # With kktsolver 'auto', the solver is chosen by kkt_select().
+
+    if kktsolver == 'auto':
+        kktsolver = localmisc.kkt_select(G, dims, A, memory = MEMORY)
+
+    # The work vectors and KKT solver buffers are stored in a workspace
+    # (see workspace_new()).  For the default KKT solvers, a workspace for 
+    # this problem shape is taken from the pool if none is given, unless
+    # options['memory'] is 'low':  the pool keeps the buffers alive after
+    # the solve.
+    if workspace is None:
+        if kktsolver in defaultsolvers and WORKSPACES_SIZE and not LOWMEM:
+            ws = workspace_get(c.size[0], b.size[0], dims, kktsolver)
+            try:
+                return conelp(c, G, h, dims, A, b, primalstart, dualstart,
+                    kktsolver, workspace = ws, warmstart = warmstart, 
+                    options = options)
+            finally:
+                workspace_put(ws)
+    elif customx or customy:
+        raise ValueError("a workspace cannot be used with non-vector "\
+            "types for x or y")
+    elif workspace['key'] != \
+        workspace_key(c.size[0], b.size[0], dims, kktsolver):
+        raise ValueError("workspace was created for a different problem")
+    if workspace is not None: workspace['frozen'] = False
     if kktsolver in defaultsolvers:
         if b.size[0] > c.size[0] or b.size[0] + cdim_pckd < c.size[0]:
            raise ValueError("Rank(A) < p or Rank([G; A]) < n")
         if kktsolver == 'ldl': 
-            factor = localmisc.kkt_ldl(G, dims, A)
+            factor = localmisc.kkt_ldl(G, dims, A, ws = workspace, 
+                memory = MEMORY)
         elif kktsolver == 'ldl2':
             factor = misc.kkt_ldl2(G, dims, A)
         elif kktsolver == 'qr':
-            factor = localmisc.kkt_qr(G, dims, A)
+            factor = localmisc.kkt_qr(G, dims, A, ws = workspace)
         elif kktsolver == 'chol':
-            factor = localmisc.kkt_chol(G, dims, A)
+            factor = localmisc.kkt_chol(G, dims, A, ws = workspace, 
+                memory = MEMORY)
         else:
             factor = localmisc.kkt_chol2(G, dims, A)
         def kktsolver(W):
@@ -222,7 +553,27 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
     #           vs += lmbda o (dz + ds) 
     #       vkappa += lmbdg * (dtau + dkappa).
 
-    ws3, wz3 = matrix(0.0, (cdim,1)), matrix(0.0, (cdim,1))
+    # Work vectors, from the workspace if one is used.  
+    #
+    # With options['memory'] = 'low', work vectors that are never live 
+    # at the same time share storage, also without a workspace:  the 
+    # unscaled corrector candidate (dsc, dzc) is stored after a solve 
+    # with f6(), and the correction wt is used before it, in the vectors
+    # of iterative refinement, which are only used inside f6().
+    if LOWMEM: share = {'dsc': 'ws2', 'dzc': 'wz2', 'wt': 'ws'}
+    else: share = {}
+    store = workspace
+    if LOWMEM and store is None: store = {}
+    def work(name, size): 
+        return localmisc.ws_matrix(store, share.get(name, name), size)
+    def xwork(name):
+        if workspace is None: return xnewcopy(c)
+        return localmisc.ws_copy(workspace, name, c)
+    def ywork(name):
+        if workspace is None: return ynewcopy(b)
+        return localmisc.ws_copy(workspace, name, b)
+
+    ws3, wz3 = work('ws3', (cdim,1)), work('wz3', (cdim,1))
     helpers.sp_add_var("ws3", ws3)
     helpers.sp_add_var("wz3", wz3)
     def res(ux, uy, uz, utau, us, ukappa, vx, vy, vz, vtau, vs, vkappa, W,
@@ -231,7 +582,7 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
         # vx := vx - A'*uy - G'*W^{-1}*uz - c*utau/dg
         Af(uy, vx, alpha = -1.0, beta = 1.0, trans = 'T')
         blas.copy(uz, wz3)
-        localmisc.scale(wz3, W, inverse = 'I')
+        localmisc.scale(wz3, W, inverse = 'I', ws = workspace)
         Gf(wz3, vx, alpha = -1.0, beta = 1.0, trans = 'T')
         xaxpy(c, vx, alpha = -utau[0]/dg)
 
@@ -243,7 +594,7 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
         Gf(ux, vz, alpha = 1.0, beta = 1.0)
         blas.axpy(h, vz, alpha = -utau[0]/dg)
         blas.copy(us, ws3)
-        localmisc.scale(ws3, W, trans = 'T')
+        localmisc.scale(ws3, W, trans = 'T', ws = workspace)
         blas.axpy(ws3, vz)
 
         # vtau := vtau + c'*ux + b'*uy + h'*W^{-1}*uz + dg*ukappa
@@ -254,7 +605,6 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
         # vs := vs + lmbda o (uz + us)
         blas.copy(us, ws3)
         blas.axpy(uz, ws3)
-        #localmisc.local_sprod(ws3, lmbda, dims, diag = 'D')
         misc.sprod(ws3, lmbda, dims, diag = 'D')
         blas.axpy(ws3, vs)
 
@@ -262,6 +612,15 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
         vkappa[0] += lmbda[-1] * (utau[0] + ukappa[0])
 
 
+    # Euclidean norm of (vx, vy, vz, vtau, vs, vkappa), for the stopping
+    # test of the iterative refinement.
+
+    def resnrm(vx, vy, vz, vtau, vs, vkappa):
+        return math.sqrt(xdot(vx, vx) + ydot(vy, vy) + 
+            misc.sdot(vz, vz, dims) + vtau[0]**2 + 
+            misc.sdot(vs, vs, dims) + vkappa[0]**2)
+
+
     if xnewcopy is None: xnewcopy = matrix 
     if xdot is None: xdot = blas.dot
     if xaxpy is None: xaxpy = blas.axpy 
@@ -286,9 +645,21 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
     x = xnewcopy(c);  xscal(0.0, x)
     y = ynewcopy(b);  yscal(0.0, y)
     s, z = matrix(0.0, (cdim,1)), matrix(0.0, (cdim,1))
-    dx, dy = xnewcopy(c), ynewcopy(b)
-    ds, dz = matrix(0.0, (cdim,1)), matrix(0.0, (cdim,1))
-    dkappa, dtau = matrix(0.0, (1,1)), matrix(0.0, (1,1))
+    dx, dy = xwork('dx'), ywork('dy')
+    ds, dz = work('ds', (cdim,1)), work('dz', (cdim,1))
+    dkappa, dtau = work('dkappa', (1,1)), work('dtau', (1,1))
+
+    # With centrality correctors:  the accepted direction (dxa, dya, dsa,
+    # dza; dsu, dzu before scaling with lmbda), the unscaled candidate 
+    # (dsc, dzc) and the corrector right-hand side wcor:  the second 
+    # order term ws3 of the Mehrotra step minus the corrections wt of the
+    # accepted correctors.  (ws3 itself is overwritten by f6().)
+    if correctors:
+        dxa, dya = xwork('dxa'), ywork('dya')
+        dsa, dza = work('dsa', (cdim,1)), work('dza', (cdim,1))
+        dsu, dzu = work('dsu', (cdim,1)), work('dzu', (cdim,1))
+        dsc, dzc = work('dsc', (cdim,1)), work('dzc', (cdim,1))
+        wcor, wt = work('wcor', (cdim,1)), work('wt', (cdim,1))
 
     helpers.sp_add_var("x", x)
     helpers.sp_add_var("s", s)
@@ -320,6 +691,29 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
         except ArithmeticError:  
             raise ValueError("Rank(A) < p or Rank([G; A]) < n")
         helpers.sp_add_var("W", W)
+
+    # If both starting points are computed, the two systems below share 
+    # the factorization and are solved together, with the right-hand 
+    # sides [0, -c], [b, 0], [h, 0] stacked in X, Y, Z.  They are solved
+    # separately if savepoints are written, as in the iterations below.
+    X = None
+    if primalstart is None and dualstart is None and not customkkt and \
+        not helpers.sp_context()['active']:
+        X = work('X', (c.size[0], 2))
+        Y = work('Y', (b.size[0], 2))
+        Z = work('Z', (cdim, 2))
+        X[:, 1] = -c
+        Y[:, 0] = b
+        Z[:, 0] = h
+        try: localmisc.kkt_solve_many(f, X, Y, Z)
+        except ArithmeticError:  
+            raise ValueError("Rank(A) < p or Rank([G; A]) < n")
+
+    # In each iteration, the system with right-hand side [c; b; h] is 
+    # solved together with the first system of the predictor step.  It 
+    # is solved separately if savepoints are written, which record the 
+    # two solves in order.
+    batched = not customkkt and not helpers.sp_context()['active']
         
     helpers.sp_create("05init", 5)
     if primalstart is None:
@@ -334,12 +728,15 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
         #     [ G   0  -I  ]   [ -s ]   [ h ]
 
         helpers.sp_minor_push(5)
-        xscal(0.0, x)
-        ycopy(b, dy)  
-        blas.copy(h, s)
-        try: f(x, dy, s) 
-        except ArithmeticError:  
-            raise ValueError("Rank(A) < p or Rank([G; A]) < n")
+        if X is not None:
+            x[:], dy[:], s[:] = X[:, 0], Y[:, 0], Z[:, 0]
+        else:
+            xscal(0.0, x)
+            ycopy(b, dy)  
+            blas.copy(h, s)
+            try: f(x, dy, s) 
+            except ArithmeticError:  
+                raise ValueError("Rank(A) < p or Rank([G; A]) < n")
         blas.scal(-1.0, s)  
         helpers.sp_minor_pop()
         print "** initial s=\n", helpers.str2(s, "%.5f")
@@ -367,13 +764,16 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
         #     [ G   0  -I  ] [ z  ]   [  0 ]
 
         helpers.sp_minor_push(10)
-        xcopy(c, dx); 
-        xscal(-1.0, dx)
-        yscal(0.0, y)
-        blas.scal(0.0, z)
-        try: f(dx, y, z)
-        except ArithmeticError:  
-            raise ValueError("Rank(A) < p or Rank([G; A]) < n")
+        if X is not None:
+            dx[:], y[:], z[:] = X[:, 1], Y[:, 1], Z[:, 1]
+        else:
+            xcopy(c, dx); 
+            xscal(-1.0, dx)
+            yscal(0.0, y)
+            blas.scal(0.0, z)
+            try: f(dx, y, z)
+            except ArithmeticError:  
+                raise ValueError("Rank(A) < p or Rank([G; A]) < n")
 
         #print "initial z=\n", helpers.str2(z, "%.5f")
         #print "** initial z=\n", z 
@@ -502,15 +902,18 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
                 ind += m**2
 
 
+    # dualstart['kappa'], if present, is the initial kappa.  
     tau, kappa = 1.0, 1.0
+    if dualstart is not None and 'kappa' in dualstart: 
+        kappa = dualstart['kappa']
 
-    rx, hrx = xnewcopy(c), xnewcopy(c)
-    ry, hry = ynewcopy(b), ynewcopy(b)
-    rz, hrz = matrix(0.0, (cdim,1)), matrix(0.0, (cdim,1))
-    sigs = matrix(0.0, (sum(dims['s']), 1))
-    sigz = matrix(0.0, (sum(dims['s']), 1))
-    lmbda = matrix(0.0, (cdim_diag + 1, 1))
-    lmbdasq = matrix(0.0, (cdim_diag + 1, 1)) 
+    rx, hrx = xwork('rx'), xwork('hrx')
+    ry, hry = ywork('ry'), ywork('hry')
+    rz, hrz = work('rz', (cdim,1)), work('hrz', (cdim,1))
+    sigs = work('sigs', (sum(dims['s']), 1))
+    sigz = work('sigz', (sum(dims['s']), 1))
+    lmbda = work('lmbda', (cdim_diag + 1, 1))
+    lmbdasq = work('lmbdasq', (cdim_diag + 1, 1)) 
 
     #print "pre-gap s=\n", s
     #print "pre-gap z=\n", z
@@ -525,74 +928,102 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
     helpers.sp_add_var("rx", rx)
     helpers.sp_add_var("rz", rz)
 
+    best = None
     for iters in xrange(MAXITERS+1):
         helpers.sp_major_next()
         helpers.sp_create("loop-start", 100)
 
-        # hrx = -A'*y - G'*z 
-        Af(y, hrx, alpha = -1.0, trans = 'T') 
-        #print "Af hrx=\n", localmisc.strMat(hrx)
-        Gf(z, hrx, alpha = -1.0, beta = 1.0, trans = 'T') 
-        hresx = math.sqrt( xdot(hrx, hrx) ) 
-        #print "Gf hrx=\n", localmisc.strMat(hrx)
-        #print "hresx =", hresx
-
-        # rx = hrx - c*tau 
-        #    = -A'*y - G'*z - c*tau
-        xcopy(hrx, rx)
-        xaxpy(c, rx, alpha = -tau)
-        resx = math.sqrt( xdot(rx, rx) ) / tau
-        #print "initial rx=\n", localmisc.strMat(rx)
-        #print "resx =", resx
-
-        # hry = A*x  
-        Af(x, hry)
-        hresy = math.sqrt( ydot(hry, hry) )
-        #print "hresy =", hresy
-
-        # ry = hry - b*tau 
-        #    = A*x - b*tau
-        ycopy(hry, ry)
-        yaxpy(b, ry, alpha = -tau)
-        resy = math.sqrt( ydot(ry, ry) ) / tau
-        #print "resy =", resy
-
-        # hrz = s + G*x  
-        Gf(x, hrz)
-        blas.axpy(s, hrz)
-        hresz = misc.snrm2(hrz, dims) 
-        #print "hresz =", hresz
-
-        # rz = hrz - h*tau 
-        #    = s + G*x - h*tau
-        blas.scal(0, rz)
-        blas.axpy(hrz, rz)
-        blas.axpy(h, rz, alpha = -tau)
-        resz = misc.snrm2(rz, dims) / tau 
-        #print "resz =", resz
-
-        # rt = kappa + c'*x + b'*y + h'*z 
-        cx, by, hz = xdot(c,x), ydot(b,y), misc.sdot(h, z, dims) 
-        rt = kappa + cx + by + hz 
+        # In debug mode, the work vectors of the kernels are not 
+        # allocated again after the first iteration (see 
+        # localmisc.ws_matrix()).
+        if DEBUG and workspace is not None:
+            workspace['frozen'] = iters > 0
+
+        # The residuals are recomputed from scratch every RESFREQ 
+        # iterations (options['residual_refresh'], by default in every 
+        # iteration).  In the other iterations hrx, hry, hrz were 
+        # updated at the end of the previous iteration, without 
+        # products with A and G, and they are recomputed only if 
+        # the updated values pass one of the stopping criteria.
+
+        if iters % RESFREQ == 0: passes = [True]
+        else: passes = [False, True]
+        timeout = localmisc.time_out(starttime, TIMELIMIT, iters)
+        for exact in passes:
+            # hrx = -A'*y - G'*z 
+            if exact:
+                Af(y, hrx, alpha = -1.0, trans = 'T') 
+                #print "Af hrx=\n", localmisc.strMat(hrx)
+                Gf(z, hrx, alpha = -1.0, beta = 1.0, trans = 'T') 
+            hresx = math.sqrt( xdot(hrx, hrx) ) 
+            #print "Gf hrx=\n", localmisc.strMat(hrx)
+            #print "hresx =", hresx
+
+            # rx = hrx - c*tau 
+            #    = -A'*y - G'*z - c*tau
+            xcopy(hrx, rx)
+            xaxpy(c, rx, alpha = -tau)
+            resx = math.sqrt( xdot(rx, rx) ) / tau
+            #print "initial rx=\n", localmisc.strMat(rx)
+            #print "resx =", resx
+
+            # hry = A*x  
+            if exact: Af(x, hry)
+            hresy = math.sqrt( ydot(hry, hry) )
+            #print "hresy =", hresy
+
+            # ry = hry - b*tau 
+            #    = A*x - b*tau
+            ycopy(hry, ry)
+            yaxpy(b, ry, alpha = -tau)
+            resy = math.sqrt( ydot(ry, ry) ) / tau
+            #print "resy =", resy
+
+            # hrz = s + G*x  
+            if exact:
+                Gf(x, hrz)
+                blas.axpy(s, hrz)
+            hresz = misc.snrm2(hrz, dims) 
+            #print "hresz =", hresz
+
+            # rz = hrz - h*tau 
+            #    = s + G*x - h*tau
+            blas.scal(0, rz)
+            blas.axpy(hrz, rz)
+            blas.axpy(h, rz, alpha = -tau)
+            resz = misc.snrm2(rz, dims) / tau 
+            #print "resz =", resz
+
+            # rt = kappa + c'*x + b'*y + h'*z 
+            cx, by, hz = xdot(c,x), ydot(b,y), misc.sdot(h, z, dims) 
+            rt = kappa + cx + by + hz 
+
+            # Statistics for stopping criteria.
+            pcost, dcost = cx / tau, -(by + hz) / tau        
+            if pcost < 0.0:
+                relgap = gap / -pcost
+            elif dcost > 0.0:
+                relgap = gap / dcost
+            else: 
+                relgap = None
+            pres = max(resy/resy0, resz/resz0)
+            dres = resx/resx0
+            if hz + by < 0.0:  
+               pinfres =  hresx / resx0 / (-hz - by) 
+            else:
+               pinfres =  None
+            if cx < 0.0: 
+               dinfres = max(hresy / resy0, hresz/resz0) / (-cx) 
+            else:
+               dinfres = None
 
-        # Statistics for stopping criteria.
-        pcost, dcost = cx / tau, -(by + hz) / tau        
-        if pcost < 0.0:
-            relgap = gap / -pcost
-        elif dcost > 0.0:
-            relgap = gap / dcost
-        else: 
-            relgap = None
-        pres = max(resy/resy0, resz/resz0)
-        dres = resx/resx0
-        if hz + by < 0.0:  
-           pinfres =  hresx / resx0 / (-hz - by) 
-        else:
-           pinfres =  None
-        if cx < 0.0: 
-           dinfres = max(hresy / resy0, hresz/resz0) / (-cx) 
-        else:
-           dinfres = None
+            if not exact and not ( iters == MAXITERS or timeout or
+                ( pres <= FEASTOL and dres <= FEASTOL and 
+                ( gap <= ABSTOL or (relgap is not None and 
+                relgap <= RELTOL) ) ) or 
+                ( pinfres is not None and pinfres <= FEASTOL ) or 
+                ( dinfres is not None and dinfres <= FEASTOL ) ):
+                break
 
         if show_progress:
             if iters == 0:
@@ -601,6 +1032,30 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
             print("%2d: % 8.4e % 8.4e % 4.0e% 7.0e% 7.0e% 7.0e" \
                 %(iters, pcost, dcost, gap, pres, dres, kappa/tau))
 
+        # The first iterate with a relative gap and residuals of at most
+        # WARMSTART_GAP is stored in warmstart, if it is a dictionary, 
+        # scaled to tau = 1 ('x', 'y', 's', 'z', 'kappa'), with the 
+        # average complementarity
+        #
+        #     mu = (s'*z + tau*kappa) / (tau**2 * (degree + 1)).
+        #
+        # It is a better centered starting point for a warm start than the
+        # solution (see conelp_solve()).
+        if warmstart is not None and 'x' not in warmstart and \
+            relgap is not None and max(relgap, pres, dres) <= WARMSTART_GAP:
+            warmstart['x'], warmstart['y'] = xnewcopy(x), ynewcopy(y)
+            xscal(1.0/tau, warmstart['x'])
+            yscal(1.0/tau, warmstart['y'])
+            warmstart['s'], warmstart['z'] = s / tau, z / tau
+            ind = dims['l'] + sum(dims['q'])
+            for m in dims['s']:
+                misc.symm(warmstart['s'], m, ind)
+                misc.symm(warmstart['z'], m, ind)
+                ind += m**2
+            warmstart['kappa'] = kappa / tau
+            warmstart['mu'] = (misc.sdot(s, z, dims) + tau*kappa) / \
+                (tau**2 * (dims['l'] + len(dims['q']) + sum(dims['s']) + 1))
+
         helpers.sp_create("isready", 200, {"hresx": hresx,
                                            "resx": resx,
                                            "hresy": hresy,
@@ -716,6 +1171,19 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
                 'residual as dual infeasibility certificate': dinfres,
                 'iterations': iters }
 
+        if TIMELIMIT is not None:
+            best = localmisc.iterate_save(best, {'gap': gap, 
+                'relative gap': relgap, 'primal objective': pcost, 
+                'dual objective': dcost, 'primal infeasibility': pres, 
+                'dual infeasibility': dres,
+                'residual as primal infeasibility certificate': pinfres,
+                'residual as dual infeasibility certificate': dinfres}, 
+                x, y, s, z, tau, xnewcopy, ynewcopy)
+            if timeout:
+                if show_progress:
+                    print("Terminated (time limit reached).")
+                return iterate_best(best, dims, iters, xscal, yscal)
+
 
         # Compute initial scaling W:
         # 
@@ -727,7 +1195,8 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
             #print "compute scaling: lmbda=\n",localmisc.strMat(lmbda)
             #print "s=\n", localmisc.strMat(s)
             #print "z=\n", localmisc.strMat(z)
-            W = localmisc.local_compute_scaling(s, z, lmbda, dims, mnl = 0)
+            W = localmisc.local_compute_scaling(s, z, lmbda, dims, mnl = 0,
+                ws = workspace, threads = SCALING_THREADS)
             helpers.sp_add_var("W", W)
             #     dg = sqrt( kappa / tau )
             #     dgi = sqrt( tau / kappa )
@@ -767,17 +1236,22 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
         try: 
             f3 = kktsolver(W)
             if iters == 0:
-                x1, y1 = xnewcopy(c), ynewcopy(b)
-                z1 = matrix(0.0, (cdim,1))
+                x1, y1 = xwork('x1'), ywork('y1')
+                z1 = work('z1', (cdim,1))
             xcopy(c, x1);  xscal(-1, x1)
             ycopy(b, y1)
             blas.copy(h, z1)
-            f3(x1, y1, z1)
-            #print "f3-result: x1=\n", x1
-            #print "f3-result: z1=\n", z1
-            xscal(dgi, x1)
-            yscal(dgi, y1)
-            blas.scal(dgi, z1)
+            # The system does not depend on the predictor right-hand side,
+            # so with the built-in solvers it is solved together with the
+            # first system of f6_no_ir() (see there).
+            pending = [batched]
+            if not batched:
+                f3(x1, y1, z1)
+                #print "f3-result: x1=\n", x1
+                #print "f3-result: z1=\n", z1
+                xscal(dgi, x1)
+                yscal(dgi, y1)
+                blas.scal(dgi, z1)
         except ArithmeticError:
             if iters == 0 and primalstart and dualstart: 
                 raise ValueError("Rank(A) < p or Rank([G; A]) < n")
@@ -825,12 +1299,15 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
         # On entry, x, y, z, tau, s, kappa contain bx, by, bz, btau, 
         # bkappa.  On exit, they contain ux, uy, uz, utau, ukappa.
 
-        # th = W^{-T} * h
-        if iters == 0:
-            th = matrix(0.0, (cdim,1))
-            helpers.sp_add_var("th", th)
-        blas.copy(h, th)
-        localmisc.scale(th, W, trans = 'T', inverse = 'I')
+        # th = W^{-T} * h.  With options['memory'] = 'low', th is not 
+        # stored but recomputed in wz3 by f6_no_ir().
+        if not LOWMEM:
+            if iters == 0:
+                th = work('th', (cdim,1))
+                helpers.sp_add_var("th", th)
+            blas.copy(h, th)
+            localmisc.scale(th, W, trans = 'T', inverse = 'I', ws = 
+                workspace)
         #print "th=\n", th
 
         def f6_no_ir(x, y, z, tau, s, kappa):
@@ -870,7 +1347,7 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
             helpers.sp_create("prescale", minor+5)
             helpers.sp_minor_push(minor+5)
             #misc.scale(ws3, W, trans = 'T')
-            localmisc.scale(ws3, W, trans = 'T')
+            localmisc.scale(ws3, W, trans = 'T', ws = workspace)
             helpers.sp_minor_pop()
             blas.axpy(ws3, z)
             blas.scal(-1.0, z)
@@ -878,7 +1355,23 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
             helpers.sp_create("f3-call", minor+20)
             # Solve system.
             helpers.sp_minor_push(minor+20)
-            f3(x, y, z)
+            if pending[0]:
+                # First solve of the iteration: x1, y1, z1 are solved 
+                # with the same call, as the second right-hand side.
+                pending[0] = False
+                X = work('X', (c.size[0], 2))
+                Y = work('Y', (b.size[0], 2))
+                Z = work('Z', (cdim, 2))
+                X[:, 0], Y[:, 0], Z[:, 0] = x, y, z
+                X[:, 1], Y[:, 1], Z[:, 1] = x1, y1, z1
+                localmisc.kkt_solve_many(f3, X, Y, Z)
+                x[:], y[:], z[:] = X[:, 0], Y[:, 0], Z[:, 0]
+                x1[:], y1[:], z1[:] = X[:, 1], Y[:, 1], Z[:, 1]
+                xscal(dgi, x1)
+                yscal(dgi, y1)
+                blas.scal(dgi, z1)
+            else:
+                f3(x, y, z)
             helpers.sp_minor_pop()
             helpers.sp_create("f3-return", minor+40)
 
@@ -897,8 +1390,15 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
             # tau[0] = tau[0] + kappa[0] / dgi = btau[0] - bkappa / tau
             tau[0] += kappa[0] / dgi
  
-            tau[0] = dgi * ( tau[0] + xdot(c,x) + ydot(b,y) + 
-                misc.sdot(th, z, dims) ) / (1.0 + misc.sdot(z1, z1, dims))
+            if LOWMEM:
+                blas.copy(h, wz3)
+                localmisc.scale(wz3, W, trans = 'T', inverse = 'I', ws = 
+                    workspace)
+                thz = misc.sdot(wz3, z, dims)
+            else:
+                thz = misc.sdot(th, z, dims)
+            tau[0] = dgi * ( tau[0] + xdot(c,x) + ydot(b,y) + thz ) / \
+                (1.0 + misc.sdot(z1, z1, dims))
             xaxpy(x1, x, alpha = tau[0])
             yaxpy(y1, y, alpha = tau[0])
             blas.axpy(z1, z, alpha = tau[0])
@@ -910,28 +1410,35 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
 
 
         # f6(x, y, z, tau, s, kappa) solves the same system as f6_no_ir, 
-        # but applies iterative refinement.
+        # but applies 'refinement' steps of iterative refinement.  If 
+        # options['refinement_tol'] is set, refinement stops when the 
+        # norm of the residual is at most REFTOL times the norm of the 
+        # right-hand side.  If the first solution is accurate enough, 
+        # the residual is not evaluated in the remaining calls with this
+        # factorization.
 
         if iters == 0:
             if refinement or DEBUG:
-                wx, wy = xnewcopy(c), ynewcopy(b)
-                wz, ws = matrix(0.0, (cdim, 1)), matrix(0.0, (cdim, 1))
-                wtau, wkappa = matrix(0.0), matrix(0.0)
+                wx, wy = xwork('wx'), ywork('wy')
+                wz, ws = work('wz', (cdim, 1)), work('ws', (cdim, 1))
+                wtau, wkappa = work('wtau', (1,1)), work('wkappa', (1,1))
                 helpers.sp_add_var("wx", wx)
                 helpers.sp_add_var("ws", ws)
                 helpers.sp_add_var("wz", wz)
             if refinement:
-                wx2, wy2 = xnewcopy(c), ynewcopy(b)
-                wz2, ws2 = matrix(0.0, (cdim, 1)), matrix(0.0, (cdim, 1))
-                wtau2, wkappa2 = matrix(0.0), matrix(0.0)
+                wx2, wy2 = xwork('wx2'), ywork('wy2')
+                wz2, ws2 = work('wz2', (cdim, 1)), work('ws2', (cdim, 1))
+                wtau2, wkappa2 = work('wtau2', (1,1)), work('wkappa2', 
+                    (1,1))
                 helpers.sp_add_var("wx2", wx2)
                 helpers.sp_add_var("ws2", ws2)
                 helpers.sp_add_var("wz2", wz2)
 
+        refine = [refinement]
         def f6(x, y, z, tau, s, kappa):
             minor = helpers.sp_minor_top()
             helpers.sp_create("startf6", minor+100)
-            if refinement or DEBUG:
+            if refine[0] or DEBUG:
                 xcopy(x, wx)
                 ycopy(y, wy)
                 blas.copy(z, wz)
@@ -942,7 +1449,9 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
             f6_no_ir(x, y, z, tau, s, kappa)
             helpers.sp_create("postf6_no_ir", minor+399)
 
-            for i in xrange(refinement):
+            if refine[0] and REFTOL is not None: 
+                bnrm = resnrm(wx, wy, wz, wtau, ws, wkappa)
+            for i in xrange(refine[0]):
                 xcopy(wx, wx2)
                 ycopy(wy, wy2)
                 blas.copy(wz, wz2)
@@ -954,6 +1463,10 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
                 res(x, y, z, tau, s, kappa, wx2, wy2, wz2, wtau2, ws2, 
                     wkappa2, W, dg, lmbda)
                 helpers.sp_minor_pop()
+                if REFTOL is not None and resnrm(wx2, wy2, wz2, wtau2, 
+                    ws2, wkappa2) <= REFTOL * bnrm:
+                    if i == 0: refine[0] = 0
+                    break
 
                 helpers.sp_create("refine_pref6_no_ir", minor+500)
                 helpers.sp_minor_push(minor+500)
@@ -987,7 +1500,7 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
         mu = blas.nrm2(lmbda)**2 / (1 + cdim_diag) 
         sigma = 0.0
         #print "** mu = %.4f" % mu
-        for i in [0,1]:
+        for i in xrange(2 + correctors):
             #print "--- loop [0,1] start ---"
 
             # Solve
@@ -1004,6 +1517,19 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
             #
             #     lmbda o (dz + ds) = -lmbda o lmbda + sigma*mu*e
             #     lmbdag * (dtau + dkappa) = - kappa * tau + sigma*mu
+            #
+            # For i > 1 (Gondzio correctors), the right-hand side of the 
+            # centering equation also includes the correction wcor for 
+            # the accepted direction and a trial step increased by 0.1, 
+            # added to the corrections accepted earlier.
+
+            if correctors and i == 1:
+                blas.copy(ws3, wcor)
+            if i > 1:
+                localmisc.local_centrality(dsu, dzu, lmbda, min(1.0, 
+                    step + 0.1), 0.1*sigma*mu, 10.0*sigma*mu, wt, dims,
+                    ws = workspace)
+                blas.axpy(wt, wcor, alpha = -1.0)
 
             
             # ds = -lmbdasq if i is 0
@@ -1024,9 +1550,10 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
             dkappa[0] = lmbdasq[-1]
             #print "dkappa[0] = %.17f" % dkappa[0]
 
-            if i == 1:
+            if i >= 1:
                 #print "scaling with sigma*mu (%.17f,%.17f)" % (sigma, mu)
-                blas.axpy(ws3, ds)
+                if i > 1: blas.axpy(wcor, ds)
+                else: blas.axpy(ws3, ds)
                 ds[:dims['l']] -= sigma*mu 
                 #print "** sigmaMu scaling indexes", indq[:-1]
                 ds[indq[:-1]] -= sigma*mu
@@ -1063,12 +1590,18 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
             # blocks in ds, dz.  The eigenvectors Qs, Qz are stored in 
             # dsk, dzk.  The eigenvalues are stored in sigs, sigz. 
 
+            # With correctors, the eigenvalue decomposition is computed 
+            # after the loop, for the accepted direction.
+
+            if correctors and i >= 1:
+                blas.copy(ds, dsc)
+                blas.copy(dz, dzc)
             helpers.sp_minor_push((1+i)*1000+900)
-            localmisc.scale2(lmbda, ds, dims)
-            localmisc.scale2(lmbda, dz, dims)
+            localmisc.scale2(lmbda, ds, dims, ws = workspace)
+            localmisc.scale2(lmbda, dz, dims, ws = workspace)
             helpers.sp_minor_pop()
             helpers.sp_create("post-scale2", (1+i)*1000+990)
-            if i == 0:
+            if i == 0 or correctors:
                 ts = misc.max_step(ds, dims)
                 tz = misc.max_step(dz, dims)
             else:
@@ -1088,8 +1621,27 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
                     step = min(1.0, STEP / t)
             if i == 0:
                 sigma = (1.0 - step)**EXPON
+
+            # A corrector is accepted if it increases the step by 1%.
+            if correctors and i >= 1:
+                if i > 1 and step < 1.01 * stepa:
+                    xcopy(dxa, dx);  ycopy(dya, dy)
+                    blas.copy(dsa, ds);  blas.copy(dza, dz)
+                    dtau[0], dkappa[0], tt, tk, step = dtaua, dkappaa, \
+                        tta, tka, stepa
+                    break
+                xcopy(dx, dxa);  ycopy(dy, dya)
+                blas.copy(ds, dsa);  blas.copy(dz, dza)
+                blas.copy(dsc, dsu);  blas.copy(dzc, dzu)
+                dtaua, dkappaa, tta, tka, stepa = dtau[0], dkappa[0], \
+                    tt, tk, step
+                if step == 1.0: break
             #print "--- loop [0,1] end ---"
 
+        if correctors:
+            misc.max_step(ds, dims, sigma = sigs)
+            misc.max_step(dz, dims, sigma = sigz)
+
         #print "** tau = %.17f, kappa = %.17f" % (tau, kappa)
         #print "** step = %.17f, sigma = %.17f" % (step, sigma)
         #print "-- post loop lmbda=\n", lmbda, "ds=\n", ds, "dz=\n", dz
@@ -1133,8 +1685,8 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
         #     diag(lmbda_k)^{1/2} * Qz * diag(lmbda_k)^{1/2} 
         #
         helpers.sp_minor_push(7500)
-        localmisc.scale2(lmbda, ds, dims, inverse = 'I')
-        localmisc.scale2(lmbda, dz, dims, inverse = 'I')
+        localmisc.scale2(lmbda, ds, dims, inverse = 'I', ws = workspace)
+        localmisc.scale2(lmbda, dz, dims, inverse = 'I', ws = workspace)
         helpers.sp_minor_pop()
         #print "scale2 ds=\n", localmisc.strMat(ds), "\ndz=\n", localmisc.strMat(dz)
 
@@ -1169,7 +1721,11 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
 
         helpers.sp_create("pre-update-scaling", 7700)
 
-        misc.update_scaling(W, lmbda, ds, dz)
+        if SCALING_THREADS > 1:
+            localmisc.local_update_scaling(W, lmbda, ds, dz, ws = workspace,
+                threads = SCALING_THREADS)
+        else:
+            misc.update_scaling(W, lmbda, ds, dz)
 
         helpers.sp_create("post-update-scaling", 7800)
 
@@ -1202,7 +1758,7 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
                 incy = m+1)
             ind += m
             ind2 += m*m
-        localmisc.scale(s, W, trans = 'T')
+        localmisc.scale(s, W, trans = 'T', ws = workspace)
         #print "unscaled s=\n", localmisc.strMat(s)
 
         blas.copy(lmbda, z, n = dims['l'] + sum(dims['q']))
@@ -1214,153 +1770,915 @@ def conelp(c, G, h, dims = None, A = None, b = None, primalstart = None,
                     incy = m+1)
             ind += m
             ind2 += m*m
-        localmisc.scale(z, W, inverse = 'I')
+        localmisc.scale(z, W, inverse = 'I', ws = workspace)
         #print "unscaled z=\n", localmisc.strMat(z)
 
         kappa, tau = lmbda[-1]/dgi, lmbda[-1]*dgi
         gap = ( blas.nrm2(lmbda, n = lmbda.size[0]-1) / tau )**2
+
+        # The right-hand sides of the linear equations in the Newton 
+        # system are (1-sigma)*(rx, ry, rz), so the residuals at the new 
+        # iterate are 
+        #
+        #     (rx, ry, rz) := (1 - step*(1-sigma)) * (rx, ry, rz)
+        #
+        # up to the error in the solution of the KKT system, and 
+        #
+        #     (hrx, hry, hrz) := (rx, ry, rz) + (c, b, h) * tau.
+
+        if RESFREQ > 1:
+            a = 1.0 - step * (1.0 - sigma)
+            xcopy(rx, hrx);  xscal(a, hrx);  xaxpy(c, hrx, alpha = tau)
+            ycopy(ry, hry);  yscal(a, hry);  yaxpy(b, hry, alpha = tau)
+            blas.copy(rz, hrz);  blas.scal(a, hrz);  blas.axpy(h, hrz, 
+                alpha = tau)
         helpers.sp_create("end-of-loop", 8000)
         #print " ** kappa = %.10f, tau = %.10f, gap = %.10f" % (kappa, tau, gap)
 
 
-def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
-    initvals = None, kktsolver = None, xnewcopy = None, xdot = None,
-    xaxpy = None, xscal = None, ynewcopy = None, ydot = None, yaxpy = None,
-    yscal = None):
-    """
+def small_factor(K, ipiv, H, G, A, di, Gs):
     """
-    import math
-    from cvxopt import base, blas, misc
-    from cvxopt.base import matrix, spmatrix
+    Factors the KKT matrix of conelp_small() and coneqp_small(),
 
-    STEP = 0.99
-    EXPON = 3
+        K = [ H + G'*D^{-2}*G   A' ]
+            [ A                 0  ],
 
-    try: DEBUG = options['debug']
-    except KeyError: DEBUG = False
+    with D = diag(di)^{-1}, in place, with an LDL factorization.  H is 
+    None for an LP.  On exit, Gs is D^{-1}*G.  
 
-    # Use Mehrotra correction or not.
-    try: correction = options['use_correction']
-    except KeyError: correction = True
+    Raises ArithmeticError if K is singular.
+    """
 
+    from cvxopt import blas, lapack
 
-    try: MAXITERS = options['maxiters']
-    except KeyError: MAXITERS = 100
-    else: 
-        if type(MAXITERS) is not int or MAXITERS < 1: 
-            raise ValueError("options['maxiters'] must be a positive "\
-                "integer")
+    m, n = G.size
 
-    try: ABSTOL = options['abstol']
-    except KeyError: ABSTOL = 1e-7
-    else: 
-        if type(ABSTOL) is not float and type(ABSTOL) is not int: 
-            raise ValueError("options['abstol'] must be a scalar")
+    # Gs := diag(di) * G 
+    blas.copy(G, Gs)
+    for k in xrange(n):
+        blas.tbmv(di, Gs, n = m, k = 0, ldA = 1, offsetx = k*m)
 
-    try: RELTOL = options['reltol']
-    except KeyError: RELTOL = 1e-6
-    else: 
-        if type(RELTOL) is not float and type(RELTOL) is not int: 
-            raise ValueError("options['reltol'] must be a scalar")
+    if H is None: K[:n, :n] = 0.0
+    else: K[:n, :n] = H
+    K[n:, :] = 0.0
+    if A.size[0]: K[n:, :n] = A
+    blas.syrk(Gs, K, trans = 'T', beta = 1.0)
+    lapack.sytrf(K, ipiv)
 
-    if RELTOL <= 0.0 and ABSTOL <= 0.0 :
-        raise ValueError("at least one of options['reltol'] and " \
-            "options['abstol'] must be positive")
 
-    try: FEASTOL = options['feastol']
-    except KeyError: FEASTOL = 1e-7
-    else: 
-        if (type(FEASTOL) is not float and type(FEASTOL) is not int) or \
-            FEASTOL <= 0.0:
-            raise ValueError("options['feastol'] must be a positive "\
-                "scalar")
+def small_solve(K, ipiv, Gs, di, u, x, y, z):
+    """
+    Solves 
 
-    try: show_progress = options['show_progress']
-    except KeyError: show_progress = True
+        [ H  A'  G'    ] [ ux        ]   [ bx ]
+        [ A  0   0     ] [ uy        ] = [ by ]
+        [ G  0  -D*D   ] [ D^{-1}*uz ]   [ bz ]
 
+    with the factorization K, ipiv and Gs of small_factor().  On entry, 
+    x, y, z contain bx, by, bz.  On exit, they contain ux, uy, uz.  u is
+    a work vector of length n + p.
 
-    if kktsolver is None: 
-        if dims and (dims['q'] or dims['s']):  
-            kktsolver = 'chol'            
-        else:
-            kktsolver = 'chol2'            
-    defaultsolvers = ('ldl', 'ldl2', 'chol', 'chol2')
-    if type(kktsolver) is str and kktsolver not in defaultsolvers:
-        raise ValueError("'%s' is not a valid value for kktsolver" \
-            %kktsolver)
+    The system is reduced to 
 
+        K * [ ux; uy ] = [ bx + Gs' * D^{-1} * bz; by ],
+        uz = Gs * ux - D^{-1} * bz.
+    """
 
-    # Argument error checking depends on level of customization.
-    customkkt = type(kktsolver) is not str
-    matrixP = type(P) in (matrix, spmatrix)
-    matrixG = type(G) in (matrix, spmatrix)
-    matrixA = type(A) in (matrix, spmatrix)
-    if (not matrixP or (not matrixG and G is not None) or 
-        (not matrixA and A is not None)) and not customkkt:
-        raise ValueError("use of function valued P, G, A requires a "\
-            "user-provided kktsolver")
-    customx = (xnewcopy != None or xdot != None or xaxpy != None or 
-        xscal != None) 
-    if customx and (matrixP or matrixG or matrixA or not customkkt):
-        raise ValueError("use of non-vector type for x requires "\
-            "function valued P, G, A and user-provided kktsolver")
-    customy = (ynewcopy != None or ydot != None or yaxpy != None or 
-        yscal != None) 
-    if customy and (matrixA or not customkkt):
-        raise ValueError("use of non vector type for y requires "\
-            "function valued A and user-provided kktsolver")
+    from cvxopt import blas, lapack
 
+    m, n = Gs.size
 
-    if not customx and (type(q) is not matrix or q.typecode != 'd' or
-        q.size[1] != 1):
-        raise TypeError("'q' must be a 'd' matrix with one column")
+    # z := D^{-1} * bz
+    blas.tbmv(di, z, n = m, k = 0, ldA = 1)
 
-    if matrixP:
-        if P.typecode != 'd' or P.size != (q.size[0], q.size[0]):
-            raise TypeError("'P' must be a 'd' matrix of size (%d, %d)"\
-                %(q.size[0], q.size[0]))
-        def fP(x, y, alpha = 1.0, beta = 0.0):
-            base.symv(P, x, y, alpha = alpha, beta = beta)
-    else:
-        fP = P
+    # u := [ bx + Gs'*z; by ]
+    blas.copy(x, u)
+    blas.gemv(Gs, z, u, trans = 'T', beta = 1.0)
+    blas.copy(y, u, offsety = n)
+    lapack.sytrs(K, ipiv, u)
+    blas.copy(u, x, n = n)
+    blas.copy(u, y, offsetx = n)
 
+    # z := Gs*ux - z
+    blas.gemv(Gs, x, z, beta = -1.0)
 
-    if h is None: h = matrix(0.0, (0,1))
-    if type(h) is not matrix or h.typecode != 'd' or h.size[1] != 1:
-        raise TypeError("'h' must be a 'd' matrix with one column")
 
-    if not dims: dims = {'l': h.size[0], 'q': [], 's': []}
-    if type(dims['l']) is not int or dims['l'] < 0: 
-        raise TypeError("'dims['l']' must be a nonnegative integer")
-    if [ k for k in dims['q'] if type(k) is not int or k < 1 ]:
-        raise TypeError("'dims['q']' must be a list of positive integers")
-    if [ k for k in dims['s'] if type(k) is not int or k < 0 ]:
-        raise TypeError("'dims['s']' must be a list of nonnegative " \
-            "integers")
+def small_stats(gap, pcost, dcost, pres, dres):
+    """
+    Returns the statistics of an iterate of conelp_small() or 
+    coneqp_small() as a dictionary with the keys 'gap', 'relative gap', 
+    'primal objective', 'dual objective', 'primal infeasibility' and 
+    'dual infeasibility' of the solutions of conelp() and coneqp().
+    """
 
-    try: refinement = options['refinement']
-    except KeyError: 
-        if dims['q'] or dims['s']: refinement = 1
-        else: refinement = 0
-    else:
-        if type(refinement) is not int or refinement < 0: 
-            raise ValueError("options['refinement'] must be a "\
-                "nonnegative integer")
+    if pcost < 0.0:
+        relgap = gap / -pcost
+    elif dcost > 0.0:
+        relgap = gap / dcost
+    else: 
+        relgap = None
+    return {'gap': gap, 'relative gap': relgap, 'primal objective': pcost,
+        'dual objective': dcost, 'primal infeasibility': pres, 
+        'dual infeasibility': dres}
 
 
-    cdim = dims['l'] + sum(dims['q']) + sum([ k**2 for k in dims['s'] ])
-    if h.size[0] != cdim:
-        raise TypeError("'h' must be a 'd' matrix of size (%d,1)" %cdim)
+def small_converged(stats, ABSTOL, RELTOL, FEASTOL):
+    """
+    Returns True if an iterate with the statistics stats (see 
+    small_stats()) satisfies the stopping criteria of conelp() and 
+    coneqp().
+    """
 
-    # Data for kth 'q' constraint are found in rows indq[k]:indq[k+1] of G.
-    indq = [ dims['l'] ]  
-    for k in dims['q']:  indq = indq + [ indq[-1] + k ] 
+    relgap = stats['relative gap']
+    return stats['primal infeasibility'] <= FEASTOL and \
+        stats['dual infeasibility'] <= FEASTOL and (stats['gap'] <= ABSTOL
+        or (relgap is not None and relgap <= RELTOL))
 
-    # Data for kth 's' constraint are found in rows inds[k]:inds[k+1] of G.
-    inds = [ indq[-1] ]
-    for k in dims['s']:  inds = inds + [ inds[-1] + k**2 ] 
 
-    if G is None:
+def small_result(x, y, s, z, status, stats, iters):
+    """
+    Returns the solution of conelp_small() or coneqp_small():  a 
+    dictionary with x, y, s, z, status, the entries of stats, the 
+    primal and dual slacks min(s) and min(z) (None if s or z is None) 
+    and the number of iterations iters.
+    """
+
+    sol = dict(stats)
+    sol.update({'x': x, 'y': y, 's': s, 'z': z, 'status': status, 
+        'primal slack': None, 'dual slack': None, 'iterations': iters})
+    if s is not None: sol['primal slack'] = min(s)
+    if z is not None: sol['dual slack'] = min(z)
+    return sol
+
+
+def small_step(lmbda, ds, dz, i, t = 0.0, STEP = 0.99):
+    """
+    Returns the step to the boundary of conelp_small() and 
+    coneqp_small() for the search direction ds, dz in the current 
+    scaling:  the largest step <= 1 for the predictor (i = 0), and 
+    STEP times that for the corrector (i = 1).  On exit, ds and dz are 
+    lmbda o\ ds and lmbda o\ dz.  t is the largest of -dtau/lmbdag and 
+    -dkappa/lmbdag for conelp_small().
+    """
+
+    from cvxopt import blas
+
+    m = lmbda.size[0]
+    blas.tbsv(lmbda, ds, n = m, k = 0, ldA = 1)
+    blas.tbsv(lmbda, dz, n = m, k = 0, ldA = 1)
+    t = max([ 0.0, -min(ds), -min(dz), t ])
+    if t == 0.0: return 1.0
+    elif i == 0: return min(1.0, 1.0 / t)
+    else: return min(1.0, STEP / t)
+
+
+def small_update(step, d, lmbda, s, z, ds, dz):
+    """
+    Updates the scaling d, lmbda and the iterates s, z of conelp_small()
+    and coneqp_small() with the step to ds, dz (as returned by 
+    small_step()), and returns di = d.^{-1}:
+
+        ds := lmbda o (e + step*ds),  dz := lmbda o (e + step*dz)
+        d := d .* sqrt(ds ./ dz),  lmbda := sqrt(ds .* dz)
+        s := d .* lmbda,  z := di .* lmbda.
+    """
+
+    from cvxopt import base, blas
+
+    m = lmbda.size[0]
+    blas.scal(step, ds)
+    blas.scal(step, dz)
+    ds += 1.0
+    dz += 1.0
+    blas.tbmv(lmbda, ds, n = m, k = 0, ldA = 1)
+    blas.tbmv(lmbda, dz, n = m, k = 0, ldA = 1)
+    blas.tbmv(base.sqrt(base.div(ds, dz)), d, n = m, k = 0, ldA = 1)
+    di = d**-1
+    lmbda[:] = base.sqrt(base.mul(ds, dz))
+    blas.copy(lmbda, s)
+    blas.tbmv(d, s, n = m, k = 0, ldA = 1)
+    blas.copy(lmbda, z)
+    blas.tbmv(di, z, n = m, k = 0, ldA = 1)
+    return di
+
+
+def conelp_small(c, G, h, A, b, MAXITERS = 100, ABSTOL = 1e-7, 
+    RELTOL = 1e-6, FEASTOL = 1e-7, show_progress = True, TIMELIMIT = None,
+    starttime = None):
+    """
+    Solves the LP
+
+        minimize    c'*x
+        subject to  G*x + s = h
+                    A*x = b
+                    s >= 0
+
+    with the algorithm of conelp(), for a small number of variables.  
+    conelp() calls it for problems with 'l' constraints only (see 
+    SMALL_SIZE), with the options it has already checked and the time 
+    starttime of the call.
+
+    The scaling is the vector d (W = diag(d)) and the KKT systems are 
+    solved with small_factor() and small_solve(), with one dense LDL 
+    factorization of order n + p per iteration.  No functions are 
+    created in the iteration.  The residuals are computed from scratch 
+    in every iteration, and there is no iterative refinement.
+    """
+
+    import math
+    from cvxopt import base, blas
+    from cvxopt.base import matrix
+
+    EXPON = 3
+    STEP = 0.99
+
+    n, m, p = c.size[0], h.size[0], b.size[0]
+    if p > n or p + m < n:
+        raise ValueError("Rank(A) < p or Rank([G; A]) < n")
+    G, A = matrix(G), matrix(A)
+
+    # Work vectors.
+    Gs, K = matrix(0.0, (m, n)), matrix(0.0, (n+p, n+p))
+    ipiv, u = matrix(0, (n+p, 1)), matrix(0.0, (n+p, 1))
+    x, dx, x1 = matrix(0.0, (n, 1)), matrix(0.0, (n, 1)), matrix(0.0, 
+        (n, 1))
+    rx, hrx = matrix(0.0, (n, 1)), matrix(0.0, (n, 1))
+    y, dy, y1 = matrix(0.0, (p, 1)), matrix(0.0, (p, 1)), matrix(0.0, 
+        (p, 1))
+    ry, hry = matrix(0.0, (p, 1)), matrix(0.0, (p, 1))
+    s, ds, z, dz = [ matrix(0.0, (m, 1)) for k in xrange(4) ]
+    z1, rz, hrz, th = [ matrix(0.0, (m, 1)) for k in xrange(4) ]
+    lmbda, lmbdasq, ws3, wz = [ matrix(0.0, (m, 1)) for k in xrange(4) ]
+
+    resx0 = max(1.0, blas.nrm2(c))
+    resy0 = max(1.0, blas.nrm2(b))
+    resz0 = max(1.0, blas.nrm2(h))
+
+    # Initial points, as in conelp():  (x, s) from the KKT system with 
+    # right-hand side (0, b, h) and (y, z) from the right-hand side 
+    # (-c, 0, 0), with W = I.
+    d, di = matrix(1.0, (m, 1)), matrix(1.0, (m, 1))
+    try: small_factor(K, ipiv, None, G, A, di, Gs)
+    except ArithmeticError: 
+        raise ValueError("Rank(A) < p or Rank([G; A]) < n")
+    blas.copy(b, dy)
+    blas.copy(h, s)
+    small_solve(K, ipiv, Gs, di, u, x, dy, s)
+    blas.scal(-1.0, s)
+    blas.copy(c, dx)
+    blas.scal(-1.0, dx)
+    small_solve(K, ipiv, Gs, di, u, dx, y, z)
+
+    ts, tz = -min(s), -min(z)
+    nrms, nrmz = blas.nrm2(s), blas.nrm2(z)
+
+    gap = blas.dot(s, z)
+    pcost = blas.dot(c, x)
+    dcost = -blas.dot(b, y) - blas.dot(h, z)
+    stats = small_stats(gap, pcost, dcost, None, None)
+    relgap = stats['relative gap']
+
+    if ts <= 0 and tz <= 0 and (gap <= ABSTOL or ( relgap is not None
+        and relgap <= RELTOL )):
+
+        # The initial points happen to be feasible and optimal.  
+
+        # rx = A'*y + G'*z + c
+        blas.copy(c, rx)
+        blas.gemv(G, z, rx, beta = 1.0, trans = 'T')
+        blas.gemv(A, y, rx, beta = 1.0, trans = 'T')
+
+        # ry = b - A*x 
+        blas.copy(b, ry)
+        blas.gemv(A, x, ry, alpha = -1.0, beta = 1.0)
+
+        # rz = s + G*x - h 
+        blas.copy(s, rz)
+        blas.gemv(G, x, rz, beta = 1.0)
+        blas.axpy(h, rz, alpha = -1.0)
+
+        stats['primal infeasibility'] = max(blas.nrm2(ry)/resy0, 
+            blas.nrm2(rz)/resz0)
+        stats['dual infeasibility'] = blas.nrm2(rx)/resx0
+        stats['residual as primal infeasibility certificate'] = None
+        stats['residual as dual infeasibility certificate'] = None
+        if show_progress:
+            print("Optimal solution found.")
+        return small_result(x, y, s, z, 'optimal', stats, 0)
+
+    if ts >= -1e-8 * max(nrms, 1.0): s += 1.0 + ts
+    if tz >= -1e-8 * max(nrmz, 1.0): z += 1.0 + tz
+
+    tau, kappa = 1.0, 1.0
+    gap = blas.dot(s, z) 
+
+    best = None
+    for iters in xrange(MAXITERS+1):
+
+        # hrx = -A'*y - G'*z,  rx = hrx - c*tau 
+        blas.gemv(G, z, hrx, alpha = -1.0, trans = 'T') 
+        blas.gemv(A, y, hrx, alpha = -1.0, beta = 1.0, trans = 'T') 
+        hresx = blas.nrm2(hrx)
+        blas.copy(hrx, rx)
+        blas.axpy(c, rx, alpha = -tau)
+        resx = blas.nrm2(rx) / tau
+
+        # hry = A*x,  ry = hry - b*tau
+        blas.gemv(A, x, hry)
+        hresy = blas.nrm2(hry)
+        blas.copy(hry, ry)
+        blas.axpy(b, ry, alpha = -tau)
+        resy = blas.nrm2(ry) / tau
+
+        # hrz = s + G*x,  rz = hrz - h*tau
+        blas.copy(s, hrz)
+        blas.gemv(G, x, hrz, beta = 1.0)
+        hresz = blas.nrm2(hrz)
+        blas.copy(hrz, rz)
+        blas.axpy(h, rz, alpha = -tau)
+        resz = blas.nrm2(rz) / tau
+
+        # rt = kappa + c'*x + b'*y + h'*z 
+        cx, by, hz = blas.dot(c, x), blas.dot(b, y), blas.dot(h, z)
+        rt = kappa + cx + by + hz 
+
+        # Statistics for stopping criteria.
+        pcost, dcost = cx / tau, -(by + hz) / tau        
+        pres = max(resy/resy0, resz/resz0)
+        dres = resx/resx0
+        if hz + by < 0.0:  
+           pinfres =  hresx / resx0 / (-hz - by) 
+        else:
+           pinfres =  None
+        if cx < 0.0: 
+           dinfres = max(hresy / resy0, hresz/resz0) / (-cx) 
+        else:
+           dinfres = None
+        stats = small_stats(gap, pcost, dcost, pres, dres)
+        stats['residual as primal infeasibility certificate'] = pinfres
+        stats['residual as dual infeasibility certificate'] = dinfres
+
+        if show_progress:
+            if iters == 0:
+                print("% 10s% 12s% 10s% 8s% 7s % 5s" %("pcost", "dcost",
+                    "gap", "pres", "dres", "k/t"))
+            print("%2d: % 8.4e % 8.4e % 4.0e% 7.0e% 7.0e% 7.0e" \
+                %(iters, pcost, dcost, gap, pres, dres, kappa/tau))
+
+        if small_converged(stats, ABSTOL, RELTOL, FEASTOL) or \
+            iters == MAXITERS:
+            blas.scal(1.0/tau, x)
+            blas.scal(1.0/tau, y)
+            blas.scal(1.0/tau, s)
+            blas.scal(1.0/tau, z)
+            if iters == MAXITERS:
+                if show_progress:
+                    print("Terminated (maximum number of iterations "\
+                        "reached).")
+                status = 'unknown'
+            else:
+                if show_progress:
+                    print("Optimal solution found.")
+                status = 'optimal'
+                stats['residual as primal infeasibility certificate'] = \
+                    None
+                stats['residual as dual infeasibility certificate'] = None
+            return small_result(x, y, s, z, status, stats, iters)
+
+        elif pinfres is not None and pinfres <= FEASTOL:
+            blas.scal(1.0/(-hz - by), y)
+            blas.scal(1.0/(-hz - by), z)
+            if show_progress:
+                print("Certificate of primal infeasibility found.")
+            stats = {'gap': None, 'relative gap': None, 
+                'primal objective': None, 'dual objective': 1.0, 
+                'primal infeasibility': None, 'dual infeasibility': None,
+                'residual as primal infeasibility certificate': pinfres,
+                'residual as dual infeasibility certificate': None}
+            return small_result(None, y, None, z, 'primal infeasible', 
+                stats, iters)
+
+        elif dinfres is not None and dinfres <= FEASTOL:
+            blas.scal(1.0/(-cx), x)
+            blas.scal(1.0/(-cx), s)
+            if show_progress:
+                print("Certificate of dual infeasibility found.")
+            stats = {'gap': None, 'relative gap': None, 
+                'primal objective': -1.0, 'dual objective': None, 
+                'primal infeasibility': None, 'dual infeasibility': None,
+                'residual as primal infeasibility certificate': None,
+                'residual as dual infeasibility certificate': dinfres}
+            return small_result(x, None, s, None, 'dual infeasible', 
+                stats, iters)
+
+        # Best iterate and time limit, as in conelp().
+        if TIMELIMIT is not None:
+            best = localmisc.iterate_save(best, dict(stats), x, y, s, z, 
+                tau)
+            if localmisc.time_out(starttime, TIMELIMIT, iters):
+                if show_progress:
+                    print("Terminated (time limit reached).")
+                return iterate_best(best, {'l': s.size[0], 'q': [], 
+                    's': []}, iters)
+
+        # Initial scaling:  d = sqrt(s ./ z), lmbda = sqrt(s .* z) and
+        # dg = sqrt(kappa / tau), lmbdag = sqrt(tau * kappa).
+        if iters == 0:
+            d = base.sqrt(base.div(s, z))
+            di = d**-1
+            lmbda = base.sqrt(base.mul(s, z))
+            dg = math.sqrt( kappa / tau )
+            dgi = math.sqrt( tau / kappa )
+            lmbdag = math.sqrt( tau * kappa )
+
+        # lmbdasq := lmbda o lmbda 
+        blas.copy(lmbda, lmbdasq)
+        blas.tbmv(lmbda, lmbdasq, n = m, k = 0, ldA = 1)
+
+        # Factor the KKT matrix and solve
+        #
+        #     [ 0   A'  G'    ] [ x1        ]          [ c ]
+        #     [-A   0   0     ]*[ y1        ] = -dgi * [ b ],
+        #     [-G   0   W'*W  ] [ W^{-1}*z1 ]          [ h ]
+        #
+        # as in conelp().
+        try: small_factor(K, ipiv, None, G, A, di, Gs)
+        except ArithmeticError:
+            blas.scal(1.0/tau, x)
+            blas.scal(1.0/tau, y)
+            blas.scal(1.0/tau, s)
+            blas.scal(1.0/tau, z)
+            if show_progress:
+                print("Terminated (singular KKT matrix).")
+            return small_result(x, y, s, z, 'unknown', stats, iters)
+        blas.copy(c, x1)
+        blas.scal(-1.0, x1)
+        blas.copy(b, y1)
+        blas.copy(h, z1)
+        small_solve(K, ipiv, Gs, di, u, x1, y1, z1)
+        blas.scal(dgi, x1)
+        blas.scal(dgi, y1)
+        blas.scal(dgi, z1)
+        nrmz1 = blas.dot(z1, z1)
+
+        # th = W^{-T} * h 
+        blas.copy(h, th)
+        blas.tbmv(di, th, n = m, k = 0, ldA = 1)
+
+        mu = (blas.dot(lmbda, lmbda) + lmbdag**2) / (1 + m) 
+        sigma = 0.0
+        for i in xrange(2):
+
+            # Solve the Newton equations of conelp() for 
+            #
+            #     ds = lmbdasq (i = 0)
+            #        = lmbdasq + dsa o dza - sigma*mu*e (i = 1)
+            #     dkappa = lmbdag**2 (i = 0)
+            #            = lmbdag**2 + dkappaa*dtaua - sigma*mu (i = 1)
+            #     (dx, dy, dz, dtau) = (1-sigma)*(rx, ry, rz, rt),
+            #
+            # with the steps of f6_no_ir() in conelp().
+
+            blas.copy(lmbdasq, ds)
+            dkappa = lmbdag**2
+            if i == 1:
+                blas.axpy(ws3, ds)
+                ds -= sigma*mu
+                dkappa += wkappa3 - sigma*mu
+            blas.copy(rx, dx);  blas.scal(1.0 - sigma, dx)
+            blas.copy(ry, dy);  blas.scal(1.0 - sigma, dy)
+            blas.copy(rz, dz);  blas.scal(1.0 - sigma, dz)
+            dtau = (1.0 - sigma) * rt 
+
+            # dy := -dy, ds := -lmbda o\ ds, dz := -(dz + W'*ds)
+            blas.scal(-1.0, dy)
+            blas.tbsv(lmbda, ds, n = m, k = 0, ldA = 1)
+            blas.scal(-1.0, ds)
+            blas.copy(ds, wz)
+            blas.tbmv(d, wz, n = m, k = 0, ldA = 1)
+            blas.axpy(wz, dz)
+            blas.scal(-1.0, dz)
+
+            small_solve(K, ipiv, Gs, di, u, dx, dy, dz)
+
+            dkappa = -dkappa / lmbdag
+            dtau += dkappa / dgi
+            dtau = dgi * (dtau + blas.dot(c, dx) + blas.dot(b, dy) + 
+                blas.dot(th, dz)) / (1.0 + nrmz1)
+            blas.axpy(x1, dx, alpha = dtau)
+            blas.axpy(y1, dy, alpha = dtau)
+            blas.axpy(z1, dz, alpha = dtau)
+            blas.axpy(dz, ds, alpha = -1.0)
+            dkappa -= dtau
+
+            # Save ds o dz and dkappa * dtau for Mehrotra correction.
+            if i == 0:
+                blas.copy(ds, ws3)
+                blas.tbmv(dz, ws3, n = m, k = 0, ldA = 1)
+                wkappa3 = dtau * dkappa
+
+            # Maximum step to boundary, in the current scaling.
+            tt = -dtau / lmbdag
+            tk = -dkappa / lmbdag
+            step = small_step(lmbda, ds, dz, i, max(tt, tk), STEP)
+            if i == 0:
+                sigma = (1.0 - step)**EXPON
+
+        # Update x, y.
+        blas.axpy(dx, x, alpha = step)
+        blas.axpy(dy, y, alpha = step)
+
+        # Update the scaling and s, z (see small_update()), and 
+        #
+        #     dg := dg * sqrt( (1 - step*tk) / (1 - step*tt) )
+        #     lmbdag := lmbdag * sqrt((1 - step*tt) * (1 - step*tk)).
+        di = small_update(step, d, lmbda, s, z, ds, dz)
+        dg *= math.sqrt(1.0 - step*tk) / math.sqrt(1.0 - step*tt) 
+        dgi = 1.0 / dg
+        lmbdag *= math.sqrt(1.0 - step*tt) * math.sqrt(1.0 - step*tk) 
+
+        # Unscale tau, kappa.
+        kappa, tau = lmbdag/dgi, lmbdag*dgi
+        gap = ( blas.nrm2(lmbda) / tau )**2
+
+
+def cone_interior(x, dims, delta):
+    """
+    Moves x into the interior of the cone:  each 'l' entry, and the 
+    smallest eigenvalue of each 'q' cone and 's' block, is raised to at 
+    least delta by adding a multiple of the identity element of the cone.
+    """
+
+    from cvxopt import misc
+
+    ind = dims['l']
+    for i in xrange(ind): 
+        if x[i] < delta: x[i] = delta
+    for m in dims['q']:
+        t = misc.max_step(x[ind : ind+m], {'l': 0, 'q': [m], 's': []})
+        if t + delta > 0.0: x[ind] += t + delta
+        ind += m
+    for m in dims['s']:
+        t = misc.max_step(x[ind : ind+m**2], {'l': 0, 'q': [], 's': [m]})
+        if t + delta > 0.0: x[ind : ind+m**2 : m+1] += t + delta
+        ind += m**2
+
+
+def conelp_new(c, G, h, dims = None, A = None, b = None, kktsolver = None):
+    """
+    Returns the cone LP 
+
+        minimize    c'*x
+        subject to  G*x + s = h
+                    A*x = b
+                    s >= 0 
+
+    as a problem that can be extended with constraints by conelp_add() 
+    and solved by conelp_solve(), for cutting-plane methods.  
+
+    The problem is a dictionary with the data 'c', 'A', 'b', 'kktsolver' 
+    and the current cone dimensions 'dims'.  The rows of G and h are 
+    stored in 'G' and 'h', as lists of blocks for the 'l', 'q' and 's' 
+    rows, and only assembled when the problem is solved.  'sol' is the 
+    solution of the last solve and 'start' the starting point it stored
+    for the next one.
+
+    All of G is stored as a dense matrix if G is a matrix, and as an 
+    spmatrix otherwise.  The arguments are checked as in conelp().
+    """
+
+    from cvxopt import matrix, spmatrix
+
+    if type(c) is not matrix or c.typecode != 'd' or c.size[1] != 1:
+        raise TypeError("'c' must be a 'd' matrix with one column")
+    n = c.size[0]
+    if A is None: A = spmatrix([], [], [], (0, n))
+    if type(A) not in (matrix, spmatrix) or A.typecode != 'd' or \
+        A.size[1] != n:
+        raise TypeError("'A' must be a 'd' matrix with %d columns" %n)
+    if b is None: b = matrix(0.0, (0,1))
+    if type(b) is not matrix or b.typecode != 'd' or b.size != \
+        (A.size[0], 1):
+        raise TypeError("'b' must be a 'd' matrix of size (%d,1)" 
+            %A.size[0])
+    if type(G) not in (matrix, spmatrix):
+        raise TypeError("'G' must be a 'd' matrix")
+
+    P = {'c': c, 'A': A, 'b': b, 'kktsolver': kktsolver, 
+        'sparse': type(G) is spmatrix, 'dims': {'l': 0, 'q': [], 's': []},
+        'G': {'l': [], 'q': [], 's': []}, 'h': {'l': [], 'q': [], 's': []},
+        'sol': None, 'start': None}
+    conelp_add(P, G, h, dims)
+    return P
+
+
+def conelp_add(P, G, h, dims = None):
+    """
+    Adds the constraints G*x + s = h, s >= 0 with cone dimensions dims
+    to the problem P returned by conelp_new().  The 'l' rows follow the
+    'l' rows of P, and the 'q' and 's' cones follow the 'q' and 's' 
+    cones of P.  Only the new rows are checked and copied.
+    """
+
+    from cvxopt import base, matrix, spmatrix
+
+    n = P['c'].size[0]
+    if type(h) is not matrix or h.typecode != 'd' or h.size[1] != 1:
+        raise TypeError("'h' must be a 'd' matrix with 1 column")
+    if not dims: dims = {'l': h.size[0], 'q': [], 's': []}
+    if type(dims['l']) is not int or dims['l'] < 0: 
+        raise TypeError("'dims['l']' must be a nonnegative integer")
+    if [ k for k in dims['q'] if type(k) is not int or k < 1 ]:
+        raise TypeError("'dims['q']' must be a list of positive integers")
+    if [ k for k in dims['s'] if type(k) is not int or k < 0 ]:
+        raise TypeError("'dims['s']' must be a list of nonnegative " \
+            "integers")
+    cdim = dims['l'] + sum(dims['q']) + sum([ k**2 for k in dims['s'] ])
+    if h.size[0] != cdim:
+        raise TypeError("'h' must be a 'd' matrix of size (%d,1)" %cdim)
+    if type(G) not in (matrix, spmatrix) or G.typecode != 'd' or \
+        G.size != (cdim, n):
+        raise TypeError("'G' must be a 'd' matrix of size (%d, %d)" 
+            %(cdim, n))
+
+    if P['sparse']: G = base.sparse(G)
+    else: G = matrix(G)
+    ind = 0
+    for key, size in (('l', dims['l']), ('q', sum(dims['q'])), 
+        ('s', sum([ k**2 for k in dims['s'] ]))):
+        if size:
+            P['G'][key].append(G[ind : ind+size, :])
+            P['h'][key].append(h[ind : ind+size])
+        ind += size
+    P['dims'] = {'l': P['dims']['l'] + dims['l'], 
+        'q': P['dims']['q'] + list(dims['q']), 
+        's': P['dims']['s'] + list(dims['s'])}
+
+
+def conelp_solve(P, warmstart = True, options = None):
+    """
+    Solves the problem P returned by conelp_new() with conelp(), and 
+    returns the solution.  
+
+    If warmstart is true, the solve starts from the iterate P['start'] 
+    stored by the last solve (see the warmstart argument of conelp()),
+    instead of the solution, which is too close to the boundary of the 
+    cone.  The slacks of the added rows are set to h - G*x and their 
+    multipliers to zero, and s and z are moved into the interior with 
+    cone_interior(), to a distance WARMSTART_SHIFT * sqrt(mu).  The 
+    homogeneous embedding starts at tau = 1 and kappa = P['start']
+    ['kappa'], so that the point stays as well centered as the stored 
+    one except in the added rows.  
+
+    The QR factorization of A (see localmisc.qr_factor()) and the 
+    analysis of the sparse 's' blocks of G in localmisc.kkt_chol() are 
+    cached, and reused by the next solves.  options is passed to conelp().
+    """
+
+    import math
+    from cvxopt import base, matrix, spmatrix
+
+    dims, start = P['dims'], P['start']
+    n = P['c'].size[0]
+    blocks = P['G']['l'] + P['G']['q'] + P['G']['s']
+    if P['sparse']:
+        G = base.sparse(blocks or [ spmatrix([], [], [], (0, n)) ])
+    else:
+        G = matrix(blocks or [ matrix(0.0, (0, n)) ])
+    h = matrix(P['h']['l'] + P['h']['q'] + P['h']['s'] or 
+        [ matrix(0.0, (0, 1)) ])
+
+    primalstart, dualstart = None, None
+    if warmstart and start is not None:
+
+        # s := h - G*x, with the slacks of the stored iterate in the rows
+        # it had, and z the same with zero in the new rows.
+        s = +h
+        base.gemv(G, start['x'], s, alpha = -1.0, beta = 1.0)
+        z = matrix(0.0, h.size)
+        old = start['dims']
+        ol, oq = old['l'], sum(old['q'])
+        os = sum([ k**2 for k in old['s'] ])
+        nl, nq = dims['l'], sum(dims['q'])
+        for new, o, size in ((0, 0, ol), (nl, ol, oq), (nl + nq, ol + oq, 
+            os)):
+            s[new : new+size] = start['s'][o : o+size]
+            z[new : new+size] = start['z'][o : o+size]
+
+        delta = WARMSTART_SHIFT * math.sqrt(start['mu'])
+        cone_interior(s, dims, delta)
+        cone_interior(z, dims, delta)
+        primalstart = {'x': +start['x'], 's': s}
+        dualstart = {'y': +start['y'], 'z': z, 'kappa': start['kappa']}
+
+    iterate = {}
+    sol = conelp(P['c'], G, h, dims, P['A'], P['b'], primalstart, 
+        dualstart, P['kktsolver'], warmstart = iterate, options = options)
+    if 'x' in iterate:
+        iterate['dims'] = dims
+        P['start'] = iterate
+    else:
+        P['start'] = None
+    P['sol'] = sol
+    return sol
+
+
+def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
+    initvals = None, kktsolver = None, xnewcopy = None, xdot = None,
+    xaxpy = None, xscal = None, ynewcopy = None, ydot = None, yaxpy = None,
+    yscal = None, workspace = None, options = None):
+    """
+    """
+    import math, time
+    from cvxopt import base, blas, misc
+    from cvxopt.base import matrix, spmatrix
+
+    starttime = time.time()
+
+    # The options of this solve, as in conelp().
+    if options is None: options = globals()['options']
+
+    STEP = 0.99
+    EXPON = 3
+
+    try: DEBUG = options['debug']
+    except KeyError: DEBUG = False
+
+    # Use Mehrotra correction or not.
+    try: correction = options['use_correction']
+    except KeyError: correction = True
+
+
+    try: MAXITERS = options['maxiters']
+    except KeyError: MAXITERS = 100
+    else: 
+        if type(MAXITERS) is not int or MAXITERS < 1: 
+            raise ValueError("options['maxiters'] must be a positive "\
+                "integer")
+
+    try: ABSTOL = options['abstol']
+    except KeyError: ABSTOL = 1e-7
+    else: 
+        if type(ABSTOL) is not float and type(ABSTOL) is not int: 
+            raise ValueError("options['abstol'] must be a scalar")
+
+    try: RELTOL = options['reltol']
+    except KeyError: RELTOL = 1e-6
+    else: 
+        if type(RELTOL) is not float and type(RELTOL) is not int: 
+            raise ValueError("options['reltol'] must be a scalar")
+
+    if RELTOL <= 0.0 and ABSTOL <= 0.0 :
+        raise ValueError("at least one of options['reltol'] and " \
+            "options['abstol'] must be positive")
+
+    try: FEASTOL = options['feastol']
+    except KeyError: FEASTOL = 1e-7
+    else: 
+        if (type(FEASTOL) is not float and type(FEASTOL) is not int) or \
+            FEASTOL <= 0.0:
+            raise ValueError("options['feastol'] must be a positive "\
+                "scalar")
+
+    try: show_progress = options['show_progress']
+    except KeyError: show_progress = True
+
+    # Time limit, as in conelp().
+    try: TIMELIMIT = options['time_limit']
+    except KeyError: TIMELIMIT = None
+    else:
+        if TIMELIMIT is not None and ((type(TIMELIMIT) is not float and 
+            type(TIMELIMIT) is not int) or TIMELIMIT <= 0.0):
+            raise ValueError("options['time_limit'] must be None or a "\
+                "positive scalar")
+
+    try: MEMORY = options['memory']
+    except KeyError: MEMORY = 'normal'
+    else:
+        if MEMORY not in ('normal', 'low'):
+            raise ValueError("options['memory'] must be 'normal' or 'low'")
+    LOWMEM = MEMORY == 'low'
+
+
+    # As in conelp(), for coneqp_small().
+    smallkkt = kktsolver is None or kktsolver == 'ldl'
+
+    if kktsolver is None and LOWMEM:
+        kktsolver = 'auto'
+    elif kktsolver is None: 
+        if dims and (dims['q'] or dims['s']):  
+            kktsolver = 'chol'            
+        else:
+            kktsolver = 'chol2'            
+    defaultsolvers = ('ldl', 'ldl2', 'chol', 'chol2')
+    if type(kktsolver) is str and kktsolver != 'auto' and \
+        kktsolver not in defaultsolvers:
+        raise ValueError("'%s' is not a valid value for kktsolver" \
+            %kktsolver)
+
+
+    # Argument error checking depends on level of customization.
+    customkkt = type(kktsolver) is not str
+    matrixP = type(P) in (matrix, spmatrix)
+    matrixG = type(G) in (matrix, spmatrix)
+    matrixA = type(A) in (matrix, spmatrix)
+    if (not matrixP or (not matrixG and G is not None) or 
+        (not matrixA and A is not None)) and not customkkt:
+        raise ValueError("use of function valued P, G, A requires a "\
+            "user-provided kktsolver")
+    customx = (xnewcopy != None or xdot != None or xaxpy != None or 
+        xscal != None) 
+    if customx and (matrixP or matrixG or matrixA or not customkkt):
+        raise ValueError("use of non-vector type for x requires "\
+            "function valued P, G, A and user-provided kktsolver")
+    customy = (ynewcopy != None or ydot != None or yaxpy != None or 
+        yscal != None) 
+    if customy and (matrixA or not customkkt):
+        raise ValueError("use of non vector type for y requires "\
+            "function valued A and user-provided kktsolver")
+
+
+    if not customx and (type(q) is not matrix or q.typecode != 'd' or
+        q.size[1] != 1):
+        raise TypeError("'q' must be a 'd' matrix with one column")
+
+    if matrixP:
+        if P.typecode != 'd' or P.size != (q.size[0], q.size[0]):
+            raise TypeError("'P' must be a 'd' matrix of size (%d, %d)"\
+                %(q.size[0], q.size[0]))
+        def fP(x, y, alpha = 1.0, beta = 0.0):
+            base.symv(P, x, y, alpha = alpha, beta = beta)
+    else:
+        fP = P
+
+
+    if h is None: h = matrix(0.0, (0,1))
+    if type(h) is not matrix or h.typecode != 'd' or h.size[1] != 1:
+        raise TypeError("'h' must be a 'd' matrix with one column")
+
+    if not dims: dims = {'l': h.size[0], 'q': [], 's': []}
+    if type(dims['l']) is not int or dims['l'] < 0: 
+        raise TypeError("'dims['l']' must be a nonnegative integer")
+    if [ k for k in dims['q'] if type(k) is not int or k < 1 ]:
+        raise TypeError("'dims['q']' must be a list of positive integers")
+    if [ k for k in dims['s'] if type(k) is not int or k < 0 ]:
+        raise TypeError("'dims['s']' must be a list of nonnegative " \
+            "integers")
+
+    try: refinement = options['refinement']
+    except KeyError: 
+        if dims['q'] or dims['s']: refinement = 1
+        else: refinement = 0
+    else:
+        if type(refinement) is not int or refinement < 0: 
+            raise ValueError("options['refinement'] must be a "\
+                "nonnegative integer")
+
+    try: REFTOL = options['refinement_tol']
+    except KeyError: REFTOL = None
+    else:
+        if (type(REFTOL) is not float and type(REFTOL) is not int) or \
+            REFTOL < 0.0:
+            raise ValueError("options['refinement_tol'] must be a "\
+                "nonnegative scalar")
+
+    try: correctors = options['correctors']
+    except KeyError: correctors = 0
+    else:
+        if type(correctors) is not int or correctors < 0: 
+            raise ValueError("options['correctors'] must be a "\
+                "nonnegative integer")
+
+    try: RESFREQ = options['residual_refresh']
+    except KeyError: RESFREQ = 1
+    else:
+        if type(RESFREQ) is not int or RESFREQ < 1: 
+            raise ValueError("options['residual_refresh'] must be a "\
+                "positive integer")
+
+    # With options['scaling_threads'] > 1, the 's' blocks of the scaling
+    # are updated in that many threads by localmisc.local_update_scaling().
+    try: SCALING_THREADS = options['scaling_threads']
+    except KeyError: SCALING_THREADS = 1
+    else:
+        if type(SCALING_THREADS) is not int or SCALING_THREADS < 1: 
+            raise ValueError("options['scaling_threads'] must be a "\
+                "positive integer")
+
+
+    cdim = dims['l'] + sum(dims['q']) + sum([ k**2 for k in dims['s'] ])
+    if h.size[0] != cdim:
+        raise TypeError("'h' must be a 'd' matrix of size (%d,1)" %cdim)
+
+    # Data for kth 'q' constraint are found in rows indq[k]:indq[k+1] of G.
+    indq = [ dims['l'] ]  
+    for k in dims['q']:  indq = indq + [ indq[-1] + k ] 
+
+    # Data for kth 's' constraint are found in rows inds[k]:inds[k+1] of G.
+    inds = [ indq[-1] ]
+    for k in dims['s']:  inds = inds + [ inds[-1] + k**2 ] 
+
+    if G is None:
         if customx:
             def G(x, y, trans = 'N', alpha = 1.0, beta = 0.0):
                 if trans == 'N': pass
@@ -1404,10 +2722,34 @@ def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
     if b is None and customy:  
         raise ValueEror("use of non-vector type for y requires b")
 
+    # Presolve, as in conelp().
+    try: presolve = options['presolve']
+    except KeyError: presolve = False
+    if presolve and matrixP and matrixG and matrixA and not customkkt:
+        pre = cone_presolve(G, h, dims)
+        if pre is not None and workspace is not None:
+            raise ValueError("a workspace cannot be used when "\
+                "options['presolve'] rewrites the cones")
+        if pre is not None:
+            iv = initvals
+            if iv is not None:
+                iv = dict(iv)
+                for key in ('s', 'z'):
+                    if key in iv and iv[key] is not None:
+                        iv[key] = matrix(pre['T'] * iv[key])
+            sol = coneqp(P, q, pre['G'], pre['h'], pre['dims'], A, b, iv,
+                kktsolver, options = options)
+            cone_postsolve(sol, pre)
+            return sol
+
+    # Small problems with 'l' constraints only, as in conelp().
+    if q.size[0] < SMALL_SIZE and 0 < cdim < SMALL_ROWS and smallkkt \
+        and not dims['q'] and not dims['s'] and initvals is None and \
+        workspace is None and not refinement and not correctors and \
+        not DEBUG and not helpers.sp_context()['active']:
+        return coneqp_small(P, q, G, h, A, b, MAXITERS, ABSTOL, RELTOL, 
+            FEASTOL, correction, show_progress, TIMELIMIT, starttime)
 
-    ws3, wz3 = matrix(0.0, (cdim,1 )), matrix(0.0, (cdim,1 ))
-    helpers.sp_add_var("ws3", ws3)
-    helpers.sp_add_var("wz3", wz3)
 
     def res(ux, uy, uz, us, vx, vy, vz, vs, W, lmbda):
 
@@ -1446,21 +2788,73 @@ def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
         helpers.sp_create("90res", minor)
 
 
+    # Euclidean norm of (vx, vy, vz, vs), for the stopping test of the 
+    # iterative refinement.
+
+    def resnrm(vx, vy, vz, vs):
+        return math.sqrt(xdot(vx, vx) + ydot(vy, vy) + 
+            misc.sdot(vz, vz, dims) + 
+            misc.sdot(vs, vs, dims))
+
+
     # kktsolver(W) returns a routine for solving 
     #
     #     [ P   A'  G'*W^{-1} ] [ ux ]   [ bx ]
     #     [ A   0   0         ] [ uy ] = [ by ].
     #     [ G   0   -W'       ] [ uz ]   [ bz ]
+    #
+    # With kktsolver 'auto', the solver is chosen by kkt_select().
+
+    if kktsolver == 'auto':
+        kktsolver = localmisc.kkt_select(G, dims, A, H = P, memory = 
+            MEMORY)
+
+    # Workspace, as in conelp().
+    if workspace is None:
+        if kktsolver in defaultsolvers and WORKSPACES_SIZE and not LOWMEM:
+            ws = workspace_get(q.size[0], b.size[0], dims, kktsolver)
+            try:
+                return coneqp(P, q, G, h, dims, A, b, initvals, kktsolver,
+                    workspace = ws, options = options)
+            finally:
+                workspace_put(ws)
+    elif customx or customy:
+        raise ValueError("a workspace cannot be used with non-vector "\
+            "types for x or y")
+    elif workspace['key'] != \
+        workspace_key(q.size[0], b.size[0], dims, kktsolver):
+        raise ValueError("workspace was created for a different problem")
+    if workspace is not None: workspace['frozen'] = False
+
+    # Work vectors, shared as in conelp() if options['memory'] is 'low'.
+    if LOWMEM: share = {'dsc': 'ws2', 'dzc': 'wz2', 'wt': 'ws'}
+    else: share = {}
+    store = workspace
+    if LOWMEM and store is None: store = {}
+    def work(name, size): 
+        return localmisc.ws_matrix(store, share.get(name, name), size)
+    def xwork(name):
+        if workspace is None: return xnewcopy(q)
+        return localmisc.ws_copy(workspace, name, q)
+    def ywork(name):
+        if workspace is None: return ynewcopy(b)
+        return localmisc.ws_copy(workspace, name, b)
+
+    ws3, wz3 = work('ws3', (cdim,1)), work('wz3', (cdim,1))
+    helpers.sp_add_var("ws3", ws3)
+    helpers.sp_add_var("wz3", wz3)
 
     if kktsolver in defaultsolvers:
          if b.size[0] > q.size[0]:
              raise ValueError("Rank(A) < p or Rank([P; G; A]) < n")
          if kktsolver == 'ldl': 
-             factor = localmisc.kkt_ldl(G, dims, A)
+             factor = localmisc.kkt_ldl(G, dims, A, ws = workspace, 
+                 memory = MEMORY)
          elif kktsolver == 'ldl2': 
              factor = misc.kkt_ldl2(G, dims, A)
          elif kktsolver == 'chol':
-             factor = localmisc.kkt_chol(G, dims, A)
+             factor = localmisc.kkt_chol(G, dims, A, ws = workspace, 
+                 memory = MEMORY)
          else:
              factor = localmisc.kkt_chol2(G, dims, A)
          def kktsolver(W):
@@ -1647,13 +3041,25 @@ def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
                 ind += m**2
 
 
-    rx, ry, rz = xnewcopy(q), ynewcopy(b), matrix(0.0, (cdim, 1)) 
-    dx, dy = xnewcopy(x), ynewcopy(y)   
-    dz, ds = matrix(0.0, (cdim, 1)), matrix(0.0, (cdim, 1))
-    lmbda = matrix(0.0, (dims['l'] + sum(dims['q']) + sum(dims['s']), 1))
-    lmbdasq = matrix(0.0, (dims['l'] + sum(dims['q']) + sum(dims['s']), 1))
-    sigs = matrix(0.0, (sum(dims['s']), 1))
-    sigz = matrix(0.0, (sum(dims['s']), 1))
+    rx, ry, rz = xwork('rx'), ywork('ry'), work('rz', (cdim, 1)) 
+    dx, dy = xwork('dx'), ywork('dy')   
+    dz, ds = work('dz', (cdim, 1)), work('ds', (cdim, 1))
+
+    # Storage for centrality correctors, as in conelp().
+    # (wcor is the second order term minus the corrections, since ws3 is 
+    # overwritten by f4().)
+    if correctors:
+        dxa, dya = xwork('dxa'), ywork('dya')
+        dsa, dza = work('dsa', (cdim, 1)), work('dza', (cdim, 1))
+        dsu, dzu = work('dsu', (cdim, 1)), work('dzu', (cdim, 1))
+        dsc, dzc = work('dsc', (cdim, 1)), work('dzc', (cdim, 1))
+        wcor, wt = work('wcor', (cdim, 1)), work('wt', (cdim, 1))
+    lmbda = work('lmbda', (dims['l'] + sum(dims['q']) + sum(dims['s']), 
+        1))
+    lmbdasq = work('lmbdasq', (dims['l'] + sum(dims['q']) + 
+        sum(dims['s']), 1))
+    sigs = work('sigs', (sum(dims['s']), 1))
+    sigz = work('sigz', (sum(dims['s']), 1))
 
     helpers.sp_add_var("rx", rx)
     helpers.sp_add_var("ry", ry)
@@ -1671,47 +3077,76 @@ def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
     gap = misc.sdot(s, z, dims) 
 
 
+    best = None
     for iters in xrange(MAXITERS + 1):
         helpers.sp_major_next()
         helpers.sp_create("loopstart", 10)
 
-        # f0 = (1/2)*x'*P*x + q'*x + r and  rx = P*x + q + A'*y + G'*z.
-        xcopy(q, rx)
-        fP(x, rx, beta = 1.0)
-        f0 = 0.5 * (xdot(x, rx) + xdot(x, q))
-        fA(y, rx, beta = 1.0, trans = 'T')
-        fG(z, rx, beta = 1.0, trans = 'T')
-        resx = math.sqrt(xdot(rx, rx))
+        # In debug mode, the work vectors are not allocated again after
+        # the first iteration, as in conelp().
+        if DEBUG and workspace is not None:
+            workspace['frozen'] = iters > 0
+
+        # The residuals are recomputed from scratch every RESFREQ 
+        # iterations, or if the values updated at the end of the previous
+        # iteration pass the stopping criteria, as in conelp().
+
+        if iters % RESFREQ == 0: passes = [True]
+        else: passes = [False, True]
+        timeout = localmisc.time_out(starttime, TIMELIMIT, iters)
+        for exact in passes:
+            if exact:
+                # f0 = (1/2)*x'*P*x + q'*x + r and  
+                # rx = P*x + q + A'*y + G'*z.
+                xcopy(q, rx)
+                fP(x, rx, beta = 1.0)
+                f0 = 0.5 * (xdot(x, rx) + xdot(x, q))
+                fA(y, rx, beta = 1.0, trans = 'T')
+                fG(z, rx, beta = 1.0, trans = 'T')
            
-        # ry = A*x - b
-        ycopy(b, ry)
-        fA(x, ry, alpha = 1.0, beta = -1.0)
-        resy = math.sqrt(ydot(ry, ry))
-
-        # rz = s + G*x - h
-        blas.copy(s, rz)
-        blas.axpy(h, rz, alpha = -1.0)
-        fG(x, rz, beta = 1.0)
-        resz = misc.snrm2(rz, dims)
+                # ry = A*x - b
+                ycopy(b, ry)
+                fA(x, ry, alpha = 1.0, beta = -1.0)
 
+                # rz = s + G*x - h
+                blas.copy(s, rz)
+                blas.axpy(h, rz, alpha = -1.0)
+                fG(x, rz, beta = 1.0)
 
-        # Statistics for stopping criteria.
+            else:
+                # x'*P*x = x'*(rx - q) - y'*(ry + b) - z'*(rz - s + h).
+                f0 = 0.5 * (xdot(x, rx) + xdot(x, q) - ydot(y, ry) - 
+                    ydot(y, b) - misc.sdot(z, rz, dims) + gap - 
+                    misc.sdot(z, h, dims))
+
+            resx = math.sqrt(xdot(rx, rx))
+            resy = math.sqrt(ydot(ry, ry))
+            resz = misc.snrm2(rz, dims)
+
+
+            # Statistics for stopping criteria.
+
+            # pcost = (1/2)*x'*P*x + q'*x 
+            # dcost = (1/2)*x'*P*x + q'*x + y'*(A*x-b) + z'*(G*x-h)
+            #       = (1/2)*x'*P*x + q'*x + y'*(A*x-b) + z'*(G*x-h+s) - 
+            #         z'*s
+            #       = (1/2)*x'*P*x + q'*x + y'*ry + z'*rz - gap
+            #print "resx: %.17f, resy: %.17f, resz: %.17f" %( resx, resy, resz)
+            pcost = f0
+            dcost = f0 + ydot(y, ry) + misc.sdot(z, rz, dims) - gap
+            if pcost < 0.0:
+                relgap = gap / -pcost
+            elif dcost > 0.0:
+                relgap = gap / dcost 
+            else:
+                relgap = None
+            pres = max(resy/resy0, resz/resz0)
+            dres = resx/resx0 
 
-        # pcost = (1/2)*x'*P*x + q'*x 
-        # dcost = (1/2)*x'*P*x + q'*x + y'*(A*x-b) + z'*(G*x-h)
-        #       = (1/2)*x'*P*x + q'*x + y'*(A*x-b) + z'*(G*x-h+s) - z'*s
-        #       = (1/2)*x'*P*x + q'*x + y'*ry + z'*rz - gap
-        #print "resx: %.17f, resy: %.17f, resz: %.17f" %( resx, resy, resz)
-        pcost = f0
-        dcost = f0 + ydot(y, ry) + misc.sdot(z, rz, dims) - gap
-        if pcost < 0.0:
-            relgap = gap / -pcost
-        elif dcost > 0.0:
-            relgap = gap / dcost 
-        else:
-            relgap = None
-        pres = max(resy/resy0, resz/resz0)
-        dres = resx/resx0 
+            if not exact and not ( iters == MAXITERS or timeout or ( pres 
+                <= FEASTOL and dres <= FEASTOL and ( gap <= ABSTOL or 
+                (relgap is not None and relgap <= RELTOL) ) ) ):
+                break
 
         helpers.sp_create("stoptest", 100, {"gap": gap,
                                           "resx": resx,
@@ -1751,6 +3186,18 @@ def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
                     'primal infeasibility': pres,
                     'dual infeasibility': dres, 'primal slack': -ts,
                     'dual slack': -tz , 'iterations': iters }
+
+        # Best iterate and time limit, as in conelp().
+        if TIMELIMIT is not None:
+            best = localmisc.iterate_save(best, {'gap': gap, 
+                'relative gap': relgap, 'primal objective': pcost, 
+                'dual objective': dcost, 'primal infeasibility': pres, 
+                'dual infeasibility': dres}, x, y, s, z, 1.0, xnewcopy, 
+                ynewcopy)
+            if timeout:
+                if show_progress:
+                    print("Terminated (time limit reached).")
+                return iterate_best(best, dims, iters, xscal, yscal)
                     
 
         # Compute initial scaling W and scaled iterates:  
@@ -1760,7 +3207,11 @@ def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
         # lmbdasq = lambda o lambda.
         
         if iters == 0:
-            W = misc.compute_scaling(s, z, lmbda, dims)
+            if SCALING_THREADS > 1:
+                W = localmisc.local_compute_scaling(s, z, lmbda, dims, 
+                    ws = workspace, threads = SCALING_THREADS)
+            else:
+                W = misc.compute_scaling(s, z, lmbda, dims)
             helpers.sp_add_var("W", W)
             #print "-- initial lmbda=\n", localmisc.strMat(lmbda)
         misc.ssqr(lmbdasq, lmbda, dims)
@@ -1843,28 +3294,30 @@ def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
 
 
         # f4(x, y, z, s) solves the same system as f4_no_ir, but applies
-        # iterative refinement.
+        # iterative refinement, with the stopping test used in f6() of 
+        # conelp().
 
         if iters == 0:
             if refinement or DEBUG:
-                wx, wy = xnewcopy(q), ynewcopy(b) 
-                wz, ws = matrix(0.0, (cdim,1)), matrix(0.0, (cdim,1)) 
+                wx, wy = xwork('wx'), ywork('wy') 
+                wz, ws = work('wz', (cdim,1)), work('ws', (cdim,1)) 
                 helpers.sp_add_var("wx", wx)
                 helpers.sp_add_var("wy", wy)
                 helpers.sp_add_var("ws", ws)
                 helpers.sp_add_var("wz", wz)
             if refinement:
-                wx2, wy2 = xnewcopy(q), ynewcopy(b) 
-                wz2, ws2 = matrix(0.0, (cdim,1)), matrix(0.0, (cdim,1)) 
+                wx2, wy2 = xwork('wx2'), ywork('wy2') 
+                wz2, ws2 = work('wz2', (cdim,1)), work('ws2', (cdim,1)) 
                 helpers.sp_add_var("wx2", wx2)
                 helpers.sp_add_var("wy2", wy2)
                 helpers.sp_add_var("ws2", ws2)
                 helpers.sp_add_var("wz2", wz2)
 
+        refine = [refinement]
         def f4(x, y, z, s):
             minor = helpers.sp_minor_top()
             helpers.sp_create("f4start", minor)
-            if refinement or DEBUG: 
+            if refine[0] or DEBUG: 
                 xcopy(x, wx)        
                 ycopy(y, wy)        
                 blas.copy(z, wz)        
@@ -1874,7 +3327,9 @@ def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
             f4_no_ir(x, y, z, s)        
             helpers.sp_minor_pop()
 
-            for i in xrange(refinement):
+            if refine[0] and REFTOL is not None: 
+                bnrm = resnrm(wx, wy, wz, ws)
+            for i in xrange(refine[0]):
                 xcopy(wx, wx2)        
                 ycopy(wy, wy2)        
                 blas.copy(wz, wz2)        
@@ -1882,6 +3337,10 @@ def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
                 helpers.sp_minor_push(minor+(i+1)*300)
                 res(x, y, z, s, wx2, wy2, wz2, ws2, W, lmbda) 
                 helpers.sp_minor_pop()
+                if REFTOL is not None and resnrm(wx2, wy2, wz2, ws2) <= \
+                    REFTOL * bnrm:
+                    if i == 0: refine[0] = 0
+                    break
                 helpers.sp_minor_push(minor+(i+1)*500)
                 f4_no_ir(wx2, wy2, wz2, ws2)
                 helpers.sp_minor_pop()
@@ -1903,7 +3362,7 @@ def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
         mu = gap / (dims['l'] + len(dims['q']) + sum(dims['s']))
         sigma, eta = 0.0, 0.0
 
-        for i in [0, 1]:
+        for i in xrange(2 + correctors):
 
             # Solve
             #
@@ -1915,13 +3374,27 @@ def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
             #     lmbda o (dz + ds) = -lmbda o lmbda - dsa o dza 
             #                         + sigma*mu*e (i=1) where dsa, dza
             #                         are the solution for i=0. 
+            #
+            # For i > 1 (Gondzio correctors), the centrality corrections 
+            # wcor for the accepted directions are added.
  
+            if correctors and i == 1:
+                if correction: blas.copy(ws3, wcor)
+                else: blas.scal(0.0, wcor)
+            if i > 1:
+                localmisc.local_centrality(dsu, dzu, lmbda, min(1.0, 
+                    step + 0.1), 0.1*sigma*mu, 10.0*sigma*mu, wt, dims,
+                    ws = workspace)
+                blas.axpy(wt, wcor, alpha = -1.0)
+
             minor_base = (i+1)*2000
             # ds = -lmbdasq + sigma * mu * e  (if i is 0)
             #    = -lmbdasq - dsa o dza + sigma * mu * e  (if i is 1), 
             #     where ds, dz are solution for i is 0.
             blas.scal(0.0, ds)
-            if correction and i == 1:  
+            if i > 1:
+                blas.axpy(wcor, ds, alpha = -1.0)
+            elif correction and i == 1:  
                 blas.axpy(ws3, ds, alpha = -1.0)
             blas.axpy(lmbdasq, ds, n = dims['l'] + sum(dims['q']), 
                 alpha = -1.0)
@@ -1983,10 +3456,13 @@ def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
             # 's' blocks in ds,dz.  The eigenvectors Qs, Qz are stored in 
             # dsk, dzk.  The eigenvalues are stored in sigs, sigz.
 
+            if correctors and i >= 1:
+                blas.copy(ds, dsc)
+                blas.copy(dz, dzc)
             misc.scale2(lmbda, ds, dims)
             misc.scale2(lmbda, dz, dims)
             helpers.sp_create("maxstep", minor_base+1500)
-            if i == 0: 
+            if i == 0 or correctors: 
                 ts = misc.max_step(ds, dims)
                 tz = misc.max_step(dz, dims)
             else:
@@ -2007,6 +3483,23 @@ def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
                 eta = 0.0
             #print "== step=%.17f sigma=%.17f dsdz=%.17f" %( step, sigma, dsdz)
 
+            # A corrector is accepted if it increases the step by 1%.
+            if correctors and i >= 1:
+                if i > 1 and step < 1.01 * stepa:
+                    xcopy(dxa, dx);  ycopy(dya, dy)
+                    blas.copy(dsa, ds);  blas.copy(dza, dz)
+                    step = stepa
+                    break
+                xcopy(dx, dxa);  ycopy(dy, dya)
+                blas.copy(ds, dsa);  blas.copy(dz, dza)
+                blas.copy(dsc, dsu);  blas.copy(dzc, dzu)
+                stepa = step
+                if step == 1.0: break
+
+        if correctors:
+            misc.max_step(ds, dims, sigma = sigs)
+            misc.max_step(dz, dims, sigma = sigz)
+
 
         helpers.sp_create("updatexy", 8000)
         xaxpy(dx, x, alpha = step)
@@ -2071,41 +3564,656 @@ def coneqp(P, q, G = None, h = None, dims = None, A = None, b = None,
             ind3 += m
 
 
-        # Update lambda and scaling.
-        helpers.sp_create("updatescaling", 8050)
-        misc.update_scaling(W, lmbda, ds, dz)
-        helpers.sp_create("afterscaling", 8060)
+        # Update lambda and scaling.
+        helpers.sp_create("updatescaling", 8050)
+        if SCALING_THREADS > 1:
+            localmisc.local_update_scaling(W, lmbda, ds, dz, ws = workspace,
+                threads = SCALING_THREADS)
+        else:
+            misc.update_scaling(W, lmbda, ds, dz)
+        helpers.sp_create("afterscaling", 8060)
+
+        # Unscale s, z (unscaled variables are used only to compute 
+        # feasibility residuals).
+
+        blas.copy(lmbda, s, n = dims['l'] + sum(dims['q']))
+        ind = dims['l'] + sum(dims['q'])
+        ind2 = ind
+        for m in dims['s']:
+            blas.scal(0.0, s, offset = ind2)
+            blas.copy(lmbda, s, offsetx = ind, offsety = ind2, n = m, 
+                incy = m+1)
+            ind += m
+            ind2 += m*m
+        misc.scale(s, W, trans = 'T')
+
+        blas.copy(lmbda, z, n = dims['l'] + sum(dims['q']))
+        ind = dims['l'] + sum(dims['q'])
+        ind2 = ind
+        for m in dims['s']:
+            blas.scal(0.0, z, offset = ind2)
+            blas.copy(lmbda, z, offsetx = ind, offsety = ind2, n = m, 
+                incy = m+1)
+            ind += m
+            ind2 += m*m
+        misc.scale(z, W, inverse = 'I')
+
+        gap = blas.dot(lmbda, lmbda) 
+
+        # The right-hand sides of the linear equations in the Newton 
+        # system are -(1-eta)*(rx, ry, rz), so the residuals at the new 
+        # iterate are (1 - step*(1-eta)) * (rx, ry, rz), up to the error 
+        # in the solution of the KKT system.
+
+        if RESFREQ > 1:
+            a = 1.0 - step * (1.0 - eta)
+            xscal(a, rx);  yscal(a, ry);  blas.scal(a, rz)
+        helpers.sp_create("eol", 8900)
+        #print "== gap = %.17f" % gap
+
+
+
+
+def coneqp_small(P, q, G, h, A, b, MAXITERS = 100, ABSTOL = 1e-7, 
+    RELTOL = 1e-6, FEASTOL = 1e-7, correction = True, 
+    show_progress = True, TIMELIMIT = None, starttime = None):
+    """
+    Solves the QP
+
+        minimize    (1/2)*x'*P*x + q'*x 
+        subject to  G*x + s = h
+                    A*x = b
+                    s >= 0
+
+    with the algorithm of coneqp(), for a small number of variables, as
+    conelp_small() does for conelp().  P is the lower triangle of a 
+    dense matrix.
+    """
+
+    import math
+    from cvxopt import base, blas
+    from cvxopt.base import matrix
+
+    EXPON = 3
+    STEP = 0.99
+
+    n, m, p = q.size[0], h.size[0], b.size[0]
+    if p > n:
+        raise ValueError("Rank(A) < p or Rank([P; G; A]) < n")
+    P, G, A = matrix(P), matrix(G), matrix(A)
+
+    # Work vectors.
+    Gs, K = matrix(0.0, (m, n)), matrix(0.0, (n+p, n+p))
+    ipiv, u = matrix(0, (n+p, 1)), matrix(0.0, (n+p, 1))
+    x, dx, rx = matrix(0.0, (n, 1)), matrix(0.0, (n, 1)), matrix(0.0, 
+        (n, 1))
+    y, dy, ry = matrix(0.0, (p, 1)), matrix(0.0, (p, 1)), matrix(0.0, 
+        (p, 1))
+    s, ds, z, dz = [ matrix(0.0, (m, 1)) for k in xrange(4) ]
+    rz, lmbdasq, ws3, wz = [ matrix(0.0, (m, 1)) for k in xrange(4) ]
+
+    resx0 = max(1.0, blas.nrm2(q))
+    resy0 = max(1.0, blas.nrm2(b))
+    resz0 = max(1.0, blas.nrm2(h))
+
+    # Initial points, as in coneqp():  the solution of the KKT system 
+    # with right-hand side (-q, b, h), with W = I, and s = -z.
+    d, di = matrix(1.0, (m, 1)), matrix(1.0, (m, 1))
+    try: small_factor(K, ipiv, P, G, A, di, Gs)
+    except ArithmeticError: 
+        raise ValueError("Rank(A) < p or Rank([P; A; G]) < n")
+    blas.copy(q, x)
+    blas.scal(-1.0, x)
+    blas.copy(b, y)
+    blas.copy(h, z)
+    small_solve(K, ipiv, Gs, di, u, x, y, z)
+    blas.copy(z, s)  
+    blas.scal(-1.0, s)  
+
+    ts, tz = -min(s), -min(z)
+    if ts >= -1e-8 * max(blas.nrm2(s), 1.0): s += 1.0 + ts
+    if tz >= -1e-8 * max(blas.nrm2(z), 1.0): z += 1.0 + tz
+
+    if show_progress: 
+        print("% 10s% 12s% 10s% 8s% 7s" %("pcost", "dcost", "gap", "pres",
+            "dres"))
+
+    gap = blas.dot(s, z) 
+
+    best = None
+    for iters in xrange(MAXITERS + 1):
+
+        # f0 = (1/2)*x'*P*x + q'*x and rx = P*x + q + A'*y + G'*z.
+        blas.copy(q, rx)
+        blas.symv(P, x, rx, beta = 1.0)
+        f0 = 0.5 * (blas.dot(x, rx) + blas.dot(x, q))
+        blas.gemv(A, y, rx, beta = 1.0, trans = 'T')
+        blas.gemv(G, z, rx, beta = 1.0, trans = 'T')
+           
+        # ry = A*x - b
+        blas.copy(b, ry)
+        blas.gemv(A, x, ry, alpha = 1.0, beta = -1.0)
+
+        # rz = s + G*x - h
+        blas.copy(s, rz)
+        blas.axpy(h, rz, alpha = -1.0)
+        blas.gemv(G, x, rz, beta = 1.0)
+
+        # Statistics for stopping criteria.
+        pcost = f0
+        dcost = f0 + blas.dot(y, ry) + blas.dot(z, rz) - gap
+        pres = max(blas.nrm2(ry)/resy0, blas.nrm2(rz)/resz0)
+        dres = blas.nrm2(rx)/resx0 
+        stats = small_stats(gap, pcost, dcost, pres, dres)
+
+        if show_progress:
+            print("%2d: % 8.4e % 8.4e % 4.0e% 7.0e% 7.0e" \
+                %(iters, pcost, dcost, gap, pres, dres))
+
+        if small_converged(stats, ABSTOL, RELTOL, FEASTOL) or \
+            iters == MAXITERS:
+            if iters == MAXITERS:
+                if show_progress:
+                    print("Terminated (maximum number of iterations "\
+                        "reached).")
+                status = 'unknown'
+            else:
+                if show_progress:
+                    print("Optimal solution found.")
+                status = 'optimal'
+            return small_result(x, y, s, z, status, stats, iters)
+
+        # Best iterate and time limit, as in conelp().
+        if TIMELIMIT is not None:
+            best = localmisc.iterate_save(best, dict(stats), x, y, s, z)
+            if localmisc.time_out(starttime, TIMELIMIT, iters):
+                if show_progress:
+                    print("Terminated (time limit reached).")
+                return iterate_best(best, {'l': s.size[0], 'q': [], 
+                    's': []}, iters)
+
+        # Initial scaling d = sqrt(s ./ z) and lmbda = sqrt(s .* z).
+        if iters == 0:
+            d = base.sqrt(base.div(s, z))
+            di = d**-1
+            lmbda = base.sqrt(base.mul(s, z))
+
+        # lmbdasq := lmbda o lmbda 
+        blas.copy(lmbda, lmbdasq)
+        blas.tbmv(lmbda, lmbdasq, n = m, k = 0, ldA = 1)
+
+        try: small_factor(K, ipiv, P, G, A, di, Gs)
+        except ArithmeticError: 
+            if iters == 0:
+                raise ValueError("Rank(A) < p or Rank([P; A; G]) < n")
+            if show_progress:
+                print("Terminated (singular KKT matrix).")
+            return small_result(x, y, s, z, 'unknown', stats, iters)
+
+        mu = gap / m
+        sigma = 0.0
+        for i in xrange(2):
+
+            # Solve the Newton equations of coneqp() for 
+            #
+            #     ds = -lmbdasq + sigma*mu*e (i = 0)
+            #        = -lmbdasq - dsa o dza + sigma*mu*e (i = 1)
+            #     (dx, dy, dz) = -(rx, ry, rz),
+            #
+            # with the steps of f4_no_ir() in coneqp().
+
+            blas.copy(lmbdasq, ds)
+            if i == 1 and correction:
+                blas.axpy(ws3, ds)
+            blas.scal(-1.0, ds)
+            ds += sigma*mu
+            blas.copy(rx, dx);  blas.scal(-1.0, dx)
+            blas.copy(ry, dy);  blas.scal(-1.0, dy)
+            blas.copy(rz, dz);  blas.scal(-1.0, dz)
+
+            # ds := lmbda o\ ds, dz := dz - W'*ds
+            blas.tbsv(lmbda, ds, n = m, k = 0, ldA = 1)
+            blas.copy(ds, wz)
+            blas.tbmv(d, wz, n = m, k = 0, ldA = 1)
+            blas.axpy(wz, dz, alpha = -1.0)
+
+            small_solve(K, ipiv, Gs, di, u, dx, dy, dz)
+
+            # ds := ds - dz
+            blas.axpy(dz, ds, alpha = -1.0)
+
+            # dsdz = <ds, dz>.  Save ds o dz for Mehrotra correction.
+            dsdz = blas.dot(ds, dz)
+            if correction and i == 0:
+                blas.copy(ds, ws3)
+                blas.tbmv(dz, ws3, n = m, k = 0, ldA = 1)
+
+            # Maximum steps to boundary, in the current scaling.
+            step = small_step(lmbda, ds, dz, i, STEP = STEP)
+            if i == 0: 
+                sigma = min(1.0, max(0.0, 
+                    1.0 - step + dsdz/gap * step**2))**EXPON
+
+        blas.axpy(dx, x, alpha = step)
+        blas.axpy(dy, y, alpha = step)
+
+        # Update the scaling and s, z (see small_update()).
+        di = small_update(step, d, lmbda, s, z, ds, dz)
+        gap = blas.dot(lmbda, lmbda) 
+
+
+def batch_factor(PP, M, W2, AT):
+    """
+    Factors the KKT matrices of qp_batch(), 
+
+        [ P_k + G'*diag(W2[:,k])*G   A' ]
+        [ A                          0  ],
+
+    for the problems k = 0, ..., N-1 together.  PP has the columns 
+    vec(P_k) and M the columns vec(G[i,:]'*G[i,:]), so the 1,1 blocks 
+    are the columns of PP + M*W2.
+
+    Returns (HH, YY, SS, failed).  HH is the n x n*N matrix with the 
+    Cholesky factors L_k of the 1,1 blocks side by side.  YY has the 
+    blocks L_k^{-1}*A' and SS the Cholesky factors of the Schur 
+    complements YY_k'*YY_k.  failed is the list of problems for which 
+    one of the factorizations failed.
+    """
+
+    from cvxopt import blas, lapack
+    from cvxopt.base import matrix
+
+    n, p = AT.size
+    N = PP.size[1]
+
+    HH = PP + M * W2
+    HH.size = (n, n*N)
+    YY = AT[:, [ j for k in xrange(N) for j in xrange(p) ]]
+    SS = matrix(0.0, (p, p*N))
+    failed = []
+    for k in xrange(N):
+        try:
+            lapack.potrf(HH, n = n, ldA = n, offsetA = k*n*n)
+            if p:
+                blas.trsm(HH, YY, m = n, n = p, ldA = n, ldB = n, 
+                    offsetA = k*n*n, offsetB = k*n*p)
+                blas.syrk(YY, SS, trans = 'T', n = p, k = n, ldA = n,
+                    ldC = p, offsetA = k*n*p, offsetC = k*p*p)
+                lapack.potrf(SS, n = p, ldA = p, offsetA = k*p*p)
+        except ArithmeticError: 
+            failed.append(k)
+    return HH, YY, SS, failed
+
+
+def batch_solve(HH, YY, SS, G, DI, X, Y, Z):
+    """
+    Solves the KKT systems
+
+        [ P_k  A'  G'          ] [ ux_k               ]   [ bx_k ]
+        [ A    0   0           ] [ uy_k               ] = [ by_k ]
+        [ G    0  -diag(d_k)^2 ] [ diag(d_k)^{-1}*uz_k ]   [ bz_k ]
+
+    of qp_batch(), with the factorization (HH, YY, SS) of batch_factor()
+    and DI = [ d_0, ..., d_{N-1} ]^{-1}.  On entry X, Y, Z have the 
+    columns bx_k, by_k, bz_k.  On exit they have the columns ux_k, 
+    uy_k, uz_k.
+    """
+
+    from cvxopt import base, blas, lapack
+
+    n, N = X.size
+    p = Y.size[0]
+
+    # Z := DI o Z,  X := X + G' * (DI o Z)
+    blas.copy(base.mul(DI, Z), Z)
+    base.gemm(G, base.mul(DI, Z), X, transA = 'T', beta = 1.0)
+
+    # Y_k := S_k^{-1} * (YY_k' * L_k^{-1} * X_k - Y_k)
+    # X_k := L_k^{-T} * (L_k^{-1} * X_k - YY_k * Y_k)
+    for k in xrange(N):
+        blas.trsv(HH, X, n = n, ldA = n, offsetA = k*n*n, offsetx = k*n)
+        if p:
+            blas.gemv(YY, X, Y, trans = 'T', m = n, n = p, ldA = n, 
+                offsetA = k*n*p, offsetx = k*n, offsety = k*p, beta = -1.0)
+            lapack.potrs(SS, Y, n = p, nrhs = 1, ldA = p, ldB = p, 
+                offsetA = k*p*p, offsetB = k*p)
+            blas.gemv(YY, Y, X, m = n, n = p, ldA = n, offsetA = k*n*p, 
+                offsetx = k*p, offsety = k*n, alpha = -1.0, beta = 1.0)
+        blas.trsv(HH, X, trans = 'T', n = n, ldA = n, offsetA = k*n*n, 
+            offsetx = k*n)
+
+    # Z := DI o (G*X) - Z
+    blas.copy(base.mul(DI, G*X) - Z, Z)
+
+
+def qp_batch(P, q, G = None, h = None, A = None, b = None, options = None):
+    """
+    Solves the QPs
+
+        minimize    (1/2)*x'*P_k*x + q_k'*x 
+        subject to  G*x <= h_k
+                    A*x = b_k
+
+    for k = 0, ..., N-1, with the same G and A.  P, q, h and b are lists
+    of N matrices, or one matrix for all problems.  G and h can be None,
+    as in coneqp(), for problems with only equality constraints.  Returns
+    the list of the N solutions, with the keys of the solution of 
+    coneqp() and the status 'optimal' or 'unknown'.
+
+    The problems are solved in chunks of BATCH_SIZE with the algorithm 
+    of coneqp(), in lockstep:  the iterates are matrices with a column 
+    per problem, and a problem is removed from them when it has 
+    converged.  The products with G and A, and the updates of the 
+    iterates and the scaling, are computed for all problems together.  
+    The Cholesky factorizations of the KKT systems are computed and 
+    solved one problem at a time (see batch_factor() and batch_solve()).
+
+    The problems must be small (see SMALL_SIZE):  the factorizations of
+    a chunk are stored as n x n*BATCH_SIZE matrices.  options is as in 
+    coneqp().
+    """
+
+    from cvxopt.base import matrix, spmatrix
+
+    if options is None: options = globals()['options']
+
+    try: MAXITERS = options['maxiters']
+    except KeyError: MAXITERS = 100
+    else: 
+        if type(MAXITERS) is not int or MAXITERS < 1: 
+            raise ValueError("options['maxiters'] must be a positive "\
+                "integer")
+
+    try: ABSTOL = options['abstol']
+    except KeyError: ABSTOL = 1e-7
+    else: 
+        if type(ABSTOL) is not float and type(ABSTOL) is not int: 
+            raise ValueError("options['abstol'] must be a scalar")
+
+    try: RELTOL = options['reltol']
+    except KeyError: RELTOL = 1e-6
+    else: 
+        if type(RELTOL) is not float and type(RELTOL) is not int: 
+            raise ValueError("options['reltol'] must be a scalar")
+
+    if RELTOL <= 0.0 and ABSTOL <= 0.0 :
+        raise ValueError("at least one of options['reltol'] and " \
+            "options['abstol'] must be positive")
+
+    try: FEASTOL = options['feastol']
+    except KeyError: FEASTOL = 1e-7
+    else: 
+        if (type(FEASTOL) is not float and type(FEASTOL) is not int) or \
+            FEASTOL <= 0.0:
+            raise ValueError("options['feastol'] must be a positive "\
+                "scalar")
+
+    try: correction = options['use_correction']
+    except KeyError: correction = True
+
+    try: show_progress = options['show_progress']
+    except KeyError: show_progress = True
+
+    lists = [ x for x in (P, q, h, b) if type(x) is list ]
+    if lists: N = len(lists[0])
+    else: N = 1
+    if [ x for x in lists if len(x) != N or not x ]:
+        raise TypeError("the lists 'P', 'q', 'h', 'b' must have the same "\
+            "nonzero length")
+
+    if G is None:
+        if type(q) is list: q0 = q[0]
+        else: q0 = q
+        if type(q0) not in (matrix, spmatrix):
+            raise TypeError("'q' must be a 'd' matrix or a list of such "\
+                "matrices")
+        G = spmatrix([], [], [], (0, q0.size[0]))
+    if type(G) not in (matrix, spmatrix) or G.typecode != 'd':
+        raise TypeError("'G' must be a 'd' matrix")
+    m, n = G.size
+    if h is None: h = matrix(0.0, (0, 1))
+    if A is None: A = spmatrix([], [], [], (0, n))
+    if type(A) not in (matrix, spmatrix) or A.typecode != 'd' or \
+        A.size[1] != n:
+        raise TypeError("'A' must be a 'd' matrix with %d columns" %n)
+    p = A.size[0]
+    if b is None: b = matrix(0.0, (p, 1))
+    if p > n:
+        raise ValueError("Rank(A) < p or Rank([P; A; G]) < n")
+
+    sols = []
+    for first in xrange(0, N, BATCH_SIZE):
+        chunk = [ P, q, h, b ]
+        for k in xrange(4):
+            if type(chunk[k]) is list: 
+                chunk[k] = chunk[k][first : first + BATCH_SIZE]
+        PP = batch_stack(chunk[0], (n, n), 'P')
+        PP.size = (n*n, PP.size[1]/n)
+        sols += qp_lockstep(PP, batch_stack(chunk[1], (n, 1), 'q'), G,
+            batch_stack(chunk[2], (m, 1), 'h'), A, 
+            batch_stack(chunk[3], (p, 1), 'b'), first, MAXITERS, ABSTOL, 
+            RELTOL, FEASTOL, correction, show_progress)
+    return sols
+
+
+def batch_stack(x, size, name):
+    """
+    Returns the matrices in the list x side by side, as a dense matrix.
+    """
+
+    from cvxopt.base import matrix, spmatrix
+
+    if type(x) is not list: x = [ x ]
+    if [ xk for xk in x if type(xk) not in (matrix, spmatrix) or 
+        xk.typecode != 'd' or xk.size != size ]:
+        raise TypeError("'%s' must be a 'd' matrix of size (%d,%d) or a "\
+            "list of such matrices" %(name, size[0], size[1]))
+    return matrix([ [matrix(xk)] for xk in x ])
+
+
+def qp_lockstep(PP, Q, G, Hh, A, B, first = 0, MAXITERS = 100, 
+    ABSTOL = 1e-7, RELTOL = 1e-6, FEASTOL = 1e-7, correction = True, 
+    show_progress = True):
+    """
+    Solves the problems of qp_batch() in lockstep, with the iteration of 
+    coneqp_small().  PP has the columns vec(P_k) and Q, Hh, B the columns 
+    q_k, h_k, b_k, or one column for all problems.  first is the number 
+    of the first problem, for error messages.
+    """
+
+    from cvxopt import base, blas
+    from cvxopt.base import matrix
+
+    EXPON = 3
+    STEP = 0.99
+
+    m, n = G.size
+    p = A.size[0]
+    N = max(PP.size[1], Q.size[1], Hh.size[1], B.size[1])
+    G, A = matrix(G), matrix(A)
+
+    # Problem data with one column per problem.
+    PP, Q, Hh, B = [ V[:, N * [0]] if V.size[1] < N else V for V in (PP, 
+        Q, Hh, B) ]
+
+    # M[:, i] = vec(G[i,:]' * G[i,:]), so vec(G'*diag(w)*G) = M*w.
+    M = matrix(0.0, (n*n, m))
+    for i in xrange(m):
+        M[:, i] = (G[i, :].T * G[i, :])[:]
+    GT, AT = G.T, A.T
+
+    # Row vectors for column sums and for repeating a row m, n, p times.
+    en, em, ep = matrix(1.0, (1, n)), matrix(1.0, (1, m)), matrix(1.0, 
+        (1, p))
+    rn, rm, rp = n * [0], m * [0], p * [0]
+
+    # idx[j] is the problem in column j. 
+    idx = range(N)
+    sols = N * [None]
+
+    resx0 = base.sqrt(en * base.mul(Q, Q))
+    resy0 = base.sqrt(ep * base.mul(B, B))
+    resz0 = base.sqrt(em * base.mul(Hh, Hh))
+
+    # Initial points, as in coneqp():  the solutions of the KKT systems 
+    # with right-hand sides (-q, b, h) and W = I, and s = -z.
+    DI = matrix(1.0, (m, N))
+    HH, YY, SS, failed = batch_factor(PP, M, DI, AT)
+    if failed:
+        raise ValueError("Rank(A) < p or Rank([P; A; G]) < n for "\
+            "problem %d" %(first + failed[0]))
+    X, Y, Z = -Q, +B, +Hh
+    batch_solve(HH, YY, SS, G, DI, X, Y, Z)
+    S = -Z
+    if m:
+        for V in (S, Z):
+            for j in xrange(N):
+                t = -min(V[:, j])
+                if t >= -1e-8 * max(blas.nrm2(V[:, j]), 1.0):
+                    V[:, j] = V[:, j] + (1.0 + t)
+
+    # Scaling D = sqrt(S ./ Z), DI = D.^{-1}, L = sqrt(S .* Z).
+    D = base.sqrt(base.div(S, Z))
+    DI = D**-1
+    L = base.sqrt(base.mul(S, Z))
+    gap = em * base.mul(L, L)
 
-        # Unscale s, z (unscaled variables are used only to compute 
-        # feasibility residuals).
+    for iters in xrange(MAXITERS + 1):
 
-        blas.copy(lmbda, s, n = dims['l'] + sum(dims['q']))
-        ind = dims['l'] + sum(dims['q'])
-        ind2 = ind
-        for m in dims['s']:
-            blas.scal(0.0, s, offset = ind2)
-            blas.copy(lmbda, s, offsetx = ind, offsety = ind2, n = m, 
-                incy = m+1)
-            ind += m
-            ind2 += m*m
-        misc.scale(s, W, trans = 'T')
+        # f0 = (1/2)*x'*P*x + q'*x and RX = P*X + Q + A'*Y + G'*Z.
+        RX = +Q
+        for j in xrange(len(idx)):
+            blas.symv(PP, X, RX, n = n, ldA = n, offsetA = j*n*n, 
+                offsetx = j*n, offsety = j*n, beta = 1.0)
+        f0 = 0.5 * en * (base.mul(X, RX) + base.mul(X, Q))
+        RX += AT * Y + GT * Z
 
-        blas.copy(lmbda, z, n = dims['l'] + sum(dims['q']))
-        ind = dims['l'] + sum(dims['q'])
-        ind2 = ind
-        for m in dims['s']:
-            blas.scal(0.0, z, offset = ind2)
-            blas.copy(lmbda, z, offsetx = ind, offsety = ind2, n = m, 
-                incy = m+1)
-            ind += m
-            ind2 += m*m
-        misc.scale(z, W, inverse = 'I')
+        # RY = A*X - B,  RZ = S + G*X - H 
+        RY = A * X - B
+        RZ = S + G * X - Hh
 
-        gap = blas.dot(lmbda, lmbda) 
-        helpers.sp_create("eol", 8900)
-        #print "== gap = %.17f" % gap
+        pcost = f0
+        dcost = f0 + ep * base.mul(Y, RY) + em * base.mul(Z, RZ) - gap
+        resx = base.sqrt(en * base.mul(RX, RX))
+        resy = base.sqrt(ep * base.mul(RY, RY))
+        resz = base.sqrt(em * base.mul(RZ, RZ))
+
+        # Stopping criteria of coneqp() for each problem.  A problem that
+        # has converged is removed, and so is a problem with a singular
+        # KKT matrix, as in coneqp().  Without inequalities (m = 0), the
+        # initial point is the solution, as in coneqp().
+        stats, done = [], []
+        for j in xrange(len(idx)):
+            if pcost[j] < 0.0:
+                relgap = gap[j] / -pcost[j]
+            elif dcost[j] > 0.0:
+                relgap = gap[j] / dcost[j]
+            else:
+                relgap = None
+            pres = max(resy[j] / max(1.0, resy0[j]), resz[j] / 
+                max(1.0, resz0[j]))
+            dres = resx[j] / max(1.0, resx0[j])
+            stats.append((relgap, pres, dres))
+            if ( pres <= FEASTOL and dres <= FEASTOL and ( gap[j] <= 
+                ABSTOL or (relgap is not None and relgap <= RELTOL) )) or \
+                iters == MAXITERS or not m:
+                done.append(j)
+
+        keep = frozenset(done)
+        keep = [ j for j in xrange(len(idx)) if j not in keep ]
+        HH, YY, SS, failed = batch_factor(PP[:, keep], M, 
+            base.mul(DI[:, keep], DI[:, keep]), AT)
+        if failed:
+            blocks = frozenset(failed)
+            blocks = [ k for k in xrange(len(keep)) if k not in blocks ]
+            failed = [ keep[k] for k in failed ]
+            HH.size, YY.size, SS.size = (n*n, len(keep)), (n*p, len(keep)),\
+                (p*p, len(keep))
+            HH, YY, SS = HH[:, blocks], YY[:, blocks], SS[:, blocks]
+            HH.size, YY.size, SS.size = (n, n*len(blocks)), (n, 
+                p*len(blocks)), (p, p*len(blocks))
+            keep = [ keep[k] for k in blocks ]
+
+        for j in done + failed:
+            if iters == MAXITERS or j in failed: status = 'unknown'
+            else: status = 'optimal'
+            sols[idx[j]] = { 'x': X[:, j], 'y': Y[:, j], 's': S[:, j], 
+                'z': Z[:, j], 'status': status, 'gap': gap[j], 
+                'relative gap': stats[j][0], 
+                'primal objective': pcost[j], 'dual objective': dcost[j], 
+                'primal infeasibility': stats[j][1], 
+                'dual infeasibility': stats[j][2], 
+                'primal slack': min(S[:, j]) if m else 0.0, 
+                'dual slack': min(Z[:, j]) if m else 0.0, 
+                'iterations': iters }
+
+        if len(keep) < len(idx):
+            X, Y, S, Z, D, DI, L, PP, Q, Hh, B, RX, RY, RZ, gap, resx0, \
+                resy0, resz0 = [ V[:, keep] for V in (X, Y, S, Z, D, DI,
+                L, PP, Q, Hh, B, RX, RY, RZ, gap, resx0, resy0, resz0) ]
+            idx = [ idx[j] for j in keep ]
+        if show_progress:
+            print("%2d: %d problems remaining" %(iters, len(idx)))
+        if not idx: break
+        N = len(idx)
+
+        # Predictor and corrector steps of coneqp() for all problems, 
+        # with
+        #
+        #     DS = -L o L + sigma*mu*e (i = 0)
+        #        = -L o L - dsa o dza + sigma*mu*e (i = 1)
+        #     (DX, DY, DZ) = -(RX, RY, RZ).
+
+        LL = base.mul(L, L)
+        mu = gap / m
+        sigma = matrix(0.0, (1, N))
+        step = matrix(0.0, (1, N))
+        for i in xrange(2):
+            if i == 1 and correction: DS = -LL - WS3
+            else: DS = -LL
+            DS += base.mul(sigma, mu)[rm, :]
+            DX, DY, DZ = -RX, -RY, -RZ
+
+            # DS := L o\ DS, DZ := DZ - D o DS
+            DS = base.div(DS, L)
+            DZ -= base.mul(D, DS)
+            batch_solve(HH, YY, SS, G, DI, DX, DY, DZ)
+            DS -= DZ
+
+            # dsdz = <ds, dz>.  Save ds o dz for Mehrotra correction.
+            WS3 = base.mul(DS, DZ)
+            dsdz = em * WS3
+
+            # Maximum steps to boundary, in the current scaling.
+            DS, DZ = base.div(DS, L), base.div(DZ, L)
+            for j in xrange(N):
+                t = max(0.0, -min(DS[:, j]), -min(DZ[:, j]))
+                if t == 0.0:
+                    step[j] = 1.0
+                elif i == 0:
+                    step[j] = min(1.0, 1.0 / t)
+                else:
+                    step[j] = min(1.0, STEP / t)
+                if i == 0:
+                    sigma[j] = min(1.0, max(0.0, 1.0 - step[j] + 
+                        dsdz[j]/gap[j] * step[j]**2))**EXPON
 
+        X += base.mul(step[rn, :], DX)
+        Y += base.mul(step[rp, :], DY)
+
+        # DS := L o (e + step*DS), DZ := L o (e + step*DZ), the updated
+        # S and Z in the current scaling, and the new scaling 
+        #
+        #     D := D .* sqrt(DS ./ DZ),  L := sqrt(DS .* DZ).
+        DS = base.mul(L, 1.0 + base.mul(step[rm, :], DS))
+        DZ = base.mul(L, 1.0 + base.mul(step[rm, :], DZ))
+        D = base.mul(D, base.sqrt(base.div(DS, DZ)))
+        DI = D**-1
+        L = base.sqrt(base.mul(DS, DZ))
+        S, Z = base.mul(D, L), base.mul(DI, L)
+        gap = em * base.mul(L, L)
 
+    return sols
 
 
 def lp(c, G, h, A = None, b = None, solver = None, primalstart = None,
@@ -2275,19 +4383,403 @@ def socp(c, Gl = None, hl = None, Gq = None, hq = None, A = None, b = None,
 
 
 def qp(P, q, G = None, h = None, A = None, b = None, solver = None, 
-    initvals = None):
-    from cvxopt import base, blas
-    from cvxopt.base import matrix, spmatrix
-    return coneqp(P, q, G, h, None, A,  b, initvals, kktsolver='ldl')
+    initvals = None, options = None):
+
+    return problem_solve(qp_problem(P, q, G, h, A, b, options), initvals = 
+        initvals, options = options)
 
 
 
 
 def lp(c, G, h, A = None, b = None, solver = None, primalstart = None,
-    dualstart = None):
+    dualstart = None, options = None):
+
+    return problem_solve(lp_problem(c, G, h, A, b, options), primalstart = 
+        primalstart, dualstart = dualstart, options = options)
+
+
+def socp(c, Gl = None, hl = None, Gq = None, hq = None, A = None, b = None,
+    solver = None, primalstart = None, dualstart = None, options = None):
+
+    return problem_solve(socp_problem(c, Gl, hl, Gq, hq, A, b, options), 
+        primalstart = primalstart, dualstart = dualstart, options = options)
+
+    
+def sdp_declared(Gl, Gs, ms, n):
+    """
+    Structured constraint matrix for sdp(), used by localmisc.kkt_chol
+    and localmisc.struct_sgemv.
+
+    Gs[k] is an m**2 x n matrix, or a list of n column declarations, 
+    each one of
+
+        None                 a zero column
+        X                    an m x m matrix or spmatrix
+        ('diag', d)          diag(d), with d a vector of length m
+        ('lowrank', U, V)    (U*V' + V*U')/2, with U, V of size m x r.
+
+    Only the lower triangular parts of the matrices X and of the columns
+    of an m**2 x n Gs[k] are referenced.  Returns a dictionary with 
+    G['l'] = Gl and, for each block, a dictionary G['s'][k] with the 
+    sparse columns ('G', with full symmetric columns), the diagonal 
+    columns ('D', 'dcols') and the low rank columns ('U', 'V', 'lcols').
+    """
+
+    from cvxopt import matrix, spmatrix, sparse
+
+    G = {'l': Gl, 's': []}
+    for k in xrange(len(Gs)):
+        m, Gk = ms[k], Gs[k]
+        I, J, V, D, dcols, U, Vl, lcols = [], [], [], [], [], [], [], []
+        if type(Gk) is list: 
+            cols = Gk
+        else: 
+            Gk = sparse(Gk)
+            cols = [ Gk[:, j] for j in xrange(n) ]
+        for j in xrange(n):
+            Xj = cols[j]
+            if Xj is None: continue
+            if type(Xj) is tuple and Xj[0] == 'diag':
+                if len(Xj[1]) != m: 
+                    raise TypeError("diagonal of Gs[%d] column %d must "\
+                        "have length %d" %(k, j, m))
+                D += list(Xj[1])
+                dcols.append(j)
+            elif type(Xj) is tuple and Xj[0] == 'lowrank':
+                Uj, Vj = matrix(Xj[1], tc = 'd'), matrix(Xj[2], tc = 'd')
+                if Uj.size[0] != m or Uj.size != Vj.size:
+                    raise TypeError("factors of Gs[%d] column %d must "\
+                        "have %d rows and equal sizes" %(k, j, m))
+                U.append(Uj)
+                Vl.append(Vj)
+                lcols.append(j)
+            elif type(Xj) in (matrix, spmatrix) and Xj.typecode == 'd' \
+                and Xj.size in ((m, m), (m**2, 1)):
+                # Full symmetric pattern from the lower triangle.
+                Xj = sparse(Xj)
+                if Xj.size == (m, m): rc = zip(Xj.I, Xj.J)
+                else: rc = [ (i % m, i / m) for i in Xj.I ]
+                for (a, b), v in zip(rc, Xj.V):
+                    if a < b: continue
+                    I.append(a + b*m);  J.append(j);  V.append(v)
+                    if a > b:
+                        I.append(b + a*m);  J.append(j);  V.append(v)
+            else:
+                raise TypeError("invalid declaration for column %d of "\
+                    "Gs[%d]" %(j, k))
+        G['s'].append({'G': spmatrix(V, I, J, (m**2, n), 'd'), 
+            'D': matrix(D, (m, len(dcols)), 'd'), 'dcols': dcols,
+            'U': U, 'V': Vl, 'lcols': lcols})
+    return G
+
+
+def chordal_cliques(m, I, J):
+    """
+    Returns the maximal cliques of a chordal extension of the graph with
+    vertices 0, ..., m-1 and edges (I[k], J[k]), as sorted lists of 
+    vertices.
+
+    The extension is the filled graph of a symbolic Cholesky 
+    factorization in approximate minimum degree order.  The clique of 
+    vertex v is v and its higher numbered neighbours in the filled graph;
+    it is maximal unless it is the set of higher neighbours of one of
+    the children of v in the elimination tree.
+    """
+
+    from cvxopt import amd, spmatrix
+
+    perm = list(amd.order(spmatrix(1.0, list(I) + list(range(m)), 
+        list(J) + list(range(m)), (m, m))))
+    order = m * [0]
+    for k in range(m): order[perm[k]] = k
+
+    adj = [ set() for v in range(m) ]
+    for i, j in zip(I, J):
+        if i != j:
+            adj[i].add(j)
+            adj[j].add(i)
+
+    # Symbolic elimination.  The higher neighbours of v, except its 
+    # parent, are added to the neighbours of the parent.
+    higher, parent = m * [None], m * [None]
+    for v in perm:
+        higher[v] = set([ u for u in adj[v] if order[u] > order[v] ])
+        if higher[v]:
+            parent[v] = min(higher[v], key = lambda u: order[u])
+            adj[parent[v]] |= higher[v] - set([parent[v]])
+
+    nonmax = set([ parent[u] for u in range(m) if parent[u] is not None 
+        and len(higher[u]) == len(higher[parent[u]]) + 1 ])
+    return [ sorted([v] + list(higher[v])) for v in perm if v not in 
+        nonmax ]
+
+
+def chordal_convert(c, Gl, Gs, hs, A):
+    """
+    Chordal conversion of the 's' constraints of sdp().
+
+    Each block hs[k] - sum_i x_i * mat(Gs[k][:,i]) is replaced by one 
+    block per clique of a chordal extension of its aggregate sparsity 
+    pattern, if the sum of the cubes of the clique sizes is less than 
+    half of m**3.  A sparse matrix S with a chordal pattern is positive 
+    semidefinite iff it is a sum of positive semidefinite matrices 
+    supported on the cliques, so every entry (i,j) that belongs to t > 1
+    cliques is split with t-1 new free variables y:
+    
+        S_1[i,j] = S[i,j] - sum_k y_k,  S_k[i,j] = y_k,  k = 2, ..., t.
+
+    The new variables have zero cost and zero columns in Gl and A.
+
+    Returns None if no block is converted.  Otherwise returns a 
+    dictionary with the converted problem data 'c', 'Gl', 'Gs', 'hs', 
+    'A', and the entries 'n' (the original number of variables), 'nv' 
+    (the number of new variables) and 'cliques' (for each original 
+    block, its size and its list of cliques) used by chordal_recover(),
+    and 'sizes' and 'positions' used by chordal_hs().
+    """
+
+    from cvxopt import matrix, spmatrix, sparse
+
+    n = c.size[0]
+    cliques = []
+    converted = False
+    for k in range(len(Gs)):
+        m = hs[k].size[0]
+        Gk, hk = sparse(Gs[k]), sparse(hs[k])
+        E = set([ (max(r % m, r / m), min(r % m, r / m)) for r in Gk.I ])
+        E |= set([ (max(i, j), min(i, j)) for i, j in zip(hk.I, hk.J) ])
+        C = chordal_cliques(m, [ e[0] for e in E ], [ e[1] for e in E ])
+        if sum([ len(Ck)**3 for Ck in C ]) < m**3 / 2.0:
+            converted = True
+        else:
+            C = [ list(range(m)) ]
+        cliques.append((m, C))
+    if not converted: 
+        return None
+
+    # The new blocks, stored as triplet lists (V, I, J) for Gs and dense 
+    # matrices for hs.  Variable n+k is the kth splitting variable.
+    # positions[k][i,j], for i >= j in a clique of block k, is the new 
+    # block of the entry (in its first clique) and its local row and 
+    # column indices i, j in that block.
+    GV, GI, GJ, sizes, positions = [], [], [], [], []
+    nv = 0
+    for k in range(len(Gs)):
+        m, C = cliques[k]
+        q0 = len(sizes)
+        loc, owners = [], {}
+        for q in range(len(C)):
+            loc.append(dict([ (C[q][a], a) for a in range(len(C[q])) ]))
+            for a in range(len(C[q])):
+                for b in range(a+1):
+                    owners.setdefault((C[q][a], C[q][b]), []).append(q)
+            GV.append([]);  GI.append([]);  GJ.append([])
+            sizes.append(len(C[q]))
+        positions.append(dict([ ((i, j), (q0 + Q[0], loc[Q[0]][i], 
+            loc[Q[0]][j])) for (i, j), Q in owners.items() ]))
+
+        Gk = sparse(Gs[k])
+        for r, j, v in zip(Gk.I, Gk.J, Gk.V):
+            q, a = chordal_position(positions[k], sizes, r % m, r / m)
+            GV[q].append(v);  GI[q].append(a);  GJ[q].append(j)
+
+        for (i, j), Q in owners.items():
+            for q in Q[1:]:
+                for sign, qk in [ (1.0, Q[0]), (-1.0, q) ]:
+                    mk = len(C[qk])
+                    a, b = loc[qk][i], loc[qk][j]
+                    rows = [ a + b*mk ]
+                    if a != b: rows.append(b + a*mk)
+                    GV[q0+qk] += len(rows) * [ sign ]
+                    GI[q0+qk] += rows
+                    GJ[q0+qk] += len(rows) * [ n + nv ]
+                nv += 1
+
+    def extend(M):
+        M = sparse(M) if M.size[0] else spmatrix([], [], [], M.size)
+        return spmatrix(M.V, M.I, M.J, (M.size[0], n + nv))
+
+    conv = {'n': n, 'nv': nv, 'cliques': cliques, 'sizes': sizes, 
+        'positions': positions, 
+        'c': matrix([ c, matrix(0.0, (nv, 1)) ]), 
+        'Gl': extend(Gl), 'A': extend(A), 
+        'Gs': [ spmatrix(GV[q], GI[q], GJ[q], (sizes[q]**2, n+nv)) 
+            for q in range(len(sizes)) ]}
+    conv['hs'] = chordal_hs(conv, hs)
+    return conv
+
+
+def chordal_position(pos, sizes, i, j):
+    """
+    Returns the new block and the index in it of the entry (i,j) of an 
+    original block with positions pos (see chordal_convert()).
+    """
+
+    q, a, b = pos[(max(i, j), min(i, j))]
+    if i < j: a, b = b, a
+    return q, a + b * sizes[q]
+
+
+def chordal_hs(conv, hs):
+    """
+    Returns the clique blocks of the right-hand sides hs of the 's' 
+    constraints of a problem converted by chordal_convert().  Raises 
+    ValueError if hs[k] has a nonzero outside the chordal extension of 
+    the pattern of block k.
+    """
+
+    from cvxopt import matrix, sparse
+
+    hnew = [ matrix(0.0, (mk, mk)) for mk in conv['sizes'] ]
+    for k in xrange(len(hs)):
+        hk = sparse(hs[k])
+        for i, j, v in zip(hk.I, hk.J, hk.V):
+            try: q, a = chordal_position(conv['positions'][k], 
+                conv['sizes'], i, j)
+            except KeyError:
+                raise ValueError("hs[%d] has a nonzero outside the "\
+                    "sparsity pattern of the converted block" %k)
+            hnew[q][a] = v
+    return hnew
+
+
+def chordal_recover(sol, conv):
+    """
+    Maps the solution of a problem converted by chordal_convert() back to
+    the original problem.  
+    
+    sol['ss'][k] is the sum of the clique blocks of the kth original 
+    block.  The clique blocks of sol['zs'] agree on their overlaps and 
+    give the entries of sol['zs'][k] on the pattern of the chordal 
+    extension; the other entries are those of the maximum determinant 
+    positive definite completion (see chordal_complete()).  If a clique 
+    block is singular, the other entries are left zero.
+    """
+
+    from cvxopt import matrix
+
+    if sol['x'] is not None:
+        sol['x'] = sol['x'][:conv['n']]
+    for key, add in [ ('ss', True), ('zs', False) ]:
+        if sol[key] is None: continue
+        blocks, q = [], 0
+        for m, C in conv['cliques']:
+            X = matrix(0.0, (m, m))
+            for Ck in C:
+                if add: X[Ck, Ck] = X[Ck, Ck] + sol[key][q]
+                else: X[Ck, Ck] = sol[key][q]
+                q += 1
+            if not add and len(C) > 1:
+                try: X = chordal_complete(X, C)
+                except ArithmeticError: pass
+            blocks.append(X)
+        sol[key] = blocks
+
+
+def chordal_complete(X, C):
+    """
+    Returns the maximum determinant positive definite completion of the 
+    m x m matrix X, given on the chordal pattern with maximal cliques C 
+    (a list of lists of indices).  Raises ArithmeticError if a clique 
+    submatrix of X is not positive definite.
+
+    The inverse W of the completion is zero outside the pattern.  With 
+    a perfect elimination ordering of the pattern, computed by maximum 
+    cardinality search, and I the higher neighbours of vertex j in that
+    ordering, its factorization W = L * D * L' is
+    
+        L[I, j] = -X[I, I]^{-1} * X[I, j],  
+        D[j, j] = 1 / (X[j, j] + X[j, I] * L[I, j]),
+
+    and the completion is L^{-T} * D^{-1} * L^{-1}.
+    """
+
+    from cvxopt import matrix, base, blas, lapack, misc
+
+    m = X.size[0]
+    adj = [ set() for v in xrange(m) ]
+    for Ck in C:
+        for v in Ck: adj[v] |= set(Ck) - set([v])
+
+    # Maximum cardinality search numbers the vertices in reverse perfect
+    # elimination order.
+    weight, order = m * [0], []
+    free = set(xrange(m))
+    while free:
+        v = max(free, key = lambda u: weight[u])
+        free.remove(v)
+        order.append(v)
+        for u in adj[v] & free: weight[u] += 1
+    order.reverse()
+    pos = m * [0]
+    for k in xrange(m): pos[order[k]] = k
+
+    # L and D in the permuted order, with 1/D on the diagonal of L.
+    L = matrix(0.0, (m, m))
+    for j in xrange(m):
+        v = order[j]
+        I = sorted([ u for u in adj[v] if pos[u] > j ], 
+            key = lambda u: pos[u])
+        Xj = X[I, v]
+        if I:
+            XI = X[I, I]
+            lapack.posv(XI, Xj)
+            L[[ pos[u] for u in I ], j] = -Xj
+            L[j, j] = X[v, v] - blas.dot(X[I, v], Xj)
+        else:
+            L[j, j] = X[v, v]
+        if L[j, j] <= 0.0: raise ArithmeticError
+
+    # Y = L^{-T} * D^{-1} * L^{-1} = (L^{-T} * D^{-1/2}) * (...)'. 
+    d = L[::m+1]
+    L[::m+1] = 1.0
+    Y = matrix(0.0, (m, m))
+    Y[::m+1] = base.sqrt(d)
+    blas.trsm(L, Y, transA = 'T', diag = 'U')
+    Z = matrix(0.0, (m, m))
+    blas.syrk(Y, Z)
+    misc.symm(Z, m)
+    return Z[pos, pos]
+
+
+def problem_new(kind, c, G, h, dims, A, b, kktsolver = None, P = None,
+    options = None):
+    """
+    Returns a problem for problem_solve() with checked data.  kind is 
+    'lp', 'socp' or 'sdp' (solved by conelp()) or 'qp' (solved by 
+    coneqp(), with P and the linear term c).
+
+    The problem is a dictionary with the arguments, and the cone 
+    dimensions 'hdims' of h.  1-dimensional 'q' cones and 1 x 1 and 
+    2 x 2 's' blocks are rewritten here, once, as in conelp() (see 
+    cone_presolve()), if options['presolve'] is true:  'pre' is 
+    then the result of cone_presolve(), and 'G' and 'dims' are the 
+    rewritten data passed to the solver.  options is as in conelp().
+    """
+
+    from cvxopt import matrix, spmatrix
+
+    if options is None: options = globals()['options']
+
+    pre = None
+    try: presolve = options['presolve']
+    except KeyError: presolve = False
+    if presolve and type(G) in (matrix, spmatrix) and (kktsolver is None 
+        or type(kktsolver) is str):
+        pre = cone_presolve(G, h, dims)
+    PR = {'kind': kind, 'c': c, 'P': P, 'h': h, 'hdims': dims, 'A': A, 
+        'b': b, 'kktsolver': kktsolver, 'pre': pre, 'conv': None}
+    if pre is None: PR['G'], PR['dims'] = G, dims
+    else: PR['G'], PR['dims'] = pre['G'], pre['dims']
+    return PR
+
+
+def lp_problem(c, G, h, A = None, b = None, options = None):
+    """
+    Returns the LP of lp() as a problem for problem_solve().  The 
+    arguments are checked once, here.
+    """
 
-    import math
-    from cvxopt import base, blas, misc
     from cvxopt.base import matrix, spmatrix
 
     if type(c) is not matrix or c.typecode != 'd' or c.size[1] != 1: 
@@ -2313,16 +4805,58 @@ def lp(c, G, h, A = None, b = None, solver = None, primalstart = None,
     if type(b) is not matrix or b.typecode != 'd' or b.size != (p,1): 
         raise TypeError("'b' must be a dense matrix of size (%d,1)" %p)
 
+    return problem_new('lp', c, G, h, {'l': m, 'q': [], 's': []}, A, b,
+        options = options)
 
-    return conelp(c, G, h, {'l': m, 'q': [], 's': []}, A,  b, primalstart,
-        dualstart)
 
+def qp_problem(P, q, G = None, h = None, A = None, b = None, 
+    options = None):
+    """
+    Returns the QP of qp() as a problem for problem_solve().  The 
+    arguments are checked once, here.
+    """
 
-def socp(c, Gl = None, hl = None, Gq = None, hq = None, A = None, b = None,
-    solver = None, primalstart = None, dualstart = None):
+    from cvxopt.base import matrix, spmatrix
 
+    if type(q) is not matrix or q.typecode != 'd' or q.size[1] != 1:
+        raise TypeError("'q' must be a 'd' matrix with one column")
+    n = q.size[0]
+    if type(P) not in (matrix, spmatrix) or P.typecode != 'd' or \
+        P.size != (n, n):
+        raise TypeError("'P' must be a 'd' matrix of size (%d, %d)" 
+            %(n, n))
+
+    if G is None: G = spmatrix([], [], [], (0, n), 'd')
+    if type(G) not in (matrix, spmatrix) or G.typecode != 'd' or \
+        G.size[1] != n:
+        raise TypeError("'G' must be a dense or sparse 'd' matrix "\
+            "with %d columns" %n)
+    m = G.size[0]
+    if h is None: h = matrix(0.0, (0,1))
+    if type(h) is not matrix or h.typecode != 'd' or h.size != (m,1):
+        raise TypeError("'h' must be a 'd' matrix of size (%d,1)" %m)
+
+    if A is None: A = spmatrix([], [], [], (0, n), 'd')
+    if type(A) not in (matrix, spmatrix) or A.typecode != 'd' or \
+        A.size[1] != n:
+        raise TypeError("'A' must be a dense or sparse 'd' matrix "\
+            "with %d columns" %n)
+    p = A.size[0]
+    if b is None: b = matrix(0.0, (0,1))
+    if type(b) is not matrix or b.typecode != 'd' or b.size != (p,1): 
+        raise TypeError("'b' must be a dense matrix of size (%d,1)" %p)
+
+    return problem_new('qp', q, G, h, {'l': m, 'q': [], 's': []}, A, b, 
+        'ldl', P, options = options)
+
+
+def socp_problem(c, Gl = None, hl = None, Gq = None, hq = None, A = None, 
+    b = None, options = None):
+    """
+    Returns the SOCP of socp() as a problem for problem_solve().  The 
+    arguments are checked, and Gl and Gq stacked in one G, once, here.
+    """
 
-    from cvxopt import base, blas
     from cvxopt.base import matrix, spmatrix
 
     if type(c) is not matrix or c.typecode != 'd' or c.size[1] != 1: 
@@ -2349,7 +4883,7 @@ def socp(c, Gl = None, hl = None, Gq = None, hq = None, A = None, b = None,
         raise TypeError("'Gq' must be a list of sparse or dense 'd' "\
             "matrices with %d columns" %n)
     mq = [ G.size[0] for G in Gq ]
-    a = [ k for k in range(len(mq)) if mq[k] == 0 ] 
+    a = [ k for k in xrange(len(mq)) if mq[k] == 0 ] 
     if a: raise TypeError("the number of rows of Gq[%d] is zero" %a[0])
     if hq is None: hq = []
     if type(hq) is not list or len(hq) != len(mq) or [ h for h in hq if
@@ -2357,7 +4891,7 @@ def socp(c, Gl = None, hl = None, Gq = None, hq = None, A = None, b = None,
         h.typecode != 'd' ]: 
         raise TypeError("'hq' must be a list of %d dense or sparse "\
             "'d' matrices" %len(mq))
-    a = [ k for k in range(len(mq)) if hq[k].size != (mq[k], 1) ]
+    a = [ k for k in xrange(len(mq)) if hq[k].size != (mq[k], 1) ]
     if a:
         k = a[0]
         raise TypeError("'hq[%d]' has size (%d,%d).  Expected size "\
@@ -2376,7 +4910,6 @@ def socp(c, Gl = None, hl = None, Gq = None, hq = None, A = None, b = None,
     dims = {'l': ml, 'q': mq, 's': []}
     N = ml + sum(mq)
 
-
     h = matrix(0.0, (N,1))
     if type(Gl) is matrix or [ Gk for Gk in Gq if type(Gk) is matrix ]:
         G = matrix(0.0, (N, n))
@@ -2385,75 +4918,34 @@ def socp(c, Gl = None, hl = None, Gq = None, hq = None, A = None, b = None,
     h[:ml] = hl
     G[:ml,:] = Gl
     ind = ml
-    for k in range(len(mq)):
+    for k in xrange(len(mq)):
         h[ind : ind + mq[k]] = hq[k]
         G[ind : ind + mq[k], :] = Gq[k]
         ind += mq[k]
 
-    if primalstart:
-        ps = {}
-        ps['x'] = primalstart['x']
-        ps['s'] = matrix(0.0, (N,1))
-        if ml: ps['s'][:ml] = primalstart['sl']
-        if mq:
-            ind = ml
-            for k in range(len(mq)): 
-                ps['s'][ind : ind + mq[k]] = primalstart['sq'][k][:]
-                ind += mq[k]
-    else: 
-        ps = None
-
-    if dualstart:
-        ds = {}
-        if p:  ds['y'] = dualstart['y']
-        ds['z'] = matrix(0.0, (N,1))
-        if ml: ds['z'][:ml] = dualstart['zl']
-        if mq: 
-            ind = ml
-            for k in range(len(mq)):
-                ds['z'][ind : ind + mq[k]] = dualstart['zq'][k][:]
-                ind += mq[k]
-    else: 
-        ds = None
-
-    sol = conelp(c, G, h, dims, A = A, b = b, primalstart = ps, dualstart
-        = ds)
-    if sol['s'] is None:  
-        sol['sl'] = None
-        sol['sq'] = None
-    else: 
-        sol['sl'] = sol['s'][:ml]  
-        sol['sq'] = [ matrix(0.0, (m,1)) for m in mq ] 
-        ind = ml
-        for k in range(len(mq)):
-            sol['sq'][k][:] = sol['s'][ind : ind+mq[k]]
-            ind += mq[k]
-    del sol['s']
-
-    if sol['z'] is None: 
-        sol['zl'] = None
-        sol['zq'] = None
-    else: 
-        sol['zl'] = sol['z'][:ml]
-        sol['zq'] = [ matrix(0.0, (m,1)) for m in mq] 
-        ind = ml
-        for k in range(len(mq)):
-            sol['zq'][k][:] = sol['z'][ind : ind+mq[k]]
-            ind += mq[k]
-    del sol['z']
-
-    return sol
+    return problem_new('socp', c, G, h, dims, A, b, options = options)
 
-    
-def sdp(c, Gl = None, hl = None, Gs = None, hs = None, A = None, b = None, 
-    solver = None, primalstart = None, dualstart = None):
 
-    #print "start localcones.sdp ...."
+def sdp_problem(c, Gl = None, hl = None, Gs = None, hs = None, A = None, 
+    b = None, chordal = True, kktsolver = None, options = None):
+    """
+    Returns the SDP of sdp() as a problem for problem_solve().  The 
+    arguments are checked, Gl and Gs stacked in one G, the chordal 
+    conversion applied (if chordal and options['chordal'] are true; it 
+    is off by default), and the KKT solver for declared columns set up, 
+    once, here.
+
+    kktsolver is the KKT solver of conelp(), 'ldl' by default.  With 
+    'chol', or with 'auto' if kkt_select() chooses it, the Schur 
+    complement of a sparse G is assembled from its sparse columns (see 
+    localmisc.kkt_chol()).  It is ignored for declared columns.
+    """
 
     import math
-    from cvxopt import base, blas, misc
     from cvxopt.base import matrix, spmatrix
 
+    if options is None: options = globals()['options']
+
     if type(c) is not matrix or c.typecode != 'd' or c.size[1] != 1: 
         raise TypeError("'c' must be a dense column matrix")
     n = c.size[0]
@@ -2471,13 +4963,23 @@ def sdp(c, Gl = None, hl = None, Gs = None, hs = None, A = None, b = None,
         raise TypeError("'hl' must be a 'd' matrix of size (%d,1)" %ml)
 
     if Gs is None: Gs = []
-    if type(Gs) is not list or [ G for G in Gs if (type(G) is not matrix 
+    if type(Gs) is not list or [ G for G in Gs if ((type(G) is not matrix 
         and type(G) is not spmatrix) or G.typecode != 'd' or 
-        G.size[1] != n ]:
+        G.size[1] != n) and (type(G) is not list or len(G) != n) ]:
         raise TypeError("'Gs' must be a list of sparse or dense 'd' "\
-            "matrices with %d columns" %n)
-    ms = [ int(math.sqrt(G.size[0])) for G in Gs ]
-    a = [ k for k in range(len(ms)) if ms[k]**2 != Gs[k].size[0] ]
+            "matrices with %d columns, or of lists of %d column "\
+            "declarations" %(n, n))
+
+    # Gs[k] is a list of column declarations (see sdp_declared()); its 
+    # order is taken from hs[k].
+    declared = [ G for G in Gs if type(G) is list ]
+    if declared and (type(hs) is not list or len(hs) != len(Gs)):
+        raise TypeError("'hs' must be a list of %d dense or sparse "\
+            "'d' matrices" %len(Gs))
+    ms = [ type(Gs[k]) is list and hs[k].size[0] or 
+        int(math.sqrt(Gs[k].size[0])) for k in range(len(Gs)) ]
+    a = [ k for k in range(len(ms)) if type(Gs[k]) is not list and 
+        ms[k]**2 != Gs[k].size[0] ]
     if a: raise TypeError("the squareroot of the number of rows in "\
         "'Gs[%d]' is not an integer" %k)
     if hs is None: hs = []
@@ -2502,85 +5004,233 @@ def sdp(c, Gl = None, hl = None, Gs = None, hs = None, A = None, b = None,
     if type(b) is not matrix or b.typecode != 'd' or b.size != (p,1): 
         raise TypeError("'b' must be a dense matrix of size (%d,1)" %p)
 
+    # Chordal conversion of large sparse 's' blocks, if requested.
+    try: chordal = chordal and options['chordal']
+    except KeyError: chordal = False
+    conv = None
+    if chordal and ms and not declared:
+        conv = chordal_convert(c, Gl, Gs, hs, A)
+    ms0 = ms
+    if conv is not None:
+        c, Gl, Gs, hs, A = conv['c'], conv['Gl'], conv['Gs'], conv['hs'], \
+            conv['A']
+        n = c.size[0]
+        ms = [ hk.size[0] for hk in hs ]
+
     dims = {'l': ml, 'q': [], 's': ms}
     N = ml + sum([ m**2 for m in ms ])
 
-         
     h = matrix(0.0, (N,1))
-    if type(Gl) is matrix or [ Gk for Gk in Gs if type(Gk) is matrix ]:
+    if declared:
+        G = None
+    elif type(Gl) is matrix or [ Gk for Gk in Gs if type(Gk) is matrix ]:
         G = matrix(0.0, (N, n))
     else:
         G = spmatrix([], [], [], (N, n), 'd')
     h[:ml] = hl
-    G[:ml,:] = Gl
+    if G is not None: G[:ml,:] = Gl
     ind = ml
     for k in range(len(ms)):
         m = ms[k]
         h[ind : ind + m*m] = hs[k][:]
-        G[ind : ind + m*m, :] = Gs[k]
+        if G is not None: G[ind : ind + m*m, :] = Gs[k]
         ind += m**2
 
-    if primalstart:
-        ps = {}
-        ps['x'] = primalstart['x']
-        ps['s'] = matrix(0.0, (N,1))
-        if ml: ps['s'][:ml] = primalstart['sl']
-        if ms:
-            ind = ml
-            for k in range(len(ms)):
-                m = ms[k]
-                ps['s'][ind : ind + m*m] = primalstart['ss'][k][:]
-                ind += m**2
-    else: 
-        ps = None
+    # With declared columns, G is applied as an operator and kkt_chol is 
+    # called with the structured matrix.
+    if declared:
+        Gd = sdp_declared(Gl, Gs, ms, n)
+        def G(x, y, trans = 'N', alpha = 1.0, beta = 0.0):
+            localmisc.struct_sgemv(Gd, x, y, dims, trans = trans, 
+                alpha = alpha, beta = beta)
+        kktsolver = localmisc.kkt_chol(Gd, dims, A)
+    elif kktsolver is None: kktsolver = 'ldl'
+
+    PR = problem_new('sdp', c, G, h, dims, A, b, kktsolver, 
+        options = options)
+    PR['conv'], PR['ms'] = conv, ms0
+    return PR
+
+
+def problem_solve(PR, c = None, h = None, b = None, hl = None, hq = None,
+    hs = None, primalstart = None, dualstart = None, initvals = None, 
+    options = None):
+    """
+    Solves a problem returned by lp_problem(), qp_problem(), 
+    socp_problem() or sdp_problem(), with the vectors c (q for a QP), 
+    h, b or hl, hq, hs replaced by the given values, and returns the 
+    solution in the form of lp(), qp(), socp() or sdp().
+
+    Only the sizes of the new vectors are checked, and the matrices and
+    the KKT solver set up by the problem function are reused.  h is the 
+    right-hand side of an LP or QP, hl, hq and hs those of an SOCP or 
+    SDP.  primalstart and dualstart (initvals for a QP) are as in the 
+    corresponding functions, and options is passed to conelp() or 
+    coneqp().  For an SDP with a chordal conversion, starting points 
+    cannot be given, and the nonzeros of hs must be in the pattern of 
+    the conversion (see chordal_hs()).
+
+    A problem with declared 's' columns can be solved by one call at a 
+    time.
+    """
 
-    if dualstart:
-        ds = {}
-        if p:  ds['y'] = dualstart['y']
-        ds['z'] = matrix(0.0, (N,1))
-        if ml: ds['z'][:ml] = dualstart['zl']
-        if ms: 
-            ind = ml
-            for k in range(len(ms)):
-                m = ms[k]
-                ds['z'][ind : ind + m*m] = dualstart['zs'][k][:]
-                ind += m**2
-    else: 
-        ds = None
+    from cvxopt.base import matrix, spmatrix
 
-    #print "** h=\n", helpers.str2(h, "%.3f")
-    #print "** G=\n", helpers.str2(G, "%.3f")
+    kind, conv, hdims = PR['kind'], PR['conv'], PR['hdims']
+    ml, mq = hdims['l'], hdims['q']
+    n, p = PR['A'].size[1], PR['A'].size[0]
+    if conv is not None: n = conv['n']
+
+    hnew = [ v for v in (hl, hq, hs) if v is not None ]
+    if kind in ('lp', 'qp') and hnew or \
+        kind != 'socp' and hq is not None or \
+        kind != 'sdp' and hs is not None or \
+        kind in ('socp', 'sdp') and h is not None:
+        raise ValueError("invalid right-hand side for a problem of "\
+            "type '%s'" %kind)
+    if kind == 'qp' and (primalstart is not None or dualstart is not 
+        None) or kind != 'qp' and initvals is not None:
+        raise ValueError("invalid starting point for a problem of type "\
+            "'%s'" %kind)
+    if conv is not None and (primalstart or dualstart):
+        raise ValueError("starting points cannot be used with a "\
+            "chordally converted problem")
+
+    if c is None: c = PR['c']
+    else:
+        if type(c) is not matrix or c.typecode != 'd' or c.size != (n,1):
+            raise TypeError("'c' must be a 'd' matrix of size (%d,1)" %n)
+        if conv is not None: c = matrix([ c, matrix(0.0, (conv['nv'],1)) ])
+    if b is None: b = PR['b']
+    elif type(b) is not matrix or b.typecode != 'd' or b.size != (p,1): 
+        raise TypeError("'b' must be a dense matrix of size (%d,1)" %p)
 
-    sol = conelp(c, G, h, dims, A=A, b=b, primalstart=ps, dualstart=ds, kktsolver='ldl')
-    if sol['s'] is None:
-        sol['sl'] = None
-        sol['ss'] = None
+    # The right-hand side, in the coordinates of hdims.
+    if h is not None:
+        if type(h) is not matrix or h.typecode != 'd' or \
+            h.size != PR['h'].size:
+            raise TypeError("'h' must be a 'd' matrix of size (%d,1)" 
+                %PR['h'].size[0])
+    elif not hnew: 
+        h = PR['h']
     else:
-        sol['sl'] = sol['s'][:ml]
-        sol['ss'] = [ matrix(0.0, (mk, mk)) for mk in ms ]
-        ind = ml
-        for k in range(len(ms)):
-            m = ms[k]
-            sol['ss'][k][:] = sol['s'][ind:ind+m*m]
-            ind += m**2
-    del sol['s']
+        h = +PR['h']
+        if hl is not None:
+            if type(hl) is not matrix or hl.typecode != 'd' or \
+                hl.size != (ml,1):
+                raise TypeError("'hl' must be a 'd' matrix of size "\
+                    "(%d,1)" %ml)
+            h[:ml] = hl
+        if hq is not None:
+            if type(hq) is not list or len(hq) != len(mq) or [ k for k in
+                xrange(len(mq)) if type(hq[k]) not in (matrix, spmatrix) 
+                or hq[k].typecode != 'd' or hq[k].size != (mq[k], 1) ]:
+                raise TypeError("'hq' must be a list of %d 'd' matrices "\
+                    "of sizes %s" %(len(mq), [ (m, 1) for m in mq ]))
+            ind = ml
+            for k in xrange(len(mq)):
+                h[ind : ind + mq[k]] = hq[k]
+                ind += mq[k]
+        if hs is not None:
+            ms = PR['ms']
+            if type(hs) is not list or len(hs) != len(ms) or [ k for k in
+                xrange(len(ms)) if type(hs[k]) not in (matrix, spmatrix) 
+                or hs[k].typecode != 'd' or hs[k].size != (ms[k], ms[k]) ]:
+                raise TypeError("'hs' must be a list of %d 'd' matrices "\
+                    "of sizes %s" %(len(ms), [ (m, m) for m in ms ]))
+            if conv is not None: hs = chordal_hs(conv, hs)
+            ind = ml
+            for k in xrange(len(hs)):
+                m = hs[k].size[0]
+                h[ind : ind + m*m] = hs[k][:]
+                ind += m**2
 
-    if sol['z'] is None:
-        sol['zl'] = None
-        sol['zs'] = None
+    # Starting points, in the coordinates of hdims.
+    ps, ds = None, None
+    if kind in ('lp', 'qp'): 
+        ps, ds = primalstart, dualstart
     else:
-        sol['zl'] = sol['z'][:ml]
-        sol['zs'] = [ matrix(0.0, (mk, mk)) for mk in ms ]
+        N = h.size[0]
+        for start, key, skey in ((primalstart, 's', 'sq'), (dualstart, 
+            'z', 'zq')):
+            if not start: continue
+            v = {key: matrix(0.0, (N,1))}
+            if key == 's': v['x'] = start['x']
+            elif p: v['y'] = start['y']
+            if ml: v[key][:ml] = start[key + 'l']
+            ind = ml
+            if kind == 'socp':
+                for k in xrange(len(mq)): 
+                    v[key][ind : ind + mq[k]] = start[key + 'q'][k][:]
+                    ind += mq[k]
+            else:
+                for k in xrange(len(hdims['s'])):
+                    m = hdims['s'][k]
+                    v[key][ind : ind + m*m] = start[key + 's'][k][:]
+                    ind += m**2
+            if key == 's': ps = v
+            else: ds = v
+
+    pre = PR['pre']
+    if pre is not None:
+        h = matrix(pre['T'] * h)
+        if initvals: 
+            initvals = dict(initvals)
+            for key in ('s', 'z'):
+                if initvals.get(key) is not None:
+                    initvals[key] = matrix(pre['T'] * initvals[key])
+        if ps: ps = dict(ps, s = matrix(pre['T'] * ps['s']))
+        if ds: ds = dict(ds, z = matrix(pre['T'] * ds['z']))
+
+    if kind == 'qp':
+        sol = coneqp(PR['P'], c, PR['G'], h, PR['dims'], PR['A'], b, 
+            initvals, kktsolver = PR['kktsolver'], options = options)
+    else:
+        sol = conelp(c, PR['G'], h, PR['dims'], PR['A'], b, ps, ds, 
+            kktsolver = PR['kktsolver'], options = options)
+    if pre is not None: cone_postsolve(sol, pre)
+    if kind in ('lp', 'qp'): return sol
+
+    # Split s and z in the 'l' and the 'q' or 's' parts.
+    part = kind == 'socp' and 'q' or 's'
+    for key in ('s', 'z'):
+        if sol[key] is None:
+            sol[key + 'l'] = None
+            sol[key + part] = None
+            del sol[key]
+            continue
+        sol[key + 'l'] = sol[key][:ml]
         ind = ml
-        for k in range(len(ms)):
-            m = ms[k]
-            sol['zs'][k][:] = sol['z'][ind:ind+m*m]
-            ind += m**2
-    del sol['z']
+        if kind == 'socp':
+            sol[key + 'q'] = [ matrix(0.0, (m,1)) for m in mq ] 
+            for k in xrange(len(mq)):
+                sol[key + 'q'][k][:] = sol[key][ind : ind+mq[k]]
+                ind += mq[k]
+        else:
+            sol[key + 's'] = [ matrix(0.0, (m, m)) for m in hdims['s'] ]
+            for k in xrange(len(hdims['s'])):
+                m = hdims['s'][k]
+                sol[key + 's'][k][:] = sol[key][ind : ind+m*m]
+                ind += m**2
+        del sol[key]
 
+    if conv is not None:
+        chordal_recover(sol, conv)
     return sol
 
 
+def sdp(c, Gl = None, hl = None, Gs = None, hs = None, A = None, b = None, 
+    solver = None, primalstart = None, dualstart = None, kktsolver = None, 
+    options = None):
+
+    #print "start localcones.sdp ...."
+
+    PR = sdp_problem(c, Gl, hl, Gs, hs, A, b, chordal = not primalstart 
+        and not dualstart, kktsolver = kktsolver, options = options)
+    return problem_solve(PR, primalstart = primalstart, dualstart = 
+        dualstart, options = options)
+
+
 #def qp(P, q, G = None, h = None, A = None, b = None, solver = None, 
 #    initvals = None):
 #
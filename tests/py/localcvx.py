@@ -35,7 +35,7 @@ options = {}
 def cpl(c, F, G = None, h = None, dims = None, A = None, b = None, 
     kktsolver = None, xnewcopy = None, xdot = None, xaxpy = None,
     xscal = None, ynewcopy = None, ydot = None, yaxpy = None, 
-    yscal = None):
+    yscal = None, options = None):
 
     """
     Solves a convex optimization problem with a linear objective
@@ -45,12 +45,21 @@ def cpl(c, F, G = None, h = None, dims = None, A = None, b = None,
                     G*x <= h
                     A*x = b.                      
 
+    options is the dictionary of solver options of this call, and the 
+    dictionary options of the module if None.  With options['time_limit'],
+    the best iterate is returned with status 'time_limit' when the next 
+    iteration is not expected to finish within options['time_limit'] 
+    seconds of the call (see localmisc.time_out()).
     """
 
-    import math 
+    import math, time
     from cvxopt import base, blas, misc
     from cvxopt.base import matrix, spmatrix 
 
+    starttime = time.time()
+
+    if options is None: options = globals()['options']
+
     STEP = 0.99
     BETA = 0.5
     ALPHA = 0.01
@@ -94,6 +103,14 @@ def cpl(c, F, G = None, h = None, dims = None, A = None, b = None,
     try: show_progress = options['show_progress']
     except KeyError: show_progress = True
 
+    try: TIMELIMIT = options['time_limit']
+    except KeyError: TIMELIMIT = None
+    else:
+        if TIMELIMIT is not None and ((type(TIMELIMIT) is not float and 
+            type(TIMELIMIT) is not int) or TIMELIMIT <= 0.0):
+            raise ValueError("options['time_limit'] must be None or a "\
+                "positive scalar")
+
     try: refinement = options['refinement']
     except KeyError: refinement = 1
     else:
@@ -107,7 +124,8 @@ def cpl(c, F, G = None, h = None, dims = None, A = None, b = None,
         else:
             kktsolver = 'chol2'            
     defaultsolvers = ('ldl', 'ldl2', 'chol', 'chol2')
-    if type(kktsolver) is str and kktsolver not in defaultsolvers:
+    if type(kktsolver) is str and kktsolver != 'auto' and \
+        kktsolver not in defaultsolvers:
         raise ValueError("'%s' is not a valid value for kktsolver" \
             %kktsolver)
 
@@ -200,7 +218,11 @@ def cpl(c, F, G = None, h = None, dims = None, A = None, b = None,
     #     [ GG              0   -W'         ] [ uz ]   [ bz ]
     #
     # where G = [Df(x); G].
+    #
+    # With kktsolver 'auto', the solver is chosen by kkt_select().
 
+    if kktsolver == 'auto':
+        kktsolver = localmisc.kkt_select(G, dims, A, mnl, H = True)
     if kktsolver in defaultsolvers:
          if kktsolver == 'ldl': 
              factor = localmisc.kkt_ldl(G, dims, A, mnl)
@@ -328,6 +350,7 @@ def cpl(c, F, G = None, h = None, dims = None, A = None, b = None,
     
     #print "preloop c=\n", helpers.str2(c, "%.7f")
     relaxed_iters = 0
+    best = None
     for iters in range(MAXITERS + 1):  
         helpers.sp_major_next()
         helpers.sp_create("loopstart", 10)
@@ -486,6 +509,35 @@ def cpl(c, F, G = None, h = None, dims = None, A = None, b = None,
                 'dual slack': -tz, 'primal infeasibility': pres,
                 'dual infeasibility': dres }
 
+        # The best iterate so far (see localmisc.iterate_save()), returned
+        # with the fields of the solution above.
+        if TIMELIMIT is not None:
+            best = localmisc.iterate_save(best, {'gap': gap, 
+                'relative gap': relgap, 'primal objective': pcost, 
+                'dual objective': dcost, 'primal infeasibility': pres, 
+                'dual infeasibility': dres}, x, y, s, z, 1.0, xnewcopy, 
+                ynewcopy)
+            if localmisc.time_out(starttime, TIMELIMIT, iters):
+                if show_progress:
+                    print("Terminated (time limit reached).")
+                sb, zb = best['s'], best['z']
+                sl, zl = sb[mnl:], zb[mnl:]
+                ind = dims['l'] + sum(dims['q'])
+                for m in dims['s']:
+                    misc.symm(sl, m, ind)
+                    misc.symm(zl, m, ind)
+                    ind += m**2
+                return {'status': 'time_limit', 'x': best['x'], 
+                    'y': best['y'], 'znl': zb[:mnl], 'zl': zl, 
+                    'snl': sb[:mnl], 'sl': sl, 'gap': best['gap'], 
+                    'relative gap': best['relative gap'], 
+                    'primal objective': best['primal objective'], 
+                    'dual objective': best['dual objective'], 
+                    'primal slack': -misc.max_step(sb, dims, mnl), 
+                    'dual slack': -misc.max_step(zb, dims, mnl), 
+                    'primal infeasibility': best['primal infeasibility'],
+                    'dual infeasibility': best['dual infeasibility'] }
+
 
         # Compute initial scaling W: 
         #
@@ -1220,7 +1272,7 @@ def cpl(c, F, G = None, h = None, dims = None, A = None, b = None,
 def cp(F, G = None, h = None, dims = None, A = None, b = None,
     kktsolver = None, xnewcopy = None, xdot = None, xaxpy = None,
     xscal = None, ynewcopy = None, ydot = None, yaxpy = None, 
-    yscal = None):
+    yscal = None, options = None):
 
     """
     Solves a convex optimization problem
@@ -1245,7 +1297,7 @@ def cp(F, G = None, h = None, dims = None, A = None, b = None,
     The next M cones are positive semidefinite cones of order ms[0], ...,
     ms[M-1] >= 0.  
 
-
+    options is as in cpl().
     """
 
     import math 
@@ -1484,6 +1536,8 @@ def cp(F, G = None, h = None, dims = None, A = None, b = None,
             kktsolver = 'chol'            
         else:
             kktsolver = 'chol2'            
+    elif kktsolver == 'auto':
+        kktsolver = localmisc.kkt_select(G, dims, A, mnl, H = True)
     if kktsolver in ('ldl', 'chol', 'chol2', 'qr'):
         if kktsolver == 'ldl':
             factor = localmisc.kkt_ldl(G, dims, A, mnl)
@@ -1575,14 +1629,15 @@ def cp(F, G = None, h = None, dims = None, A = None, b = None,
         x[1] *= alpha
 
     sol = cpl(c, F_e, G_e, h, dims, A_e, b, kktsolver_e, xnewcopy_e, 
-         xdot_e, xaxpy_e, xscal_e)
+         xdot_e, xaxpy_e, xscal_e, options = options)
 
     sol['x'] = sol['x'][0]
     sol['znl'], sol['snl'] = sol['znl'][1:], sol['snl'][1:]
     return sol
 
 
-def gp(K, F, g, G=None, h=None, A=None, b=None, kktsolver=None):
+def gp(K, F, g, G=None, h=None, A=None, b=None, kktsolver=None, 
+    options=None):
 
     """
     Solves a geometric program
@@ -1707,4 +1762,4 @@ def gp(K, F, g, G=None, h=None, A=None, b=None, kktsolver=None):
             #print "H=\n", helpers.str2(H, "%.3f")
             return f, Df, H
 
-    return cp(Fgp, G, h, dims, A, b, kktsolver=kktsolver)
+    return cp(Fgp, G, h, dims, A, b, kktsolver=kktsolver, options=options)
@@ -1,9 +1,12 @@
 
-from cvxopt import matrix, blas, lapack, misc, base, spmatrix
+from cvxopt import matrix, blas, lapack, misc, base, spmatrix, mul
 
 import helpers
 import math
 import StringIO
+import sys
+import threading
+import time
 
 def strM(m):
     s = ''
@@ -56,6 +59,71 @@ def printW(W):
         else:
             print "** %s[0] **\n" % k, strMat(W[k])
 
+# Cone layouts computed by layout(), most recently used first.  Each 
+# entry is a tuple (key, layout) with key = (mnl, dims).  The cache is
+# shared by the solves in all threads.
+layouts = []
+LAYOUTS_SIZE = 8
+layouts_lock = threading.Lock()
+
+
+def layout(dims, mnl = 0):
+    """
+    Returns the offsets of the blocks of a vector in S, as a dictionary 
+    with entries
+
+    - 'nl':  mnl + dims['l'], the offset of the first 'q' block
+    - 'nlq':  the offset of the first 's' block
+    - 'q':  list of tuples (offset, m) for the 'q' blocks
+    - 's':  list of tuples (offset, offsetd, offsetp, m) for the 's' 
+      blocks, with offset in unpacked storage, offsetd in diagonal 
+      storage (as in lmbda) and offsetp in packed storage
+    - 'cdim', 'cdim_pckd', 'cdim_diag':  the lengths in unpacked, packed
+      and diagonal storage
+    - 'maxs':  the order of the largest 's' block
+    - 'groups':  dictionary with, for each order m of an 's' block, the 
+      list of indices k with dims['s'][k] = m.
+
+    The layouts of the LAYOUTS_SIZE most recently used (mnl, dims) are 
+    cached.  A layout must not be modified.
+    """
+
+    key = (mnl, dims['l'], tuple(dims['q']), tuple(dims['s']))
+    layouts_lock.acquire()
+    try:
+        for k in xrange(len(layouts)):
+            if layouts[k][0] == key:
+                if k: layouts.insert(0, layouts.pop(k))
+                return layouts[0][1]
+    finally:
+        layouts_lock.release()
+
+    L = {'nl': mnl + dims['l'], 'q': [], 's': [], 'groups': {}}
+    ind = L['nl']
+    for m in dims['q']:
+        L['q'].append((ind, m))
+        ind += m
+    L['nlq'] = ind
+    indd, indp = ind, ind
+    for k in xrange(len(dims['s'])):
+        m = dims['s'][k]
+        L['s'].append((ind, indd, indp, m))
+        L['groups'].setdefault(m, []).append(k)
+        ind += m**2
+        indd += m
+        indp += m*(m+1)/2
+    L['cdim'], L['cdim_diag'], L['cdim_pckd'] = ind, indd, indp
+    L['maxs'] = max([0] + dims['s'])
+
+    layouts_lock.acquire()
+    try:
+        layouts.insert(0, (key, L))
+        del layouts[LAYOUTS_SIZE:]
+    finally:
+        layouts_lock.release()
+    return L
+
+
 def local_pack(x, y, dims, mnl = 0, offsetx = 0, offsety = 0):
      """
      Copy x to y using packed storage.
@@ -66,17 +134,17 @@ def local_pack(x, y, dims, mnl = 0, offsetx = 0, offsety = 0):
      sqrt(2).
      """
 
-     nlq = mnl + dims['l'] + sum(dims['q'])
+     L = layout(dims, mnl)
+     nlq = L['nlq']
      blas.copy(x, y, n = nlq, offsetx = offsetx, offsety = offsety)
-     iu, ip = offsetx + nlq, offsety + nlq
-     for n in dims['s']:
+     for iu, indd, ip, n in L['s']:
+         iu, ip = offsetx + iu, offsety + ip
          for k in range(n):
              blas.copy(x, y, n = n-k, offsetx = iu + k*(n+1), offsety = ip)
              y[ip] /= math.sqrt(2)
              ip += n-k
-         iu += n**2 
-     np = sum([ int(n*(n+1)/2) for n in dims['s'] ])
-     blas.scal(math.sqrt(2.0), y, n = np, offset = offsety+nlq)
+     blas.scal(math.sqrt(2.0), y, n = L['cdim_pckd'] - nlq, offset = 
+         offsety+nlq)
 
 
 def local_unpack(x, y, dims, mnl = 0, offsetx = 0, offsety = 0):
@@ -88,21 +156,21 @@ def local_unpack(x, y, dims, mnl = 0, offsetx = 0, offsety = 0):
      """
 
      import math
-     nlq = mnl + dims['l'] + sum(dims['q'])
+     L = layout(dims, mnl)
+     nlq = L['nlq']
      blas.copy(x, y, n = nlq, offsetx = offsetx, offsety = offsety)
-     iu, ip = offsety+nlq, offsetx+nlq
-     for n in dims['s']:
+     for iu, indd, ip, n in L['s']:
+         iu, ip = offsety + iu, offsetx + ip
          for k in range(n):
              ##print "ip=%d,iu=%d, n=%d,k=%d, s-n=%d, s-oy=%d" % (ip,iu,n,k,n-k-1, iu+k*(n+1)+1)
              blas.copy(x, y, n = n-k, offsetx = ip, offsety = iu+k*(n+1))
              #y[iu+k*(n+1)] *= math.sqrt(2)
              blas.scal(1.0/math.sqrt(2.0), y, n = n-k-1, offset = iu+k*(n+1)+1)
              ip += n-k
-         iu += n**2 
      #nu = sum([ n**2 for n in dims['s'] ])
      #blas.scal(1.0/math.sqrt(2.0), y, n = nu, offset = offsety+nlq)
 
-def local_max_step(x, dims, mnl = 0, sigma = None):
+def local_max_step(x, dims, mnl = 0, sigma = None, ws = None):
     """
     Returns min {t | x + t*e >= 0}, where e is defined as follows
     
@@ -112,19 +180,21 @@ def local_max_step(x, dims, mnl = 0, sigma = None):
     
     When called with the argument sigma, also returns the eigenvalues 
     (in sigma) and the eigenvectors (in x) of the 's' components of x.
+
+    The scratch matrices are taken from the workspace ws (see 
+    ws_matrix()).
     """
 
     t = []
-    ind = mnl + dims['l']
-    if ind: t += [ -min(x[:ind]) ] 
-    for m in dims['q']:
+    L = layout(dims, mnl)
+    if L['nl']: t += [ -min(x[:L['nl']]) ] 
+    for ind, m in L['q']:
         if m: t += [ blas.nrm2(x, offset = ind + 1, n = m-1) - x[ind] ]
-        ind += m
     if sigma is None and dims['s']:  
-        Q = matrix(0.0, (max(dims['s']), max(dims['s'])))
-        w = matrix(0.0, (max(dims['s']),1))
-    ind2 = 0
-    for m in dims['s']:
+        Q = ws_matrix(ws, 'local_max_step.Q', (L['maxs'], L['maxs']))
+        w = ws_matrix(ws, 'local_max_step.w', (L['maxs'], 1))
+    for ind, ind2, indp, m in L['s']:
+        ind2 -= L['nlq']
         if sigma is None:
             blas.copy(x, Q, offsetx = ind, n = m**2)
             lapack.syevr(Q, w, range = 'I', il = 1, iu = 1, n = m, ldA = m)
@@ -133,8 +203,6 @@ def local_max_step(x, dims, mnl = 0, sigma = None):
             lapack.syevd(x, sigma, jobz = 'V', n = m, ldA = m, offsetA = 
                 ind, offsetW = ind2)
             if m:  t += [ -sigma[ind2] ] 
-        ind += m*m
-        ind2 += m
     if t: return max(t)
     else: return 0.0
 
@@ -144,18 +212,72 @@ def local_sdot(x, y, dims, mnl = 0):
     Inner product of two vectors in S.
     """
     
-    ind = mnl + dims['l'] + sum(dims['q'])
-    a = blas.dot(x, y, n = ind)
-    for m in dims['s']:
+    L = layout(dims, mnl)
+    a = blas.dot(x, y, n = L['nlq'])
+    for ind, indd, indp, m in L['s']:
         a += blas.dot(x, y, offsetx = ind, offsety = ind, incx = m+1, 
             incy = m+1, n = m)
         for j in range(1, m):
             a += 2.0 * blas.dot(x, y, incx = m+1, incy = m+1, 
                 offsetx = ind+j, offsety = ind+j, n = m-j)
-        ind += m**2
     return a
 
 
+def local_centrality(ds, dz, lmbda, alpha, lo, hi, t, dims, mnl = 0, 
+    ws = None):
+    """
+    Gondzio centrality correction.  With the trial point 
+
+        v = (lmbda + alpha*ds) o (lmbda + alpha*dz)
+
+    (ds, dz in the current scaling, the 's' components of lmbda 
+    diagonal), computes t := p(v) - v, where p(v) moves the eigenvalues 
+    of v (the entries for the 'l' blocks, v0 +/- ||v1|| for the 'q' 
+    blocks) into [lo, hi].  Entries of t less than -hi are replaced by 
+    -hi. 
+    """
+
+    L = layout(dims, mnl)
+    nlq = L['nlq']
+    u = ws_copy(ws, 'local_centrality.u', ds)
+    w = ws_copy(ws, 'local_centrality.w', dz)
+    blas.scal(alpha, u)
+    blas.scal(alpha, w)
+    blas.axpy(lmbda, u, n = nlq)
+    blas.axpy(lmbda, w, n = nlq)
+    for ind, indd, indp, m in L['s']:
+        blas.axpy(lmbda, u, n = m, offsetx = indd, offsety = ind, 
+            incy = m+1)
+        blas.axpy(lmbda, w, n = m, offsetx = indd, offsety = ind, 
+            incy = m+1)
+    blas.copy(u, t)
+    misc.sprod(t, w, dims, mnl)
+
+    def corr(e):
+        return max(min(max(e, lo), hi) - e, -hi)
+
+    nl = L['nl']
+    for i in xrange(nl): t[i] = corr(t[i])
+    for ind, m in L['q']:
+        v0, nv = t[ind], blas.nrm2(t, offset = ind+1, n = m-1)
+        d1, d2 = corr(v0 + nv), corr(v0 - nv)
+        if nv > 0.0: 
+            blas.scal(0.5 * (d1 - d2) / nv, t, offset = ind+1, n = m-1)
+        t[ind] = 0.5 * (d1 + d2)
+    if dims['s']:
+        V = ws_matrix(ws, 'local_centrality.V', (L['maxs'], L['maxs']))
+        U = ws_matrix(ws, 'local_centrality.U', (L['maxs'], L['maxs']))
+        e = ws_matrix(ws, 'local_centrality.e', (L['maxs'], 1))
+    for ind, indd, indp, m in L['s']:
+        # t := Q * diag(d) * Q',  with v = Q * diag(e) * Q'. 
+        blas.copy(t, V, offsetx = ind, n = m*m)
+        lapack.syevd(V, e, jobz = 'V', n = m, ldA = m)
+        for j in xrange(m):
+            blas.copy(V, U, offsetx = j*m, offsety = j*m, n = m)
+            blas.scal(corr(e[j]), U, offset = j*m, n = m)
+        blas.gemm(U, V, t, transB = 'T', m = m, n = m, k = m, ldA = m, 
+            ldB = m, ldC = m, offsetC = ind)
+
 
 def local_sinv(x, y, dims, mnl = 0):   
     """
@@ -178,10 +300,9 @@ def local_sinv(x, y, dims, mnl = 0):
     #
     # where yk = (l0, l1) and a = l0^2 - l1'*l1.
 
-    ind = mnl + dims['l']
-    for m in dims['q']:
+    L = layout(dims, mnl)
+    for ind, m in L['q']:
         aa = local_jnrm2(y, n = m, offset = ind)
-        print "a =", a
         aa = aa ** 2
         cc = x[ind]
         dd = blas.dot(y, x, offsetx = ind+1, offsety = ind+1, n = m-1)
@@ -190,7 +311,6 @@ def local_sinv(x, y, dims, mnl = 0):
         blas.axpy(y, x, alpha = dd/y[ind] - cc, n = m-1, offsetx = ind+1, 
             offsety = ind+1)
         blas.scal(1.0/aa, x, n = m, offset = ind)
-        ind += m
 
 
     # For the 's' blocks:
@@ -199,14 +319,11 @@ def local_sinv(x, y, dims, mnl = 0):
     #
     # where gammaij = .5 * (yk_i + yk_j).
 
-    ind2 = ind
-    for m in dims['s']:
+    for ind, ind2, indp, m in L['s']:
         for j in range(m):
             u = 0.5 * ( y[ind2+j:ind2+m] + y[ind2+j] )
             blas.tbsv(u, x, n = m-j, k = 0, ldA = 1, offsetx = ind + 
                 j*(m+1))  
-        ind += m*m
-        ind2 += m
 
 
 def local_jnrm2(x, n = None, offset = 0):
@@ -221,7 +338,7 @@ def local_jnrm2(x, n = None, offset = 0):
     return math.sqrt(x[offset] - a) * math.sqrt(x[offset] + a)
 
 
-def local_sprod(x, y, dims, mnl = 0, diag = 'N'):   
+def local_sprod(x, y, dims, mnl = 0, diag = 'N', ws = None):   
     """
     The product x := (y o x).  If diag is 'D', the 's' part of y is 
     diagonal and only the diagonal is stored.
@@ -243,8 +360,8 @@ def local_sprod(x, y, dims, mnl = 0, diag = 'N'):
     #
     # where yk = (l0, l1).
     
-    ind = mnl + dims['l']
-    for m in dims['q']:
+    L = layout(dims, mnl)
+    for ind, m in L['q']:
         dd = blas.dot(x, y, offsetx = ind, offsety = ind, n = m)
         #print "dd=", dd
         #print "scal=", y[ind]
@@ -253,7 +370,6 @@ def local_sprod(x, y, dims, mnl = 0, diag = 'N'):
         blas.axpy(y, x, alpha = x[ind], n = m-1, offsetx = ind+1, offsety 
             = ind+1)
         x[ind] = dd
-        ind += m
     #print "sprod q: x=\n", x
 
 
@@ -264,10 +380,9 @@ def local_sprod(x, y, dims, mnl = 0, diag = 'N'):
     # where Yk = mat(yk) if diag is 'N' and Yk = diag(yk) if diag is 'D'.
 
     if diag is 'N':
-        maxm = max([0] + dims['s'])
-        A = matrix(0.0, (maxm, maxm))
+        A = ws_matrix(ws, 'local_sprod.A', (L['maxs'], L['maxs']))
 
-        for m in dims['s']:
+        for ind, ind2, indp, m in L['s']:
             blas.copy(x, A, offsetx = ind, n = m*m)
 
             # Write upper triangular part of A and yk.
@@ -279,20 +394,15 @@ def local_sprod(x, y, dims, mnl = 0, diag = 'N'):
             blas.syr2k(A, y, x, alpha = 0.5, n = m, k = m, ldA = m,  ldB = 
                 m, ldC = m, offsetB = ind, offsetC = ind)
 
-            ind += m*m
-
         #print "sprod diag=N s: x=\n", x
 
     else:
-        ind2 = ind
-        for m in dims['s']:
+        for ind, ind2, indp, m in L['s']:
             for j in range(m):
                 u = 0.5 * ( y[ind2+j:ind2+m] + y[ind2+j] )
                 #print "u.size=", u.size, "u=\n", u
                 blas.tbmv(u, x, n = m-j, k = 0, ldA = 1, offsetx = 
                     ind + j*(m+1))  
-            ind += m*m
-            ind2 += m
         #print "sprod diag=T s: x=\n", x
 
 
@@ -336,7 +446,53 @@ def local_sgemv(A, x, y, dims, trans = 'N', alpha = 1.0, beta = 0.0, n = None,
         misc.triusc(x, dims, offsetx)
 
 
-def scale(x, W, trans = 'N', inverse = 'N'):  
+def struct_sgemv(G, x, y, dims, trans = 'N', alpha = 1.0, beta = 0.0):
+    """
+    Matrix-vector multiplication with a structured G, as built by 
+    sdp_declared() in localcones.
+
+        y := alpha*G*x + beta*y   (trans = 'N')
+        y := alpha*G'*x + beta*y  (trans = 'T').
+
+    G['l'] holds the 'l' rows.  The columns of the kth 's' block are the 
+    sparse columns G['s'][k]['G'], the diagonal columns 
+    diag(G['s'][k]['D'][:,i]) and the low rank columns 
+    (U[i]*V[i]' + V[i]*U[i]')/2.  The 's' components of x are stored in 
+    'L' storage.
+    """
+
+    ml = dims['l']
+    if trans == 'N':
+        if ml: y[:ml] = alpha * (G['l'] * x) + beta * y[:ml]
+        ind = ml
+        for m, S in zip(dims['s'], G['s']):
+            Y = matrix(S['G'] * x, (m, m))
+            if S['dcols']: Y[::m+1] += S['D'] * x[S['dcols']]
+            for i in xrange(len(S['lcols'])):
+                xi = 0.5 * x[S['lcols'][i]]
+                blas.gemm(S['U'][i], S['V'][i], Y, transB = 'T', 
+                    alpha = xi, beta = 1.0)
+                blas.gemm(S['V'][i], S['U'][i], Y, transB = 'T', 
+                    alpha = xi, beta = 1.0)
+            y[ind : ind+m**2] = alpha * Y[:] + beta * y[ind : ind+m**2]
+            ind += m**2
+    else:
+        n = y.size[0]
+        u = matrix(0.0, (n, 1))
+        if ml: u += G['l'].T * x[:ml]
+        ind = ml
+        for m, S in zip(dims['s'], G['s']):
+            X = matrix(x[ind : ind+m**2], (m, m))
+            misc.symm(X, m)
+            u += S['G'].T * X[:]
+            if S['dcols']: u[S['dcols']] += S['D'].T * X[::m+1]
+            for i in xrange(len(S['lcols'])):
+                u[S['lcols'][i]] += blas.dot(S['U'][i], X * S['V'][i])
+            ind += m**2
+        y[:] = alpha * u + beta * y
+
+
+def scale(x, W, trans = 'N', inverse = 'N', ws = None):  
     """
     Applies Nesterov-Todd scaling or its inverse.
     
@@ -363,6 +519,9 @@ def scale(x, W, trans = 'N', inverse = 'N'):
     
     The 'dnl' and 'dnli' entries are optional, and only present when the 
     function is called from the nonlinear solver.
+
+    The scratch matrices are taken from the workspace ws (see 
+    ws_matrix()).
     """
 
     ind = 0
@@ -416,7 +575,7 @@ def scale(x, W, trans = 'N', inverse = 'N'):
     #     xk := 1/beta * (2*J*v*v'*J - J) * xk
     #         = 1/beta * (-J) * (2*v*((-J*xk)'*v)' + xk). 
 
-    w = matrix(0.0, (x.size[1], 1))
+    w = ws_matrix(ws, 'scale.w', (x.size[1], 1))
     for k in xrange(len(W['v'])):
         v = W['v'][k]
         m = v.size[0]
@@ -455,7 +614,7 @@ def scale(x, W, trans = 'N', inverse = 'N'):
     # rti is kth element of W['rti'].
 
     maxn = max( [0] + [ r.size[0] for r in W['r'] ] )
-    a = matrix(0.0, (maxn, maxn))
+    a = ws_matrix(ws, 'scale.a', (maxn, maxn))
     for k in xrange(len(W['r'])):
 
         if inverse == 'N':
@@ -496,14 +655,15 @@ def scale(x, W, trans = 'N', inverse = 'N'):
     ##print "phase4: x=\n", x
 
 
-def scale2(lmbda, x, dims, mnl = 0, inverse = 'N'):
+def scale2(lmbda, x, dims, mnl = 0, inverse = 'N', ws = None):
     """
     Evaluates
 
         x := H(lambda^{1/2}) * x   (inverse is 'N')
         x := H(lambda^{-1/2}) * x  (inverse is 'I').
     
-    H is the Hessian of the logarithmic barrier.
+    H is the Hessian of the logarithmic barrier.  The scratch vectors 
+    are taken from the workspace ws (see ws_matrix()).
     """
       
     minor = 0
@@ -545,8 +705,8 @@ def scale2(lmbda, x, dims, mnl = 0, inverse = 'N'):
     #
     # a = sqrt(lambda_k' * J * lambda_k), l = lambda_k / a.
 
-    ind = mnl + dims['l']
-    for m in dims['q']:
+    L = layout(dims, mnl)
+    for ind, m in L['q']:
         a = misc.jnrm2(lmbda, n = m, offset = ind)
         if inverse == 'N':
             lx = misc.jdot(lmbda, x, n = m, offsetx = ind, offsety = ind)/a
@@ -560,7 +720,6 @@ def scale2(lmbda, x, dims, mnl = 0, inverse = 'N'):
             ind+1)
         if inverse == 'N': a = 1.0/a 
         blas.scal(a, x, offset = ind, n = m)
-        ind += m
 
     if not helpers.sp_minor_empty():
         helpers.sp_create("020scale2", minor)
@@ -580,30 +739,75 @@ def scale2(lmbda, x, dims, mnl = 0, inverse = 'N'):
     # We scale upper and lower triangular part of mat(xk) because the
     # inverse operation will be applied to nonsymmetric matrices.
 
-    ind2 = ind
-    for k in range(len(dims['s'])):
-        m = dims['s'][k]
-        for j in range(m):
-            c = math.sqrt(lmbda[ind2+j]) * base.sqrt(lmbda[ind2:ind2+m])
+    if dims['s']:
+        r = ws_matrix(ws, 'scale2.r', (L['maxs'], 1))
+        c = ws_matrix(ws, 'scale2.c', (L['maxs'], 1))
+    for ind, ind2, indp, m in L['s']:
+        # c := sqrt(l[j]) * sqrt(l),  with r = sqrt(l).
+        for j in xrange(m): r[j] = math.sqrt(lmbda[ind2+j])
+        for j in xrange(m):
+            blas.copy(r, c, n = m)
+            blas.scal(r[j], c, n = m)
             if inverse == 'N':  
                 blas.tbsv(c, x, n = m, k = 0, ldA = 1, offsetx = ind + j*m)
             else:
                 blas.tbmv(c, x, n = m, k = 0, ldA = 1, offsetx = ind + j*m)
-        ind += m*m
-        ind2 += m
 
     if not helpers.sp_minor_empty():
         helpers.sp_create("030scale2", minor)
 
 
 
-def local_compute_scaling(s, z, lmbda, dims, mnl = None):
+def sblocks_map(f, ms, nwork, ws = None, threads = 1):
+    """
+    Calls f(k, work_1, ..., work_nwork) for k = 0, ..., len(ms)-1, where
+    ms[k] is the order of the kth 's' block and the work_i are scratch
+    vectors of length max(ms)**2, taken from the workspace ws (see 
+    ws_matrix()).
+
+    With threads > 1, the blocks are distributed over that many threads, 
+    largest blocks first, and each thread has its own scratch vectors.  
+    The LAPACK routines release the interpreter lock, so blocks of 
+    moderate size are factored in parallel.  f must only write to the 
+    data of block k.
+    """
+
+    nt = min(threads, len(ms))
+    maxm = max([0] + ms)
+    def works(t):
+        return [ ws_matrix(ws, 'sblocks_map.work%d.%d' % (t, i), 
+            (maxm**2, 1)) for i in xrange(nwork) ]
+    if nt <= 1:
+        work = works(0)
+        for k in xrange(len(ms)): f(k, *work)
+        return
+
+    order = sorted(range(len(ms)), key = lambda k: -ms[k])
+    errors = []
+    work = [ works(t) for t in xrange(nt) ]
+    def run(t, ks):
+        try:
+            for k in ks: f(k, *work[t])
+        except:
+            errors.append(sys.exc_info())
+    threads = [ threading.Thread(target = run, args = (i, order[i::nt])) 
+        for i in xrange(nt) ]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    if errors: 
+        raise errors[0][0], errors[0][1], errors[0][2]
+
+
+def local_compute_scaling(s, z, lmbda, dims, mnl = None, ws = None, 
+    threads = 1):
     """
     Returns the Nesterov-Todd scaling W at points s and z, and stores the 
     scaled variable in lmbda. 
     
         W * z = W^{-T} * s = lmbda. 
 
+    The 's' blocks are handled by sblocks_map(), with the given number 
+    of threads and the scratch vectors taken from the workspace ws.
     """
      
     W = {}
@@ -655,12 +859,12 @@ def local_compute_scaling(s, z, lmbda, dims, mnl = None):
     #
     # lambda_k is stored in lmbda[indq[k]:indq[k+1]].
            
-    ind = mnl + dims['l']
+    L = layout(dims, mnl)
     W['v'] = [ matrix(0.0, (k,1)) for k in dims['q'] ]
     W['beta'] = len(dims['q']) * [ 0.0 ] 
 
     for k in range(len(dims['q'])):
-        m = dims['q'][k]
+        ind, m = L['q'][k]
         v = W['v'][k]
 
         # a = sqrt( sk' * J * sk )  where J = [1, 0; 0, -I]
@@ -703,7 +907,6 @@ def local_compute_scaling(s, z, lmbda, dims, mnl = None):
             ind+1, offsety = ind+1)
         blas.scal(math.sqrt(aa*bb), lmbda, offset = ind, n = m)
 
-        ind += m
         #print "W['v'][%d].size =" % k, W['v'][k].size, " data=\n", W['v'][k]
         #print "W['beta'][%d] =" % k, W['beta'][k]
         #print "after q[%d]:\n" % k, lmbda
@@ -728,13 +931,9 @@ def local_compute_scaling(s, z, lmbda, dims, mnl = None):
             
     W['r'] = [ matrix(0.0, (m,m)) for m in dims['s'] ]
     W['rti'] = [ matrix(0.0, (m,m)) for m in dims['s'] ]
-    work = matrix(0.0, (max( [0] + dims['s'] )**2, 1))
-    Ls = matrix(0.0, (max( [0] + dims['s'] )**2, 1))
-    Lz = matrix(0.0, (max( [0] + dims['s'] )**2, 1))
 
-    ind2 = ind
-    for k in range(len(dims['s'])):
-        m = dims['s'][k]
+    def sblock(k, work, Ls, Lz):
+        ind2, ind, indp, m = L['s'][k]
         r, rti = W['r'][k], W['rti'][k]
 
         # Factor sk = Ls*Ls'; store Ls in ds[inds[k]:inds[k+1]].
@@ -763,20 +962,19 @@ def local_compute_scaling(s, z, lmbda, dims, mnl = None):
 
         # r := r * diag(sqrt(lambda_k))
         # rti := rti * diag(1 ./ sqrt(lambda_k))
-        for i in range(m):
-            a = math.sqrt( lmbda[ind+i] )
-            blas.scal(a, r, offset = m*i, n = m)
-            blas.scal(1.0/a, rti, offset = m*i, n = m)
+        for j in xrange(m):
+            a = math.sqrt(lmbda[ind+j])
+            blas.scal(a, r, offset = j*m, n = m)
+            blas.scal(1.0/a, rti, offset = j*m, n = m)
 
-        ind += m
-        ind2 += m*m
+    sblocks_map(sblock, dims['s'], 3, ws = ws, threads = threads)
 
     return W
 
 
 
 
-def local_update_scaling(W, lmbda, s, z):
+def local_update_scaling(W, lmbda, s, z, ws = None, threads = 1):
     """
     Updates the Nesterov-Todd scaling matrix W and the scaled variable 
     lmbda so that on exit
@@ -790,6 +988,9 @@ def local_update_scaling(W, lmbda, s, z):
     The 's' components contain the factors Ls, Lz in a factorization of 
     the new iterates in the current scaling, W^{-T}*st = Ls*Ls',   
     W*zt = Lz*Lz'.
+
+    The 's' blocks are handled by sblocks_map(), with the given number 
+    of threads and the scratch vectors taken from the workspace ws.
     """
   
 
@@ -959,13 +1160,19 @@ def local_update_scaling(W, lmbda, s, z):
     #         rti[k] := r[k] * Lz * Uk * diag(lambda_k^+)^{-1/2}.
     #
 
-    work = matrix(0.0, (max( [0] + [r.size[0] for r in W['r']])**2, 1))
+    # offsets[k] = (offset of lambda_k in lmbda, offset of Ls, Lz in s, z)
     ind = mnl + ml + sum([ len(v) for v in W['v'] ])
-    ind2, ind3 = ind, 0
-    for k in range(len(W['r'])):
+    ind2, offsets = ind, []
+    for r in W['r']:
+        offsets.append((ind, ind2))
+        ind += r.size[0]
+        ind2 += r.size[0]**2
+
+    def sblock(k, work):
         r, rti = W['r'][k], W['rti'][k]
         m = r.size[0]
-        
+        ind, ind2 = offsets[k]
+
         # r := r*sk = r*Ls
         blas.gemm(r, s, work, m = m, n = m, k = m, ldB = m, ldC = m,
             offsetB = ind2)
@@ -994,14 +1201,13 @@ def local_update_scaling(W, lmbda, s, z):
         blas.copy(work, rti, n = m**2)
 
         # r := r*lambda^{-1/2}; rti := rti*lambda^{-1/2}
-        for i in range(m):    
-            a = 1.0 / math.sqrt(lmbda[ind+i])
-            blas.scal(a, r, offset = m*i, n = m)
-            blas.scal(a, rti, offset = m*i, n = m)
+        for j in xrange(m):
+            a = 1.0 / math.sqrt(lmbda[ind+j])
+            blas.scal(a, r, offset = j*m, n = m)
+            blas.scal(a, rti, offset = j*m, n = m)
 
-        ind += m
-        ind2 += m*m
-        ind3 += m
+    sblocks_map(sblock, [ r.size[0] for r in W['r'] ], 1, ws = ws, 
+        threads = threads)
 
 
 def pack2(x, dims, mnl = 0):
@@ -1014,20 +1220,297 @@ def pack2(x, dims, mnl = 0):
 
      if not dims['s']:
          return
-     iu = mnl + dims['l'] + sum(dims['q'])
-     ip = iu
-     for n in dims['s']:
+     for iu, indd, ip, n in layout(dims, mnl)['s']:
          for k in range(n):
              x[ip, :] = x[iu + (n+1)*k, :]
              x[ip + 1 : ip+n-k, :] = x[iu + (n+1)*k + 1: iu + n*(k+1), :] \
                  * math.sqrt(2.0)
              ip += n - k
-         iu += n**2 
-     np = sum([ int(n*(n+1)/2) for n in dims['s'] ])
 
 
+def kkt_solve_many(f, x, y, z):
+    """
+    Solves the KKT equations for several right-hand sides.
+
+    f is a solve routine returned by the factor functions of kkt_ldl(), 
+    kkt_qr(), kkt_chol() or kkt_chol2(), or by a user-provided kktsolver.
+    x, y, z are 'd' matrices with one right-hand side (bx, by, bz) per
+    column.  On exit they contain the solutions, as returned by f.
+
+    If f has a solve_many attribute, all columns are solved with one call
+    to it.  Otherwise f is called for each column.
+    """
+
+    if hasattr(f, 'solve_many'):
+        f.solve_many(x, y, z)
+        return
+    for k in xrange(x.size[1]):
+        xk, yk, zk = x[:, k], y[:, k], z[:, k]
+        f(xk, yk, zk)
+        x[:, k], y[:, k], z[:, k] = xk, yk, zk
+
+
+def ws_matrix(ws, name, size, tc = 'd'):
+    """
+    Returns a matrix of zeros with the given size and typecode.
+
+    If ws is a dict (a workspace, see localcones.workspace_new()), the 
+    matrix is stored in ws on first use, and the same matrix is set to 
+    zero and returned by later calls with the same name and size.  If 
+    ws is None, a new matrix is returned.
+
+    When ws['frozen'] is true, a matrix with the same name and another 
+    size or typecode must not be stored in ws.  The solvers set it after
+    the first iteration in debug mode, so that a work vector that is 
+    allocated again in a later iteration is reported.
+    """
+
+    if ws is None: return matrix(0, size, tc)
+    key = (name, size, tc)
+    try: x = ws[key]
+    except KeyError: 
+        ws_check(ws, name)
+        x = ws[key] = matrix(0, size, tc)
+    else:
+        if tc == 'd': blas.scal(0.0, x)
+        else: x[:] = 0
+    return x
+
+
+def ws_check(ws, name):
+    """
+    Raises an AssertionError if the workspace ws is frozen and holds a 
+    matrix with the given name.
+    """
+
+    if not ws.get('frozen'): return
+    for key in ws:
+        if type(key) is tuple and key[0] == name:
+            raise AssertionError("work vector %s allocated again after "\
+                "the first iteration" % name)
+
+
+def ws_copy(ws, name, x):
+    """
+    Returns a copy of the 'd' matrix x, stored in the workspace ws as in 
+    ws_matrix().
+    """
+
+    if ws is None: return matrix(x)
+    key = (name, x.size, 'd')
+    try: y = ws[key]
+    except KeyError: 
+        ws_check(ws, name)
+        y = ws[key] = matrix(0.0, x.size)
+    blas.copy(x, y)
+    return y
+
+
+def time_out(start, limit, iters):
+    """
+    Returns True if a solver that started at time start (a value of 
+    time.time()) and has completed iters iterations is not expected to 
+    complete another one within limit seconds.  The time of an iteration
+    is estimated by the average time of the iterations so far and of the
+    set-up before the first one.  Returns False if limit is None.
+    """
+
+    if limit is None: return False
+    elapsed = time.time() - start
+    return elapsed + elapsed / (iters + 1) > limit
+
+
+def iterate_save(best, sol, x, y, s, z, tau = 1.0, xnewcopy = matrix, 
+    ynewcopy = matrix):
+    """
+    Returns the better of the iterate best and the iterate x, y, s, z, 
+    tau with the statistics sol, a dictionary with the keys of the 
+    solutions of the solvers.  best is None for the first iterate.
+
+    An iterate is better if the largest of its primal infeasibility, dual
+    infeasibility and relative gap (the gap if the relative gap is not 
+    defined) is smaller.  If the new iterate is better, copies of x, y, 
+    s, z are stored in sol with tau and this rank, and sol is returned.
+    """
+
+    relgap = sol['relative gap']
+    if relgap is None: relgap = sol['gap']
+    rank = max(sol['primal infeasibility'], sol['dual infeasibility'], 
+        relgap)
+    if best is not None and best['rank'] <= rank: return best
+    sol['rank'], sol['tau'] = rank, tau
+    sol['x'], sol['y'] = xnewcopy(x), ynewcopy(y)
+    sol['s'], sol['z'] = matrix(s), matrix(z)
+    return sol
+
+
+# Number of entries of the scratch matrices that hold parts of W^{-T}*G 
+# in the KKT solvers with memory = 'low'.
+LOWMEM_SIZE = 2**18
+
+
+def gs_columns_map(f, G, W, dims, mnl = 0, Df = None, ws = None, 
+    name = 'gs'):
+    """
+    Calls f(j, k, B) for consecutive blocks of columns of 
+
+        Gs = W^{-T} * GG,  GG = [ Df; G ]
+
+    in packed storage, without forming Gs:  on each call, columns j, 
+    ..., j+k-1 of Gs are stored in the first k columns of B.  B has 
+    mnl + G.size[0] rows and about LOWMEM_SIZE entries, and is taken 
+    from the workspace ws (see ws_matrix()).
+    """
+
+    cdim, n = mnl + G.size[0], G.size[1]
+    nc = max(1, min(n, LOWMEM_SIZE / max(1, cdim)))
+    B = ws_matrix(ws, name + '.B', (cdim, nc))
+    for j in xrange(0, n, nc):
+        k = min(nc, n-j)
+        if mnl: B[:mnl, :k] = matrix(Df[:, j : j+k])
+        if type(G) is matrix:
+            lapack.lacpy(G, B, m = cdim - mnl, n = k, ldA = max(1, 
+                G.size[0]), offsetA = j*G.size[0], ldB = cdim, offsetB = 
+                mnl)
+        else:
+            B[mnl:, :k] = matrix(G[:, j : j+k])
+        scale(B, W, trans = 'T', inverse = 'I', ws = ws)
+        pack2(B, dims, mnl)
+        f(j, k, B)
+
 
-def kkt_ldl(G, dims, A, mnl = 0):
+# Solvers chosen by kkt_select(), most recently used first.  Each entry 
+# is a tuple (key, name) where key is the structural fingerprint of the 
+# problem (sizes, dims, matrix types and numbers of nonzeros).  The cache 
+# is shared by the solves in all threads.
+kktcache = []
+KKTCACHE_SIZE = 64
+kktcache_lock = threading.Lock()
+
+
+def kkt_select(G, dims, A, mnl = 0, H = None, memory = 'normal'):
+    """
+    Returns the name of the KKT solver ('ldl', 'qr', 'chol' or 'chol2') 
+    with the lowest estimated cost for the KKT systems of a problem with 
+    constraint matrices G, A, cone dimensions dims and mnl nonlinear 
+    constraints.
+
+    H is the 1,1 block of the KKT matrix: None if it is zero (conelp), 
+    the matrix P (coneqp), or True if it is nonzero but not known in 
+    advance (cpl, cp).  'qr' requires a zero 1,1 block and 'chol2' 
+    requires dims['q'] and dims['s'] to be empty, and a dense G or H 
+    (the sparse chol2 path needs cholmod).
+
+    The estimate is the number of flops of one factorization, including
+    the scaling of the 's' rows of G, with the number of stored entries 
+    as tie-breaker.  If memory is 'low', the solver with the fewest 
+    stored entries (with memory = 'low', see kkt_ldl() and kkt_chol()) 
+    is chosen, with the flops as tie-breaker.  The choice is cached for 
+    problems with the same sizes, dims, matrix types and numbers of 
+    nonzeros.
+    """
+
+    def nnz(X):
+        if type(X) is spmatrix: return len(X.V)
+        elif type(X) is matrix: return -1
+        else: return -2
+
+    p, n = A.size
+    key = (n, p, mnl, dims['l'], tuple(dims['q']), tuple(dims['s']), 
+        nnz(G), nnz(A), H is None, nnz(H), memory)
+    kktcache_lock.acquire()
+    try:
+        for k in xrange(len(kktcache)):
+            if kktcache[k][0] == key:
+                entry = kktcache.pop(k)
+                kktcache.insert(0, entry)
+                return entry[1]
+    finally:
+        kktcache_lock.release()
+
+    ml = dims['l']
+    cdim = mnl + ml + sum(dims['q']) + sum([ k**2 for k in dims['s'] ])
+    N = mnl + ml + sum(dims['q']) + sum([ int(k*(k+1)/2) for k in 
+        dims['s'] ])
+
+    # Number of nonzero columns of G in each 'q' and 's' block, number of 
+    # nonzeros in each 's' block, and flops of Gs'*Gs for the 'l' rows.
+    if type(G) is spmatrix:
+        rows = [ 0 ] * ml
+        for i in G.I: 
+            if i < ml: rows[i] += 1
+        lflops = float(sum([ r**2 for r in rows ]))
+        ind, qcols, scols, snnz = ml, [], [], []
+        for m in dims['q']:
+            qcols.append(len(set(G[ind : ind+m, :].J)))
+            ind += m
+        for m in dims['s']:
+            Gk = G[ind : ind+m**2, :]
+            scols.append(len(set(Gk.J)))
+            snnz.append(len(Gk.V))
+            ind += m**2
+    else:
+        lflops = float(ml * n**2)
+        qcols = [ n ] * len(dims['q'])
+        scols = [ n ] * len(dims['s'])
+
+    # Flops of W^{-T}*G for the 's' rows, for a dense G.
+    sflops = sum([ 4.0 * m**3 * n for m in dims['s'] ]) 
+
+    # Stored entries of W^{-T}*G:  all of it, or the scratch matrices of 
+    # about LOWMEM_SIZE entries with memory = 'low'.
+    if memory == 'low': gsize = min(cdim*n, max(cdim, n, LOWMEM_SIZE))
+    else: gsize = cdim*n
+
+    cost = {}
+
+    # Dense LDL factorization of order n + p + N.
+    cost['ldl'] = ((n + p + N)**3 / 3.0 + sflops, (n + p + N)**2 + gsize)
+
+    # QR factorization of W^{-T}*G*Q2 (N x n-p), after applying Q to G.
+    if H is None and not mnl:
+        cost['qr'] = (2.0 * (n-p)**2 * (N - (n-p) / 3.0) + 4.0*N*n*p + 
+            sflops, cdim*n)
+
+    # Gs'*Gs, Q'*K*Q and a Cholesky factorization of order n-p.  With a
+    # sparse G only the nonzero columns of each 'q' block are used, and 
+    # the 's' blocks are assembled by the Schur complement formulas F1 
+    # or F3 of kkt_chol(), estimated with the average number of nonzeros
+    # per column.
+    common = 4.0*n**2*p + (n-p)**3 / 3.0
+    if type(G) is spmatrix:
+        schur = 0.0
+        for m, k, nz in zip(dims['s'], scols, snnz):
+            if not k: continue
+            a = 2.0 * nz / k
+            schur += k * min(m*a + m**3 + nz, a**2 * k / 2.0)
+        cost['chol'] = (mnl*n**2 + lflops + common + schur +
+            sum([ float(m*k**2) for m, k in zip(dims['q'], qcols) ]), 
+            n**2 + 3*len(G.V) + sum([ k**2 for k in scols ]))
+    else:
+        cost['chol'] = (N*n**2 + common + sflops, n**2 + gsize)
+
+    # Cholesky factorizations of order n and p, for 'l' cones only.
+    if not dims['q'] and not dims['s'] and (type(G) is matrix or 
+        type(H) is matrix):
+        cost['chol2'] = (mnl*n**2 + lflops + n**3 / 3.0 + n**2*p + 
+            p**2*n + p**3 / 3.0, n**2 + n*p + p**2 + cdim*n)
+
+    if memory == 'low':
+        name = min(cost.keys(), key = lambda k: (cost[k][1], cost[k][0]))
+    else:
+        name = min(cost.keys(), key = lambda k: cost[k])
+
+    kktcache_lock.acquire()
+    try:
+        kktcache.insert(0, (key, name))
+        del kktcache[KKTCACHE_SIZE:]
+    finally:
+        kktcache_lock.release()
+    return name
+
+
+def kkt_ldl(G, dims, A, mnl = 0, ws = None, memory = 'normal'):
     """
     Solution of KKT equations by a dense LDL factorization of the 
     3 x 3 system.
@@ -1047,15 +1530,24 @@ def kkt_ldl(G, dims, A, mnl = 0):
     
     H is n x n,  A is p x n, Df is mnl x n, G is N x n where
     N = dims['l'] + sum(dims['q']) + sum( k**2 for k in dims['s'] ).
+
+    The buffers are taken from the workspace ws (see ws_matrix()).  If 
+    memory is 'low' or G is an spmatrix, W^{-T}*GG is not stored but 
+    scaled a few columns at a time into the 3,1 block of K (see 
+    gs_columns_map()), so that no dense copy of G is kept.
     """
     
     p, n = A.size
     ldK = n + p + mnl + dims['l'] + sum(dims['q']) + sum([ k*(k+1)/2 for k 
         in dims['s'] ])
-    K = matrix(0.0, (ldK, ldK))
-    ipiv = matrix(0, (ldK, 1))
-    u = matrix(0.0, (ldK, 1))
-    g = matrix(0.0, (mnl + G.size[0], 1))
+    cdim_pckd = ldK - n - p
+    K = ws_matrix(ws, 'kkt_ldl.K', (ldK, ldK))
+    ipiv = ws_matrix(ws, 'kkt_ldl.ipiv', (ldK, 1), 'i')
+    u = ws_matrix(ws, 'kkt_ldl.u', (ldK, 1))
+    columns = memory == 'low' or type(G) is spmatrix
+    if not columns:
+        Gs = ws_matrix(ws, 'kkt_ldl.Gs', (mnl + G.size[0], n))
+    Ad = matrix(A)
     #print "dims: ", str(dims)
     #helpers.sp_add_var("u", u)
     #helpers.sp_add_var("K", K)
@@ -1066,17 +1558,40 @@ def kkt_ldl(G, dims, A, mnl = 0):
         if not helpers.sp_minor_empty():
             minor = helpers.sp_minor_top()
 
-        blas.scal(0.0, K)
-        if H is not None:
+        # Only the lower triangle of K is referenced by sytrf, so only the
+        # lower triangle is assembled.  sytrf overwrites it with the 
+        # factorization; the constant [0, 0; 0, -I] trailing block is 
+        # restored here and the A block is copied from the dense Ad.
+        for k in xrange(n, ldK):
+            blas.scal(0.0, K, offset = k*(ldK+1), n = ldK-k)
+        K[(ldK+1)*(p+n) :: ldK+1]  = -1.0
+        if p: lapack.lacpy(Ad, K, m = p, n = n, ldB = ldK, offsetB = n)
+
+        if H is None:
+            for k in xrange(n):
+                blas.scal(0.0, K, offset = k*(ldK+1), n = n-k)
+        elif type(H) is matrix:
+            lapack.lacpy(H, K, uplo = 'L', m = n, n = n, ldB = ldK)
+        else:
             K[:n, :n] = H
 
-        K[n:n+p, :n] = A
-        for k in xrange(n):
-            if mnl: g[:mnl] = Df[:,k]
-            g[mnl:] = G[:,k]
-            scale(g, W, trans = 'T', inverse = 'I')
-            misc.pack(g, K, dims, mnl, offsety = k*ldK + n + p)
-        K[(ldK+1)*(p+n) :: ldK+1]  = -1.0
+        # The W-dependent block W^{-T} * GG, scaled for all columns at 
+        # once (a block of columns at a time if columns is true) and 
+        # copied to K in packed storage.
+        if columns:
+            def copy(j, k, B):
+                if cdim_pckd: 
+                    lapack.lacpy(B, K, m = cdim_pckd, n = k, ldA = 
+                        B.size[0], ldB = ldK, offsetB = n + p + j*ldK)
+            gs_columns_map(copy, G, W, dims, mnl, Df, ws, 'kkt_ldl')
+        else:
+            if mnl: Gs[:mnl, :] = Df
+            Gs[mnl:, :] = G
+            scale(Gs, W, trans = 'T', inverse = 'I', ws = ws)
+            pack2(Gs, dims, mnl)
+            if cdim_pckd: 
+                lapack.lacpy(Gs, K, m = cdim_pckd, n = n, ldB = ldK, 
+                    offsetB = n+p)
         lapack.sytrf(K, ipiv)
 
         def solve(x, y, z):
@@ -1096,7 +1611,7 @@ def kkt_ldl(G, dims, A, mnl = 0):
                 minor = helpers.sp_minor_top()
             blas.copy(x, u)
             blas.copy(y, u, offsety = n)
-            scale(z, W, trans = 'T', inverse = 'I') 
+            scale(z, W, trans = 'T', inverse = 'I', ws = ws) 
             helpers.sp_create("05solver_", minor)
             misc.pack(z, u, dims, mnl, offsety = n + p)
             helpers.sp_create("06solver_", minor)
@@ -1109,13 +1624,141 @@ def kkt_ldl(G, dims, A, mnl = 0):
             #print "** end solve **"
             #print "kkt-ldl solve end x=\n", str2(x, "%.17f")
             #print "kkt-ldl solve end z=\n", str2(z, "%.17f")
-    
+
+        def solve_many(x, y, z):
+
+            # Same as solve(), for the columns of x, y, z, with a single 
+            # call to sytrs.
+            nrhs = x.size[1]
+            U = ws_matrix(ws, 'kkt_ldl.U', (ldK, nrhs))
+            U[:n, :] = x
+            if p: U[n : n+p, :] = y
+            scale(z, W, trans = 'T', inverse = 'I', ws = ws) 
+            for k in xrange(nrhs):
+                misc.pack(z, U, dims, mnl, offsetx = k*z.size[0], 
+                    offsety = k*ldK + n + p)
+            lapack.sytrs(K, ipiv, U)
+            x[:, :] = U[:n, :]
+            if p: y[:, :] = U[n : n+p, :]
+            for k in xrange(nrhs):
+                misc.unpack(U, z, dims, mnl, offsetx = k*ldK + n + p, 
+                    offsety = k*z.size[0])
+
+        solve.solve_many = solve_many
         return solve
 
     return factor
 
 
-def kkt_qr(G, dims, A):
+# Factorizations of A' computed by qr_factor(), most recently used first.
+# Each entry is a tuple (A, QA, tauA, V, T) where A is a copy of the 
+# factored matrix.  An entry holds 3*n*p + p*(p+1) doubles for a dense 
+# p x n matrix A, so the cache holds at most QRCACHE_SIZE times that.
+# The cache is shared by the solves in all threads.
+qrcache = []
+QRCACHE_SIZE = 4
+qrcache_lock = threading.Lock()
+
+
+def qr_factor(A):
+    """
+    Returns the QR factorization of A' as a tuple (QA, tauA, V, T).
+
+    QA and tauA are the output of lapack.geqrf, V is the n x p unit lower
+    trapezoidal matrix of Householder vectors and T is the p x p upper 
+    triangular matrix of the compact WY representation
+ 
+        [Q1, Q2] = I - V * T * V'.
+
+    The factorization is cached, and reused when called again with a 
+    matrix equal to A, so A may be modified in place between calls.  
+    Checking a cache entry costs O(n*p), against O(n*p**2) for the 
+    factorization.  The returned matrices must not be modified.
+    """
+
+    qrcache_lock.acquire()
+    try:
+        for k in xrange(len(qrcache)):
+            Ac = qrcache[k][0]
+            if type(Ac) is not type(A) or Ac.size != A.size: continue
+            if type(A) is spmatrix:
+                if len(Ac.V) != len(A.V): continue
+                D = matrix((A - Ac).V)
+            else:
+                D = A - Ac
+            if not len(D) or blas.nrm2(D) == 0.0:
+                entry = qrcache.pop(k)
+                qrcache.insert(0, entry)
+                return entry[1:]
+    finally:
+        qrcache_lock.release()
+
+    p, n = A.size
+    if type(A) is matrix:
+        QA = +A.T
+    else:
+        QA = matrix(A.T)
+    tauA = matrix(0.0, (p,1))
+    lapack.geqrf(QA, tauA)
+
+    # V = unit lower trapezoidal part of QA.
+    V = matrix(0.0, (n,p))
+    lapack.lacpy(QA, V, uplo = 'L', m = n, n = p)
+    V[::n+1] = 1.0
+
+    # T[:i, i] = -tau[i] * T[:i, :i] * V[:, :i]' * V[:, i],  T[i,i] = tau[i].
+    T = matrix(0.0, (p,p))
+    for i in xrange(p):
+        blas.gemv(V, V, T, trans = 'T', alpha = -tauA[i], m = n, n = i, 
+            offsetx = i*n, offsety = i*p)
+        blas.trmv(T, T, uplo = 'U', n = i, ldA = p, offsetx = i*p)
+        T[i,i] = tauA[i]
+
+    qrcache_lock.acquire()
+    try:
+        qrcache.insert(0, (+A, QA, tauA, V, T))
+        del qrcache[QRCACHE_SIZE:]
+    finally:
+        qrcache_lock.release()
+    return QA, tauA, V, T
+
+
+def qr_apply(V, T, B, side = 'L', trans = 'N', m = None, ws = None):
+    """
+    Applies Q = I - V*T*V' or its transpose to B, using matrix-matrix 
+    products.
+
+        B := Q*B   (side is 'L', trans is 'N')
+        B := Q'*B  (side is 'L', trans is 'T')
+        B := B*Q   (side is 'R', trans is 'N')
+        B := B*Q'  (side is 'R', trans is 'T').
+
+    V and T are returned by qr_factor().  If side is 'R', only the first
+    m rows of B are updated (default: B.size[0]).  The scratch matrix 
+    is taken from the workspace ws (see ws_matrix()).
+    """
+
+    n, p = V.size
+    if not p: return
+    ldB = max(1, B.size[0])
+    if side == 'L':
+        k = B.size[1]
+        U = ws_matrix(ws, 'qr_apply.U', (p, k))
+        blas.gemm(V, B, U, transA = 'T', m = p, n = k, k = n, ldB = ldB)
+        blas.trmm(T, U, uplo = 'U', transA = trans, m = p, n = k)
+        blas.gemm(V, U, B, alpha = -1.0, beta = 1.0, m = n, n = k, k = p,
+            ldC = ldB)
+    else:
+        if m is None: m = B.size[0]
+        U = ws_matrix(ws, 'qr_apply.U', (m, p))
+        blas.gemm(B, V, U, m = m, n = p, k = n, ldA = ldB)
+        blas.trmm(T, U, side = 'R', uplo = 'U', transA = trans, m = m, 
+            n = p)
+        blas.gemm(U, V, B, transB = 'T', alpha = -1.0, beta = 1.0, m = m, 
+            n = n, k = p, ldC = ldB)
+
+
+def kkt_qr(G, dims, A, ws = None):
     """
     Solution of KKT equations with zero 1,1 block, by eliminating the
     equality constraints via a QR factorization, and solving the
@@ -1139,6 +1782,8 @@ def kkt_qr(G, dims, A):
             helpers.sp_create("30solve_qr", minor)
     A is p x n and G is N x n where N = dims['l'] + sum(dims['q']) + 
     sum( k**2 for k in dims['s'] ).
+
+    The buffers are taken from the workspace ws (see ws_matrix()).
     """
  
     p, n = A.size
@@ -1146,19 +1791,14 @@ def kkt_qr(G, dims, A):
     cdim_pckd = dims['l'] + sum(dims['q']) + sum([ int(k*(k+1)/2) for k in 
         dims['s'] ])
 
-    # A' = [Q1, Q2] * [R1; 0]
-    if type(A) is matrix:
-        QA = +A.T
-    else:
-        QA = matrix(A.T)
-    tauA = matrix(0.0, (p,1))
-    lapack.geqrf(QA, tauA)
+    # A' = [Q1, Q2] * [R1; 0],  [Q1, Q2] = I - V*T*V'.
+    QA, tauA, V, T = qr_factor(A)
 
-    Gs = matrix(0.0, (cdim, n))
-    tauG = matrix(0.0, (n-p,1))
-    u = matrix(0.0, (cdim_pckd, 1))
-    vv = matrix(0.0, (n,1))
-    w = matrix(0.0, (cdim_pckd, 1))
+    Gs = ws_matrix(ws, 'kkt_qr.Gs', (cdim, n))
+    tauG = ws_matrix(ws, 'kkt_qr.tauG', (n-p,1))
+    u = ws_matrix(ws, 'kkt_qr.u', (cdim_pckd, 1))
+    vv = ws_matrix(ws, 'kkt_qr.vv', (n,1))
+    w = ws_matrix(ws, 'kkt_qr.w', (cdim_pckd, 1))
     helpers.sp_add_var("tauA", tauA)
     helpers.sp_add_var("tauG", tauG)
     helpers.sp_add_var("Gs", Gs)
@@ -1183,7 +1823,7 @@ def kkt_qr(G, dims, A):
  
         # Gs := [ Gs1, Gs2 ] 
         #     = Gs * [ Q1, Q2 ]
-        lapack.ormqr(QA, tauA, Gs, side = 'R', m = cdim_pckd)
+        qr_apply(V, T, Gs, side = 'R', m = cdim_pckd, ws = ws)
         helpers.sp_create("03factor_qr", minor)
 
         # QR factorization Gs2 := [ Q3, Q4 ] * [ R3; 0 ] 
@@ -1219,7 +1859,7 @@ def kkt_qr(G, dims, A):
 
             # vv := [ Q1'*bx;  R3^{-T}*Q2'*bx ]
             blas.copy(x, vv)
-            lapack.ormqr(QA, tauA, vv, trans='T') 
+            qr_apply(V, T, vv, trans = 'T', ws = ws)
             lapack.trtrs(Gs, vv, uplo = 'U', trans = 'T', n = n-p, offsetA
                 = Gs.size[0]*p, offsetB = p)
             helpers.sp_create("10solve_qr", minor)
@@ -1252,7 +1892,7 @@ def kkt_qr(G, dims, A):
 
             # x is now [ R1^{-T}*by;  R3^{-1}*u[:n-p] ]
             # x := [Q1 Q2]*x
-            lapack.ormqr(QA, tauA, x) 
+            qr_apply(V, T, x, ws = ws)
             helpers.sp_create("60solve_qr", minor)
  
             # u := [Q3, Q4] * u - w 
@@ -1273,13 +1913,195 @@ def kkt_qr(G, dims, A):
             misc.unpack(u, z, dims)
             helpers.sp_create("90solve_qr", minor)
 
+        def solve_many(x, y, z):
+
+            # Same as solve(), for the columns of x, y, z, with one call
+            # to trtrs and ormqr per step.
+            nrhs = x.size[1]
+
+            # w := W^{-T} * bz in packed storage 
+            misc.scale(z, W, trans = 'T', inverse = 'I')
+            w = ws_matrix(ws, 'kkt_qr.w', (cdim_pckd, nrhs))
+            for k in xrange(nrhs):
+                misc.pack(z, w, dims, offsetx = k*z.size[0], offsety = 
+                    k*cdim_pckd)
+
+            # vv := [ Q1'*bx;  R3^{-T}*Q2'*bx ]
+            vv = +x
+            qr_apply(V, T, vv, trans = 'T', ws = ws)
+            lapack.trtrs(Gs, vv, uplo = 'U', trans = 'T', n = n-p, offsetA
+                = Gs.size[0]*p, offsetB = p)
+
+            # x[:p] := R1^{-T} * by 
+            if p: x[:p, :] = y
+            lapack.trtrs(QA, x, uplo = 'U', trans = 'T', n = p)
+
+            # w := w - Gs1 * x[:p] 
+            blas.gemm(Gs, x, w, alpha = -1.0, beta = 1.0, m = cdim_pckd, 
+                n = nrhs, k = p, ldB = n)
+
+            # u := [ Q3'*w + v[p:];  0 ]
+            u = +w
+            lapack.ormqr(Gs, tauG, u, trans = 'T', k = n-p, offsetA = 
+                Gs.size[0]*p, m = cdim_pckd)
+            u[:n-p, :] += vv[p:, :]
+            u[n-p:, :] = 0.0
+
+            # x := [Q1 Q2] * [ R1^{-T}*by;  R3^{-1}*u[:n-p] ]
+            x[p:, :] = u[:n-p, :]
+            lapack.trtrs(Gs, x, uplo='U', n = n-p, offsetA = Gs.size[0]*p,
+                offsetB = p)
+            qr_apply(V, T, x, ws = ws)
+ 
+            # u := Q3 * u[:n-p] - w
+            lapack.ormqr(Gs, tauG, u, k = n-p, m = cdim_pckd, offsetA = 
+                Gs.size[0]*p)
+            u -= w
+
+            # y := R1^{-1} * ( v[:p] - Gs1'*u )
+            if p: 
+                y[:, :] = vv[:p, :]
+                blas.gemm(Gs, u, y, transA = 'T', alpha = -1.0, beta = 1.0,
+                    m = p, n = nrhs, k = cdim_pckd)
+                lapack.trtrs(QA, y, uplo = 'U', n = p) 
+
+            for k in xrange(nrhs):
+                misc.unpack(u, z, dims, offsetx = k*cdim_pckd, offsety = 
+                    k*z.size[0])
+
+        solve.solve_many = solve_many
         return solve
 
     return factor
 
 
-def kkt_chol(G, dims, A, mnl = 0):
+# Analyses of sparse 's' blocks by sblock_analysis(), most recently used
+# first.  Each entry is a tuple (Gk, S) where Gk is a copy of the block.
+# The cache is shared by the solves in all threads.
+sblockcache = []
+SBLOCKCACHE_SIZE = 8
+sblockcache_lock = threading.Lock()
+
+
+def sblock_analysis(Gk, m):
     """
+    Returns the part of F['s'][k] in kkt_chol() that only depends on the
+    m**2 x n spmatrix Gk of an 's' block of G:  'm', 'mp', 'dims', 
+    'cols', 'L', 'Lw', 'A', and the order of the rows of the Schur 
+    complement and the formulas ('order', 'I', 'J', 'V', 'P', 'start', 
+    'F1').  
+
+    The result is cached, and reused when called again with a block 
+    equal to Gk, as when G is only extended with other cones.  The 
+    returned dictionary must not be modified.
+    """
+
+    sblockcache_lock.acquire()
+    try:
+        for k in xrange(len(sblockcache)):
+            Gc = sblockcache[k][0]
+            if Gc.size == Gk.size and len(Gc.V) == len(Gk.V) and (not 
+                len(Gk.V) or blas.nrm2(matrix((Gk - Gc).V)) == 0.0):
+                entry = sblockcache.pop(k)
+                sblockcache.insert(0, entry)
+                return entry[1]
+    finally:
+        sblockcache_lock.release()
+
+    low = [ k for k in xrange(len(Gk.I)) if Gk.I[k] % m >= Gk.I[k] / m ]
+    cols = sorted(set([ Gk.J[k] for k in low ]))
+    pos = dict([ (cols[k], k) for k in xrange(len(cols)) ])
+    Il = [ Gk.I[k] for k in low ]
+    Jl = [ pos[Gk.J[k]] for k in low ]
+    Vl = [ Gk.V[k] for k in low ]
+    S = {'m': m, 'mp': int(m*(m+1)/2), 'cols': cols,
+        'L': spmatrix(Vl, Il, Jl, (m**2, len(cols))),
+        'Lw': spmatrix([ (Il[k] % m == Il[k] / m and 1.0 or 2.0) * 
+            Vl[k] for k in xrange(len(Vl)) ], Il, Jl, (m**2, len(cols))),
+        'A': [], 
+        'dims': {'l': 0, 'q': [], 's': [m]}}
+    for k in xrange(len(cols)):
+        Lk = S['L'][:, k]
+        a, b, vk = [], [], []
+        for i, v in zip(Lk.I, Lk.V):
+            a.append(i % m);  b.append(i / m);  vk.append(v)
+            if i % m != i / m:
+                a.append(i / m);  b.append(i % m);  vk.append(v)
+        S['A'].append(spmatrix(vk, a, b, (m, m)))
+
+    # Rows of M are computed in order of decreasing number of nonzeros 
+    # of A_i.  Row i only needs M_ij for the columns j that follow i in 
+    # S['order'], so the nonzeros of these A_j are stored consecutively
+    # in (S['I'], S['J'], S['V']), with S['P'] the position of j and 
+    # S['start'][k] the offset of the kth column in the order.  
+    # S['F1'][k] is True if row k uses formula F1.
+    nnz = [ len(Ak.V) for Ak in S['A'] ]
+    S['order'] = sorted(range(len(cols)), key = lambda k: -nnz[k])
+    S['I'], S['J'], S['V'], S['P'], S['start'] = [], [], [], [], []
+    for k in S['order']:
+        S['start'].append(len(S['V']))
+        S['I'] += list(S['A'][k].I)
+        S['J'] += list(S['A'][k].J)
+        S['V'] += list(S['A'][k].V)
+        S['P'] += nnz[k] * [ k ]
+    S['V'] = matrix(S['V'], tc = 'd')
+    S['F1'] = [ m*nnz[k] + m**3 + len(Vl) <= 
+        nnz[k] * (len(S['P']) - S['start'][i]) 
+        for i, k in enumerate(S['order']) ]
+
+    sblockcache_lock.acquire()
+    try:
+        sblockcache.insert(0, (+Gk, S))
+        del sblockcache[SBLOCKCACHE_SIZE:]
+    finally:
+        sblockcache_lock.release()
+    return S
+
+
+def kkt_chol(G, dims, A, mnl = 0, ws = None, memory = 'normal'):
+    """
+    Solution of KKT equations by reduction to a 2 x 2 system, a QR 
+    factorization to eliminate the equality constraints, and a dense 
+    Cholesky factorization of order n-p. 
+
+    If G is an spmatrix, W^{-T}*G is never formed as a dense cdim x n
+    matrix.  The 'l' and 'q' rows are kept in a sparse matrix.  For the 
+    's' blocks, the contribution to Gs'*Gs is assembled as a Schur 
+    complement
+ 
+        M_ij = tr(A_i * R * A_j * R),  R = rti * rti',
+    
+    where A_i is the (symmetric, sparse) ith column of the block, with 
+    each row of M computed by one of two formulas, as in SDPA:  
+
+        F1:  M_ij = <A_j, R*A_i*R>, with R*A_i*R computed densely 
+        F3:  M_ij = sum A_i[a,b] * A_j[c,d] * R[b,c] * R[a,d] over the 
+             nonzeros of A_i and A_j.
+
+    The formula is chosen per column by the number of nonzeros.
+
+    G can also be a structured matrix, as built by sdp() for columns
+    declared as diagonal or low rank.  It is then a dictionary with 
+    G['l'], the 'l' rows, and for each 's' block a dictionary G['s'][k] 
+    with entries
+ 
+        'G':  the sparse columns, as an m**2 x n spmatrix
+        'D', 'dcols':  diagonal columns j = dcols[i] = diag(D[:,i])
+        'U', 'V', 'lcols':  low rank columns 
+               j = lcols[i] = (U[i]*V[i]' + V[i]*U[i]')/2.
+
+    dims['q'] must be empty and mnl zero.  M_ij is then computed from
+    R.*R for two diagonal columns, from diag(R*A_j*R) for a diagonal and 
+    a sparse column, and from R*U[i] and R*V[i] for low rank columns.
+
+    If G is dense and memory is 'low', Gs is not stored either.  Gs'*Gs 
+    is accumulated cone by cone, from blocks of 'l' rows, the Gram 
+    matrices of the 'q' rows, and the same formula as F1 for the 's' 
+    blocks, one column at a time.  The products with Gs in the solve 
+    are evaluated as products with GG and scalings of the right-hand 
+    side.
+
+    The dense buffers are taken from the workspace ws (see ws_matrix()).
     """
 
     p, n = A.size
@@ -1289,17 +2111,327 @@ def kkt_chol(G, dims, A, mnl = 0):
         for k in dims['s'] ])
 
     # A' = [Q1, Q2] * [R; 0]  (Q1 is n x p, Q2 is n x n-p).
-    if type(A) is matrix: 
-        QA = A.T
-    else: 
-        QA = matrix(A.T)
-    tauA = matrix(0.0, (p,1))
-    lapack.geqrf(QA, tauA)
+    QA, tauA, V, T = qr_factor(A)
 
-    Gs = matrix(0.0, (cdim, n))
-    K = matrix(0.0, (n,n)) 
-    bzp = matrix(0.0, (cdim_pckd, 1))
-    yy = matrix(0.0, (p,1))
+    lowmem = False
+    if type(G) is spmatrix or type(G) is dict:
+
+        # Sparse G.  Gs is stored as 
+        #
+        #     F['Gsp'] = W^{-T} * GG for the nonlinear, 'l' and 'q' rows
+        #
+        # (an spmatrix).  For the kth 's' block, only the lower triangular
+        # nonzeros of G (the part referenced by scale()) are stored, for 
+        # the columns cols with nonzeros in block k: 
+        #
+        #     F['s'][k]['L']:   the nonzeros, as an m**2 x len(cols) 
+        #                       spmatrix
+        #     F['s'][k]['Lw']:  same, with off-diagonal entries doubled, so
+        #                       that Lw[:,i]' * X = <A_i, X> for symmetric X
+        #                       with its lower triangle stored
+        #     F['s'][k]['A']:   A_i as symmetric m x m spmatrices
+        #
+        # and W^{-T} * G is applied as rti' * A_i * rti.  The diagonal 
+        # and low rank columns of a structured G are stored in 'D' and 
+        # 'lr' (pairs U, V) and listed in 'dcols' and 'lcols'; 'allcols'
+        # is cols + dcols + lcols, the order of the rows and columns of 
+        # 'K'.
+        Gs = None
+        F = {'Gsp': None, 'q': [], 's': []}
+        ml = dims['l']
+        if type(G) is dict:
+            F['Gl'] = G['l']
+            if type(F['Gl']) is not spmatrix:
+                F['Gl'] = spmatrix([], [], [], (ml, n))
+                if ml: F['Gl'] = base.sparse(G['l'])
+            blocks = [ (Sk['G'], Sk['D'], Sk['dcols'], Sk['U'], Sk['V'], 
+                Sk['lcols']) for Sk in G['s'] ]
+        else:
+            F['Gl'] = G[:ml, :]
+            ind = ml + sum(dims['q'])
+            blocks = []
+            for m in dims['s']:
+                blocks.append((G[ind : ind+m**2, :], matrix(0.0, (m, 0)), 
+                    [], [], [], []))
+                ind += m**2
+        ind = ml
+        for m in dims['q']:
+            Gk = G[ind : ind+m, :]
+            cols = sorted(set(Gk.J))
+            F['q'].append({'G': Gk, 'cols': cols, 
+                'J': spmatrix([1.0] + (m-1)*[-1.0], range(m), range(m)),
+                'Ir': len(cols) * range(m), 
+                'Jr': [ j for j in cols for i in xrange(m) ]})
+            ind += m
+        indp = mnl + ind
+        for m, (Gk, D, dcols, U, V_, lcols) in zip(dims['s'], blocks):
+            S = dict(sblock_analysis(Gk, m))
+            cols = S['cols']
+            S.update({'offset': indp, 'dcols': dcols, 'D': D, 
+                'lcols': lcols, 'lr': zip(U, V_), 
+                'allcols': cols + dcols + lcols,
+                'K': matrix(0.0, (len(cols) + len(dcols) + len(lcols),
+                    len(cols) + len(dcols) + len(lcols))), 
+                'R': matrix(0.0, (m, m)),
+                'W': {'d': matrix(0.0, (0,1)), 'di': matrix(0.0, (0,1)), 
+                    'v': [], 'beta': [], 'r': [], 'rti': []}})
+            F['s'].append(S)
+            indp += S['mp']
+    elif memory == 'low':
+        Gs, lowmem = None, True
+        F = {'W': None, 'Df': None}
+
+        # F['wl'][k]:  weights of the entries of an m x m matrix, 2 for 
+        # the strictly lower triangle, 1 for the diagonal and 0 for the 
+        # strictly upper triangle, so that wl' * vec(A.*Y) = <A, Y> for 
+        # symmetric A, Y with only the lower triangle of A stored.
+        F['wl'] = [ matrix([ float(i >= j) + float(i > j) for j in 
+            xrange(m) for i in xrange(m) ]) for m in dims['s'] ]
+    else:
+        Gs = ws_matrix(ws, 'kkt_chol.Gs', (cdim, n))
+    K = ws_matrix(ws, 'kkt_chol.K', (n,n)) 
+    bzp = ws_matrix(ws, 'kkt_chol.bzp', (cdim_pckd, 1))
+    yy = ws_matrix(ws, 'kkt_chol.yy', (p,1))
+
+    def gsgs(W, Df):
+        # K := Gs' * Gs for a dense G with memory = 'low', accumulated 
+        # cone by cone without storing Gs.
+        blas.scal(0.0, K)
+        ml, ldG = dims['l'], max(1, G.size[0])
+
+        # Nonlinear and 'l' rows:  sum of GG_i' * GG_i / d_i^2, for blocks
+        # of rows of GG with at most LOWMEM_SIZE entries.
+        nr = max(1, min(mnl + ml, LOWMEM_SIZE / n))
+        if mnl + ml: B = ws_matrix(ws, 'kkt_chol.B', (nr, n))
+        for X, d, m in ((Df, W.get('dnli'), mnl), (G, W['di'], ml)):
+            for i in xrange(0, m, nr):
+                k = min(nr, m-i)
+                if type(X) is matrix:
+                    lapack.lacpy(X, B, m = k, n = n, ldA = max(1, 
+                        X.size[0]), offsetA = i, ldB = nr)
+                else:
+                    B[:k, :] = matrix(X[i : i+k, :])
+                for j in xrange(n):
+                    blas.tbmv(d, B, n = k, k = 0, ldA = 1, offsetA = i,
+                        offsetx = j*nr)
+                blas.syrk(B, K, trans = 'T', k = k, beta = 1.0)
+
+        # 'q' rows:  W_k^{-T} * G_k = 1/beta * (2*J*v*v'*J - J) * G_k, so
+        #
+        #     G_k' * W_k^{-1} * W_k^{-T} * G_k 
+        #         = 1/beta^2 * (G_k'*G_k + 4*(v'*v)*a*a' - 2*(a*b' + b*a'))
+        #
+        # with a = G_k'*J*v, b = G_k'*v.
+        ind = ml
+        if dims['q']:
+            ga = ws_matrix(ws, 'kkt_chol.ga', (n, 1))
+            gb = ws_matrix(ws, 'kkt_chol.gb', (n, 1))
+            jv = ws_matrix(ws, 'kkt_chol.jv', (max(dims['q']), 1))
+        for k in xrange(len(dims['q'])):
+            m, v, bk = dims['q'][k], W['v'][k], W['beta'][k]
+            blas.copy(v, jv)
+            blas.scal(-1.0, jv, offset = 1, n = m-1)
+            blas.gemv(G, jv, ga, trans = 'T', m = m, n = n, ldA = ldG, 
+                offsetA = ind)
+            blas.gemv(G, v, gb, trans = 'T', m = m, n = n, ldA = ldG,
+                offsetA = ind)
+            blas.syrk(G, K, trans = 'T', n = n, k = m, ldA = ldG, offsetA =
+                ind, alpha = 1.0 / bk**2, beta = 1.0)
+            blas.syr(ga, K, alpha = 4.0 * blas.dot(v, v) / bk**2)
+            blas.syr2(ga, gb, K, alpha = -2.0 / bk**2)
+            ind += m
+
+        # 's' rows:  column i of G_k' * W_k^{-1} * W_k^{-T} * G_k is 
+        #
+        #     <A_j, R * A_i * R>,  R = rti * rti',
+        #
+        # for the columns A_j of G_k, evaluated as G_k' * (wl .* vec(Y)), 
+        # Y = R * A_i * R.  Only the lower triangle of K is computed.
+        if dims['s']:
+            maxm = max(dims['s'])
+            R = ws_matrix(ws, 'kkt_chol.R', (maxm**2, 1))
+            X = ws_matrix(ws, 'kkt_chol.X', (maxm**2, 1))
+            Y = ws_matrix(ws, 'kkt_chol.Y1', (maxm**2, 1))
+        for k in xrange(len(dims['s'])):
+            m = dims['s'][k]
+            blas.syrk(W['rti'][k], R, n = m, ldC = m)
+            misc.symm(R, m)
+            for i in xrange(n):
+                blas.copy(G, X, offsetx = ind + i*ldG, n = m**2)
+                misc.symm(X, m)
+                blas.symm(R, X, Y, m = m, n = m, ldA = m, ldB = m, ldC = m)
+                blas.symm(R, Y, X, side = 'R', m = m, n = m, ldA = m, 
+                    ldB = m, ldC = m)
+                blas.tbmv(F['wl'][k], X, n = m**2, k = 0, ldA = 1)
+                blas.gemv(G, X, K, trans = 'T', m = m**2, n = n-i, ldA = 
+                    ldG, offsetA = ind + i*ldG, beta = 1.0, offsety = 
+                    i*(n+1))
+            ind += m**2
+
+    def gsmv(u, v, trans = 'N', beta = 0.0):
+        # v := Gs*u + beta*v (trans is 'N') or v := Gs'*u + beta*v 
+        # (trans is 'T'), with Gs = W^{-T} * GG in packed storage.
+        # u and v may have several columns.
+        nrhs = u.size[1]
+        if lowmem:
+            # Gs*u = pack(W^{-T} * GG*u) and Gs'*u = GG' * W^{-1} * 
+            # unpack(u), with GG*u and unpack(u) stored in gg.
+            gg = ws_matrix(ws, 'kkt_chol.gg', (cdim, nrhs))
+            if trans == 'N':
+                if mnl: gg[:mnl, :] = F['Df'] * u
+                blas.gemm(G, u, gg, m = cdim - mnl, n = nrhs, k = n, 
+                    ldC = cdim, offsetC = mnl)
+                misc.scale(gg, F['W'], trans = 'T', inverse = 'I')
+                pack2(gg, dims, mnl)
+                blas.scal(beta, v)
+                for k in xrange(nrhs):
+                    blas.axpy(gg, v, n = cdim_pckd, offsetx = k*cdim, 
+                        offsety = k*v.size[0])
+            else:
+                for k in xrange(nrhs):
+                    misc.unpack(u, gg, dims, mnl, offsetx = k*u.size[0], 
+                        offsety = k*cdim)
+                misc.scale(gg, F['W'], inverse = 'I')
+                for k in xrange(nrhs):
+                    misc.sgemv(G, gg, v, dims, trans = 'T', beta = beta,
+                        offsetx = k*cdim + mnl, offsety = k*v.size[0])
+                if mnl: 
+                    v[:, :] = v + F['Df'].T * gg[:mnl, :]
+            return
+        if Gs is not None:
+            if nrhs == 1:
+                blas.gemv(Gs, u, v, trans = trans, beta = beta, m = 
+                    cdim_pckd)
+            elif trans == 'N':
+                blas.gemm(Gs, u, v, beta = beta, m = cdim_pckd, n = nrhs,
+                    k = n)
+            else:
+                blas.gemm(Gs, u, v, transA = 'T', beta = beta, m = n, n = 
+                    nrhs, k = cdim_pckd)
+            return
+        mr = F['Gsp'].size[0]
+        if nrhs == 1:
+            base.gemv(F['Gsp'], u, v, trans = trans, beta = beta)
+        elif trans == 'N':
+            vr = v[:mr, :]
+            base.gemm(F['Gsp'], u, vr, beta = beta)
+            v[:mr, :] = vr
+        else:
+            base.gemm(F['Gsp'], u[:mr, :], v, transA = 'T', beta = beta)
+        for S in F['s']:
+            m, nc, off = S['m'], len(S['allcols']), S['offset']
+            if not nc:
+                if trans == 'N': v[off : off + S['mp'], :] *= beta
+                continue
+            Y = ws_matrix(ws, 'kkt_chol.Y', (m**2, nrhs))
+            if trans == 'N':
+                # v := pack(rti' * (sum_i u_i * A_i) * rti) + beta*v
+                if S['cols']: base.gemm(S['L'], u[S['cols'], :], Y)
+                if S['dcols']: 
+                    Y[::m+1, :] += S['D'] * u[S['dcols'], :]
+                for k in xrange(nrhs):
+                    for i in xrange(len(S['lcols'])):
+                        ui = 0.5 * u[S['lcols'][i], k]
+                        Ui, Vi = S['lr'][i]
+                        blas.gemm(Ui, Vi, Y, transB = 'T', 
+                            alpha = ui, beta = 1.0, ldC = m, offsetC = 
+                            k*m**2)
+                        blas.gemm(Vi, Ui, Y, transB = 'T', 
+                            alpha = ui, beta = 1.0, ldC = m, offsetC = 
+                            k*m**2)
+                scale(Y, S['W'], trans = 'T', inverse = 'I')
+                pack2(Y, S['dims'])
+                v[off : off + S['mp'], :] = beta * v[off : off + S['mp'],
+                    :] + Y[:S['mp'], :]
+            else:
+                # v_i := <A_i, rti * unpack(u) * rti'> + beta*v_i
+                for k in xrange(nrhs):
+                    misc.unpack(u, Y, S['dims'], offsetx = off + 
+                        k*u.size[0], offsety = k*m**2)
+                scale(Y, S['W'], inverse = 'I')
+                Su = ws_matrix(ws, 'kkt_chol.Su', (nc, nrhs))
+                ns, nd = len(S['cols']), len(S['dcols'])
+                if ns: 
+                    Ss = Su[:ns, :]
+                    base.gemm(S['Lw'], Y, Ss, transA = 'T')
+                    Su[:ns, :] = Ss
+                if nd: Su[ns : ns+nd, :] = S['D'].T * Y[::m+1, :]
+                for k in xrange(nrhs):
+                    if not S['lcols']: break
+                    misc.symm(Y, m, offset = k*m**2)
+                    Yk = matrix(Y[:, k], (m, m))
+                    for i in xrange(len(S['lcols'])):
+                        Su[ns+nd+i, k] = blas.dot(S['lr'][i][0], 
+                            Yk * S['lr'][i][1])
+                v[S['allcols'], :] = v[S['allcols'], :] + Su
+
+    def schur(S):
+        # S['K'] := M,  M_ij = tr(A_i * R * A_j * R),  R = rti * rti'.
+        m, nc, R, M = S['m'], len(S['cols']), S['R'], S['K']
+        blas.syrk(S['W']['rti'][0], R)
+        misc.symm(R, m)
+        B = ws_matrix(ws, 'kkt_chol.B', (m**2, 1))
+        Bi = ws_matrix(ws, 'kkt_chol.Bi', (m, m))
+        for pos in xrange(nc):
+            i, first = S['order'][pos], S['start'][pos]
+            rest = S['order'][pos:]
+            Ai = S['A'][i]
+            if S['F1'][pos]:
+                # F1:  B = R * A_i * R;  M_ij = <A_j, B>.
+                base.gemm(Ai, R, Bi)
+                blas.gemm(R, Bi, B, m = m, n = m, k = m, ldC = m)
+                Mi = ws_matrix(ws, 'kkt_chol.Mi', (nc, 1))
+                base.gemv(S['Lw'], B, Mi, trans = 'T')
+            else:
+                # F3:  M_ij = sum A_i[a,b] * A_j[c,d] * R[b,c] * R[a,d].
+                X = mul(R[list(Ai.J), S['I'][first:]], 
+                    R[list(Ai.I), S['J'][first:]])
+                w = matrix(0.0, (len(S['P']) - first, 1))
+                blas.gemv(X, Ai.V, w, trans = 'T')
+                Mi = matrix(spmatrix(mul(w, S['V'][first:]), 
+                    S['P'][first:], [0] * len(w), (nc, 1)))
+            M[i, rest] = Mi[rest].T
+            M[rest, i] = Mi[rest]
+
+        # Diagonal columns A_i = diag(D[:,i]):
+        #
+        #     M_ij = D[:,i]' * (R.*R) * D[:,j]       (A_j diagonal)
+        #     M_ij = D[:,i]' * diag(R * A_j * R)     (A_j sparse).
+        ns, nd, nl = nc, len(S['dcols']), len(S['lcols'])
+        D, ds = S['D'], range(ns, ns+nd)
+        if nd:
+            M[ds, ds] = D.T * mul(R, R) * D
+            if ns:
+                H = matrix(0.0, (m, ns))
+                for j in xrange(ns):
+                    Aj = S['A'][j]
+                    H[:, j] = mul(R[:, list(Aj.I)], R[:, list(Aj.J)]) * \
+                        Aj.V
+                M[ds, :ns] = D.T * H
+                M[:ns, ds] = M[ds, :ns].T
+
+        # Low rank columns A_i = (U*V' + V*U')/2, with P = R*U, Q = R*V and
+        # R*A_i*R = (P*Q' + Q*P')/2:
+        #
+        #     M_ij = sum A_j[a,b] * P[a,:] * Q[b,:]'   (A_j sparse)
+        #     M_ij = D[:,j]' * diag(P*Q')              (A_j diagonal)
+        #     M_ij = (tr(U_j'*P*Q'*V_j) + tr(U_j'*Q*P'*V_j)) / 2 
+        #                                              (A_j low rank).
+        for i in xrange(nl):
+            li = ns + nd + i
+            P, Q = R * S['lr'][i][0], R * S['lr'][i][1]
+            for j in xrange(ns):
+                Aj = S['A'][j]
+                M[li, j] = blas.dot(Aj.V, mul(P[list(Aj.I), :], 
+                    Q[list(Aj.J), :]) * matrix(1.0, (P.size[1], 1)))
+            if nd:
+                M[li, ds] = (D.T * (mul(P, Q) * matrix(1.0, (P.size[1], 
+                    1)))).T
+            for j in xrange(i+1):
+                Uj, Vj = S['lr'][j]
+                M[li, ns+nd+j] = 0.5 * (blas.dot(Uj.T * P, Vj.T * Q) + 
+                    blas.dot(Uj.T * Q, Vj.T * P))
+            M[:li, li] = M[li, :li].T
 
     def factor(W, H = None, Df = None):
 
@@ -1316,22 +2448,59 @@ def kkt_chol(G, dims, A, mnl = 0):
             minor = helpers.sp_minor_top()
 
         # Gs = W^{-T} * GG in packed storage.
-        if mnl: 
-            Gs[:mnl, :] = Df
-        Gs[mnl:, :] = G
-        helpers.sp_create("00factor_chol", minor)
-        misc.scale(Gs, W, trans = 'T', inverse = 'I')
-        misc.pack2(Gs, dims, mnl)
-        helpers.sp_create("10factor_chol", minor)
+        if lowmem:
+            F['W'], F['Df'] = W, Df
+            gsgs(W, Df)
+        elif Gs is not None:
+            if mnl: 
+                Gs[:mnl, :] = Df
+            Gs[mnl:, :] = G
+            helpers.sp_create("00factor_chol", minor)
+            misc.scale(Gs, W, trans = 'T', inverse = 'I')
+            misc.pack2(Gs, dims, mnl)
+            helpers.sp_create("10factor_chol", minor)
+
+            # K = [Q1, Q2]' * (H + Gs' * Gs) * [Q1, Q2].
+            blas.syrk(Gs, K, k = cdim_pckd, trans = 'T')
+        else:
+            # Nonlinear and 'l' rows:  Wnl^{-1} * Df and Wl^{-1} * Gl.
+            Gsp = [ spmatrix(W['di'], range(ml), range(ml)) * F['Gl'] ]
+            if mnl:
+                Gsp = [ spmatrix(W['dnli'], range(mnl), range(mnl)) * Df ] \
+                    + Gsp
 
-        # K = [Q1, Q2]' * (H + Gs' * Gs) * [Q1, Q2].
-        blas.syrk(Gs, K, k = cdim_pckd, trans = 'T')
+            # 'q' rows:  
+            #
+            #     W^{-T} * Gk = 1/beta * (2*J*v*v'*J - J) * Gk 
+            #                 = 1/beta * (2*(J*v) * (Gk'*J*v)' - J*Gk).
+            #
+            # The rank-one term is nonzero only in the columns of Gk.
+            for k in xrange(len(F['q'])):
+                Q = F['q'][k]
+                jv = Q['J'] * W['v'][k]
+                w = Q['G'].T * jv
+                uw = 2.0 * jv * w[Q['cols']].T
+                Gsp += [ (spmatrix(uw[:], Q['Ir'], Q['Jr'], Q['G'].size) 
+                    - Q['J'] * Q['G']) * (1.0 / W['beta'][k]) ]
+            F['Gsp'] = base.sparse(Gsp) 
+
+            helpers.sp_create("10factor_chol", minor)
+
+            # K = Gs' * Gs, accumulated block by block.
+            base.syrk(F['Gsp'], K, trans = 'T')
+            for k in xrange(len(F['s'])):
+                S = F['s'][k]
+                if not S['allcols']: continue
+                S['W']['r'] = [ W['r'][k] ]
+                S['W']['rti'] = [ W['rti'][k] ]
+                schur(S)
+                K[S['allcols'], S['allcols']] += S['K']
         if H is not None:
             K[:,:] += H
         helpers.sp_create("20factor_chol", minor)
         misc.symm(K, n)
-        lapack.ormqr(QA, tauA, K, side = 'L', trans = 'T')
-        lapack.ormqr(QA, tauA, K, side = 'R')
+        qr_apply(V, T, K, trans = 'T', ws = ws)
+        qr_apply(V, T, K, side = 'R', ws = ws)
         helpers.sp_create("30factor_chol", minor)
 
         # Cholesky factorization of 2,2 block of K.
@@ -1370,8 +2539,8 @@ def kkt_chol(G, dims, A, mnl = 0):
 
             # x := [Q1, Q2]' * (x + Gs' * bzp)
             #    = [Q1, Q2]' * (bx + Gs' * W^{-T} * bz)
-            blas.gemv(Gs, bzp, x, beta = 1.0, trans = 'T', m = cdim_pckd)
-            lapack.ormqr(QA, tauA, x, side = 'L', trans = 'T')
+            gsmv(bzp, x, trans = 'T', beta = 1.0)
+            qr_apply(V, T, x, trans = 'T', ws = ws)
             helpers.sp_create("20solve_chol", minor)
 
             # y := x[:p] 
@@ -1403,16 +2572,61 @@ def kkt_chol(G, dims, A, mnl = 0):
             helpers.sp_create("60solve_chol", minor)
            
             # x := [Q1, Q2] * x
-            lapack.ormqr(QA, tauA, x, side = 'L')
+            qr_apply(V, T, x, ws = ws)
             helpers.sp_create("70solve_chol", minor)
 
             # bzp := Gs * x - bzp.
             #      = W^{-T} * ( GG*ux - bz ) in packed storage.
             # Unpack and copy to z.
-            blas.gemv(Gs, x, bzp, alpha = 1.0, beta = -1.0, m = cdim_pckd)
+            gsmv(x, bzp, beta = -1.0)
             misc.unpack(bzp, z, dims, mnl)
             helpers.sp_create("90solve_chol", minor)
 
+        def solve_many(x, y, z):
+
+            # Same as solve(), for the columns of x, y, z, with a single
+            # call to potrs.
+            nrhs = x.size[1]
+
+            # bz := W^{-T} * bz in packed storage 
+            misc.scale(z, W, trans = 'T', inverse = 'I')
+            bz = ws_matrix(ws, 'kkt_chol.bz', (cdim_pckd, nrhs))
+            for k in xrange(nrhs):
+                misc.pack(z, bz, dims, mnl, offsetx = k*z.size[0], 
+                    offsety = k*cdim_pckd)
+
+            # x := [Q1, Q2]' * (x + Gs' * bz)
+            gsmv(bz, x, trans = 'T', beta = 1.0)
+            qr_apply(V, T, x, trans = 'T', ws = ws)
+
+            # y := x[:p],  x[:p] := R^{-T} * by 
+            if p:
+                by = +y
+                y[:, :] = x[:p, :]
+                x[:p, :] = by
+            lapack.trtrs(QA, x, uplo = 'U', trans = 'T', n = p)
+
+            # x[p:] := K22^{-1} * (x[p:] - K21*x[:p])
+            blas.gemm(K, x, x, alpha = -1.0, beta = 1.0, m = n-p, n = nrhs,
+                k = p, offsetA = p, ldB = n, ldC = n, offsetC = p)
+            lapack.potrs(K, x, n = n-p, offsetA = p*(n+1), offsetB = p)
+
+            # y := R^{-1} * (y - [K11, K12] * x)
+            if p:
+                blas.gemm(K, x, y, alpha = -1.0, beta = 1.0, m = p, n = 
+                    nrhs, k = n)
+                lapack.trtrs(QA, y, uplo = 'U', n = p)
+           
+            # x := [Q1, Q2] * x
+            qr_apply(V, T, x, ws = ws)
+
+            # bz := Gs * x - bz, unpacked and copied to z.
+            gsmv(x, bz, beta = -1.0)
+            for k in xrange(nrhs):
+                misc.unpack(bz, z, dims, mnl, offsetx = k*cdim_pckd, 
+                    offsety = k*z.size[0])
+
+        solve.solve_many = solve_many
         return solve
 
     return factor
@@ -1455,6 +2669,8 @@ def kkt_chol2(G, dims, A, mnl = 0):
                     helpers.sp_add_var("Dfs", F['Dfs'])
                 else: 
                     F['Dfs'] = spmatrix(0.0, Df.I, Df.J, Df.size) 
+                F['dnli'] = spmatrix(0.0, range(mnl), range(mnl))
+            F['di'] = spmatrix(0.0, range(ml), range(ml))
             if (mnl and type(Df) is matrix) or type(G) is matrix or \
                 type(H) is matrix:
                 F['S'] = matrix(0.0, (n,n))
@@ -1469,16 +2685,17 @@ def kkt_chol2(G, dims, A, mnl = 0):
                 else:
                     F['K'] = spmatrix([], [], [], (p,p), 'd')
 
-        # Dfs = Wnl^{-1} * Df 
-        if mnl: base.gemm(spmatrix(W['dnli'], list(range(mnl)), 
-            list(range(mnl))), Df, F['Dfs'], partial = True)
+        # Dfs = Wnl^{-1} * Df.  The diagonal matrices F['dnli'] and 
+        # F['di'] are created in the first call and updated here.
+        if mnl: 
+            F['dnli'].V = W['dnli']
+            base.gemm(F['dnli'], Df, F['Dfs'], partial = True)
 
         helpers.sp_create("02factor_chol2", minor)
         # Gs = Wl^{-1} * G.
-        di = spmatrix(W['di'], list(range(ml)), list(range(ml)))
-        #print "di %d, %d:\n" %(di.size[0], di.size[1]), di
+        F['di'].V = W['di']
         #print "G  %d, %d:\n"%(G.size[0], G.size[1]), G
-        base.gemm(di, G, F['Gs'], partial = True)
+        base.gemm(F['di'], G, F['Gs'], partial = True)
 
         helpers.sp_create("06factor_chol2", minor)
 
@@ -1659,6 +2876,32 @@ def kkt_chol2(G, dims, A, mnl = 0):
             helpers.sp_create("90solve_chol2", minor)
             #print "chol2 solver [end]...\n", str(x)
 
+        def solve_many(x, y, z):
+
+            # Same as solve(), for the columns of x, y, z, with single
+            # calls to trsm and potrs.
+            scale(z, W, trans = 'T', inverse = 'I') 
+            if mnl:
+                zn = z[:mnl, :]
+                base.gemm(F['Dfs'], zn, x, transA = 'T', beta = 1.0)
+            zl = z[mnl:, :]
+            base.gemm(F['Gs'], zl, x, transA = 'T', beta = 1.0)
+            if F['singular']:
+                base.gemm(A, y, x, transA = 'T', beta = 1.0)
+            blas.trsm(F['S'], x)
+            base.gemm(Asct, x, y, transA = 'T', beta = -1.0)
+            lapack.potrs(F['K'], y)
+            base.gemm(Asct, y, x, alpha = -1.0, beta = 1.0)
+            blas.trsm(F['S'], x, transA = 'T')
+            if mnl:
+                base.gemm(F['Dfs'], x, zn, beta = -1.0)
+                z[:mnl, :] = zn
+            base.gemm(F['Gs'], x, zl, beta = -1.0)
+            z[mnl:, :] = zl
+
+        # The sparse (cholmod) factorization is solved column by column.
+        if type(F['S']) is matrix and type(F['K']) is matrix:
+            solve.solve_many = solve_many
         return solve
 
     return factor
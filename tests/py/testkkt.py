@@ -0,0 +1,114 @@
+#
+# Solves an LP, an SOCP and an SDP with conelp() and G sparse, with the 
+# KKT solver 'chol' (the sparse variant of localmisc.kkt_chol()), with 
+# options['memory'] = 'low' and with kktsolver 'auto', and compares the 
+# solutions with that of the dense 'ldl' solver.  The KKT solvers are 
+# also factored for a scaling at an interior point, and the solutions of 
+# several right-hand sides by localmisc.kkt_solve_many() are compared 
+# with those of the dense 'ldl' solver, one right-hand side at a time.
+
+import sys
+from cvxopt import blas, misc, matrix, sparse, normal, uniform, setseed
+import localcones, localmisc
+import helpers
+
+
+def check(name, sol, ref, keys, tol = 1e-5):
+    diff = max([ max(abs(sol[k] - ref[k])) / (1.0 + max(abs(ref[k])))
+        for k in keys ])
+    if sol['status'] == ref['status'] and diff < tol: res = "OK"
+    else: res = "FAILED"
+    print "%s: %s, %s, diff=%.2e %s" % (name, sol['status'], ref['status'],
+        diff, res)
+
+
+def interior(dims):
+    """
+    Returns a random point in the interior of the cone.
+    """
+    x = [ uniform(dims['l'], 1) + 0.5 ]
+    for m in dims['q']:
+        u = normal(m - 1, 1)
+        x.append(matrix([ blas.nrm2(u) + 1.0, u ]))
+    for m in dims['s']:
+        B = normal(m, m)
+        S = B*B.T
+        S[::m+1] += 1.0
+        x.append(S[:])
+    return matrix(x)
+
+
+def problem(n, dims, p = 2):
+    """
+    Returns a strictly primal and dual feasible cone LP with a sparse G, 
+    with symmetric columns in the 's' blocks.
+    """
+    cdim = dims['l'] + sum(dims['q']) + sum([ m**2 for m in dims['s'] ])
+    G = normal(cdim, n)
+    for k in xrange(cdim*n):  # about 40% nonzeros
+        if uniform(1, 1)[0] > 0.4: G[k] = 0.0
+    ind = dims['l'] + sum(dims['q'])
+    for m in dims['s']:
+        for j in xrange(n):
+            S = matrix(G[ind : ind + m**2, j], (m, m))
+            G[ind : ind + m**2, j] = (S + S.T)[:]
+        ind += m**2
+    A = normal(p, n)
+    x0 = normal(n, 1)
+    h, b = G*x0 + interior(dims), A*x0
+    c = -G.T*interior(dims) - A.T*normal(p, 1)
+    return c, sparse(G), h, A, b
+
+
+def testkkt(opts):
+    localcones.options.update(opts)
+    setseed(8)
+    for name, n, dims in [
+        ("lp", 20, {'l': 60, 'q': [], 's': []}),
+        ("socp", 20, {'l': 20, 'q': [6, 8, 10], 's': []}),
+        ("sdp", 15, {'l': 10, 'q': [], 's': [4, 6]}) ]:
+        c, G, h, A, b = problem(n, dims)
+        ref = localcones.conelp(c, matrix(G), h, dims, A, b, 
+            kktsolver = 'ldl')
+        keys = ('x', 's', 'y', 'z')
+        check(name + " chol", localcones.conelp(c, G, h, dims, A, b, 
+            kktsolver = 'chol'), ref, keys)
+        check(name + " chol low", localcones.conelp(c, matrix(G), h, dims, 
+            A, b, kktsolver = 'chol', options = dict(opts, 
+            memory = 'low')), ref, keys)
+        check(name + " low", localcones.conelp(c, G, h, dims, A, b, 
+            options = dict(opts, memory = 'low')), ref, keys)
+        check(name + " auto", localcones.conelp(c, G, h, dims, A, b, 
+            kktsolver = 'auto'), ref, keys)
+
+        # A scaling at an interior point, and 3 right-hand sides.
+        s, z = interior(dims), interior(dims)
+        lmbda = matrix(0.0, (dims['l'] + sum(dims['q']) + sum(dims['s']), 
+            1))
+        W = misc.compute_scaling(s, z, lmbda, dims)
+        cdim = h.size[0]
+        X, Y, Z = normal(n, 3), normal(A.size[0], 3), normal(cdim, 3)
+        f = localmisc.kkt_ldl(matrix(G), dims, A)(W)
+        refs = []
+        for k in xrange(3):
+            x, y, z = X[:, k], Y[:, k], Z[:, k]
+            f(x, y, z)
+            refs.append({'x': x, 'y': y, 'z': z, 'status': 'solved'})
+        for kkt, factor in [
+            ("ldl", localmisc.kkt_ldl(matrix(G), dims, A)),
+            ("qr", localmisc.kkt_qr(matrix(G), dims, A)),
+            ("chol", localmisc.kkt_chol(G, dims, A)) ]:
+            x, y, z = +X, +Y, +Z
+            localmisc.kkt_solve_many(factor(W), x, y, z)
+            for k in xrange(3):
+                check("%s solve_many %s %d" % (name, kkt, k), {'x': x[:, k],
+                    'y': y[:, k], 'z': z[:, k], 'status': 'solved'}, 
+                    refs[k], ('x', 'y', 'z'), 1e-8)
+
+
+if len(sys.argv[1:]) > 0:
+    if sys.argv[1] == "-sp":
+        helpers.sp_reset("./sp.data")
+        helpers.sp_activate()
+
+testkkt({'show_progress': False})
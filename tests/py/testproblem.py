@@ -0,0 +1,58 @@
+#
+# Solves an LP and a QP set up once by lp_problem() and qp_problem() with
+# problem_solve() for several right-hand sides, and compares the solutions
+# with those of solvers.lp() and solvers.qp().
+
+import sys
+from cvxopt import matrix, normal, uniform, setseed, solvers
+import localcones
+import helpers
+
+
+def check(name, sol, ref, keys, tol = 1e-5):
+    diff = max([ max(abs(sol[k] - ref[k])) / (1.0 + max(abs(ref[k])))
+        for k in keys ])
+    if sol['status'] == ref['status'] and diff < tol: res = "OK"
+    else: res = "FAILED"
+    print "%s: %s, %s, diff=%.2e %s" % (name, sol['status'], ref['status'],
+        diff, res)
+
+
+def testproblem(opts):
+    solvers.options.update(opts)
+    setseed(2)
+    n, m, p = 25, 60, 3
+    G, A = normal(m, n), normal(p, n)
+
+    PR = localcones.lp_problem(matrix(1.0, (n, 1)), G, matrix(1.0, (m, 1)),
+        A, matrix(0.0, (p, 1)), options = opts)
+    for k in xrange(4):
+        x0 = normal(n, 1)
+        h, b = G*x0 + uniform(m, 1), A*x0
+        c = G.T*uniform(m, 1) + A.T*normal(p, 1)
+        sol = localcones.problem_solve(PR, c = c, h = h, b = b,
+            options = opts)
+        ref = solvers.lp(c, G, h, A, b)
+        check("lp %d" %k, sol, ref, ('x', 's', 'y', 'z'))
+
+    B = normal(n, n)
+    P = B*B.T
+    P[::n+1] += 1.0
+    PR = localcones.qp_problem(P, matrix(0.0, (n, 1)), G,
+        matrix(1.0, (m, 1)), A, matrix(0.0, (p, 1)), options = opts)
+    for k in xrange(4):
+        x0 = normal(n, 1)
+        h, b = G*x0 + uniform(m, 1), A*x0
+        q = normal(n, 1)
+        sol = localcones.problem_solve(PR, c = q, h = h, b = b,
+            options = opts)
+        ref = solvers.qp(P, q, G, h, A, b)
+        check("qp %d" %k, sol, ref, ('x', 's', 'y', 'z'))
+
+
+if len(sys.argv[1:]) > 0:
+    if sys.argv[1] == "-sp":
+        helpers.sp_reset("./sp.data")
+        helpers.sp_activate()
+
+testproblem({'show_progress': False})
@@ -0,0 +1,62 @@
+#
+# Solves a batch of small QPs with the same G and A with qp_batch(), and
+# compares each solution with that of solvers.qp().
+
+from cvxopt import matrix, normal, uniform, setseed, solvers
+import localcones
+
+
+def check(name, sols, refs, keys, tol = 1e-5):
+    diff, failed = 0.0, 0
+    for sol, ref in zip(sols, refs):
+        d = max([ max(abs(sol[k] - ref[k])) / (1.0 + max(abs(ref[k])))
+            for k in keys ])
+        diff = max(diff, d)
+        if sol['status'] != ref['status'] or d >= tol: failed += 1
+    if len(sols) == len(refs) and not failed: res = "OK"
+    else: res = "FAILED"
+    print "%s: %d problems, %d failed, diff=%.2e %s" % (name, len(refs),
+        failed, diff, res)
+
+
+def testqpbatch(opts):
+    solvers.options.update(opts)
+    setseed(4)
+    n, m, p, N = 8, 20, 2, 50
+    G, A = normal(m, n), normal(p, n)
+    Ps, qs, hs, bs = [], [], [], []
+    for k in xrange(N):
+        B = normal(n, n)
+        P = B*B.T
+        P[::n+1] += 1.0
+        x0 = normal(n, 1)
+        Ps.append(P)
+        qs.append(normal(n, 1))
+        hs.append(G*x0 + uniform(m, 1))
+        bs.append(A*x0)
+
+    sols = localcones.qp_batch(Ps, qs, G, hs, A, bs, options = opts)
+    refs = [ solvers.qp(Ps[k], qs[k], G, hs[k], A, bs[k]) for k in
+        xrange(N) ]
+    check("qp_batch", sols, refs, ('x', 's', 'y', 'z'))
+
+    # One P and b for all problems, with h feasible for the same x0.
+    x0 = normal(n, 1)
+    b = A*x0
+    hs = [ G*x0 + uniform(m, 1) for k in xrange(N) ]
+    sols = localcones.qp_batch(Ps[0], qs, G, hs, A, b, options = opts)
+    refs = [ solvers.qp(Ps[0], qs[k], G, hs[k], A, b) for k in xrange(N) ]
+    check("qp_batch shared P, b", sols, refs, ('x', 's', 'y', 'z'))
+
+    # No equality constraints.
+    sols = localcones.qp_batch(Ps, qs, G, hs, options = opts)
+    refs = [ solvers.qp(Ps[k], qs[k], G, hs[k]) for k in xrange(N) ]
+    check("qp_batch A = None", sols, refs, ('x', 's', 'z'))
+
+    # No inequality constraints.
+    sols = localcones.qp_batch(Ps, qs, A = A, b = bs, options = opts)
+    refs = [ solvers.qp(Ps[k], qs[k], A = A, b = bs[k]) for k in xrange(N) ]
+    check("qp_batch G = None", sols, refs, ('x', 'y'))
+
+
+testqpbatch({'show_progress': False})
@@ -0,0 +1,87 @@
+#
+# Solves small LPs and QPs, which conelp() and coneqp() hand to
+# conelp_small() and coneqp_small(), and compares the solutions with
+# those of solvers.lp() and solvers.qp().  The same problems are solved
+# again with an explicit KKT solver other than 'ldl' and with savepoints
+# active, which must take the general path (and write savepoints).
+
+import os, shutil, tempfile
+from cvxopt import matrix, normal, uniform, setseed, solvers
+import localcones
+import helpers
+
+
+def check(name, sol, ref, keys, tol = 1e-5):
+    diff = max([ max(abs(sol[k] - ref[k])) / (1.0 + max(abs(ref[k])))
+        for k in keys ])
+    if sol['status'] == ref['status'] and diff < tol: res = "OK"
+    else: res = "FAILED"
+    print "%s: %s, %s, diff=%.2e %s" % (name, sol['status'], ref['status'],
+        diff, res)
+
+
+def problems():
+    setseed(3)
+    n, m, p = 10, 30, 3
+    G, A = normal(m, n), normal(p, n)
+    x0 = normal(n, 1)
+    h, b = G*x0 + uniform(m, 1), A*x0
+    c = G.T*uniform(m, 1) + A.T*normal(p, 1)
+    B = normal(n, n)
+    P = B*B.T
+    P[::n+1] += 1.0
+    return c, P, G, h, A, b
+
+
+def testsmall(opts):
+    localcones.options.update(opts)
+    solvers.options.update(opts)
+    c, P, G, h, A, b = problems()
+    lpref = solvers.lp(c, G, h, A, b)
+    qpref = solvers.qp(P, c, G, h, A, b)
+    check("lp", localcones.lp(c, G, h, A, b), lpref, ('x', 's', 'y', 'z'))
+    check("qp", localcones.qp(P, c, G, h, A, b), qpref, ('x', 's', 'y',
+        'z'))
+
+    # An explicit KKT solver other than 'ldl' must take the general path.
+    for name, small, solve, ref in [
+        ("lp", "conelp_small", lambda kkt: localcones.conelp(c, G, h, 
+            A = A, b = b, kktsolver = kkt), lpref),
+        ("qp", "coneqp_small", lambda kkt: localcones.coneqp(P, c, G, h, 
+            A = A, b = b, kktsolver = kkt), qpref) ]:
+        f, calls = getattr(localcones, small), []
+        def counted(*args):
+            calls.append(1)
+            return f(*args)
+        setattr(localcones, small, counted)
+        try:
+            for kkt in (None, 'ldl', 'chol'):
+                del calls[:]
+                sol = solve(kkt)
+                if (kkt == 'chol') == (not calls): res = "OK"
+                else: res = "FAILED"
+                print "%s %s: small path %s %s" % (name, kkt, 
+                    bool(calls), res)
+                check("%s %s" % (name, kkt), sol, ref, ('x', 's', 'y', 'z'))
+        finally:
+            setattr(localcones, small, f)
+
+    for name, solve, ref in [
+        ("lp", lambda: localcones.lp(c, G, h, A, b), lpref),
+        ("qp", lambda: localcones.qp(P, c, G, h, A, b), qpref) ]:
+        path = tempfile.mkdtemp()
+        try:
+            helpers.sp_reset(path)
+            helpers.sp_activate()
+            sol = solve()
+            helpers.sp_reset(".")
+            check(name + " -sp", sol, ref, ('x', 's', 'y', 'z'))
+            count = len(os.listdir(path))
+            if count: res = "OK"
+            else: res = "FAILED"
+            print "%s -sp: %d savepoints %s" % (name, count, res)
+        finally:
+            shutil.rmtree(path)
+
+
+testsmall({'show_progress': False})
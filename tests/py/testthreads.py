@@ -0,0 +1,101 @@
+#
+# Solves LPs, QPs and problems with a nonlinear constraint with conelp(),
+# coneqp() and cpl() and different KKT solvers, first one after the other
+# and then in 8 threads at once, each with its own options and 
+# savepoints.  The solutions and the savepoints written by the threads 
+# must be the same as those of the serial solves.
+
+import os, shutil, tempfile, threading
+from cvxopt import matrix, spdiag, normal, uniform, setseed
+import localcones, localcvx
+import helpers
+
+
+def check(name, sol, ref, keys, tol = 1e-8):
+    diff = max([ max(abs(sol[k] - ref[k])) / (1.0 + max(abs(ref[k])))
+        for k in keys ])
+    if sol['status'] == ref['status'] and diff < tol: res = "OK"
+    else: res = "FAILED"
+    print "%s: %s, %s, diff=%.2e %s" % (name, sol['status'], ref['status'],
+        diff, res)
+
+
+def savepoints(path):
+    files = {}
+    for name in os.listdir(path):
+        with open(os.path.join(path, name)) as fp: files[name] = fp.read()
+    return files
+
+
+def testthreads(opts):
+    setseed(7)
+    n, m, p = 20, 50, 2
+    G, A = normal(m, n), normal(p, n)
+    x0 = normal(n, 1)
+    h, b = G*x0 + uniform(m, 1), A*x0
+    c = G.T*uniform(m, 1) + A.T*normal(p, 1)
+    dims = {'l': m - 10, 'q': [5, 5], 's': []}
+    h[m - 10] += 10.0
+    h[m - 5] += 10.0
+    B = normal(n, n)
+    P = B*B.T
+    P[::n+1] += 1.0
+
+    # minimize c'*x subject to x'*x <= 1, G*x <= hc
+    def F(x = None, z = None):
+        if x is None: return 1, matrix(0.0, (n, 1))
+        f = x.T*x - 1.0
+        Df = 2.0 * x.T
+        if z is None: return f, Df
+        return f, Df, spdiag(matrix(2.0 * z[0], (n, 1)))
+    hc = G*(0.5 * x0 / max(abs(x0))) + uniform(m, 1)
+
+    jobs = []
+    for kkt in ('ldl', 'chol', 'qr'):
+        jobs.append(("conelp " + kkt, lambda o, kkt = kkt: 
+            localcones.conelp(c, G, h, dims, A, b, kktsolver = kkt, 
+            options = o), ('x', 's', 'y', 'z')))
+    for kkt in ('ldl', 'ldl2', 'chol'):
+        jobs.append(("coneqp " + kkt, lambda o, kkt = kkt: 
+            localcones.coneqp(P, c, G, h, dims, A, b, kktsolver = kkt, 
+            options = o), ('x', 's', 'y', 'z')))
+    for kkt in ('ldl', 'chol'):
+        jobs.append(("cpl " + kkt, lambda o, kkt = kkt: 
+            localcvx.cpl(c, F, G, hc, kktsolver = kkt, options = o), 
+            ('x', 'sl', 'zl', 'znl')))
+
+    def run(job, path, result):
+        helpers.sp_reset(path)
+        helpers.sp_activate()
+        try:
+            result['sol'] = job[1](dict(opts))
+        finally:
+            helpers.sp_reset(".")
+        result['savepoints'] = savepoints(path)
+
+    paths = [ tempfile.mkdtemp() for k in xrange(2*len(jobs)) ]
+    try:
+        refs = [ {} for job in jobs ]
+        for job, path, ref in zip(jobs, paths, refs):
+            run(job, path, ref)
+        results = [ {} for job in jobs ]
+        threads = [ threading.Thread(target = run, args = (job, path, 
+            result)) for job, path, result in zip(jobs, paths[len(jobs):],
+            results) ]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        for job, ref, result in zip(jobs, refs, results):
+            if 'sol' not in result:
+                print "%s: no solution FAILED" % job[0]
+                continue
+            check(job[0], result['sol'], ref['sol'], job[2])
+            if result['savepoints'] == ref['savepoints'] and \
+                ref['savepoints']: res = "OK"
+            else: res = "FAILED"
+            print "%s: %d savepoints %s" % (job[0], 
+                len(result['savepoints']), res)
+    finally:
+        for path in paths: shutil.rmtree(path)
+
+
+testthreads({'show_progress': False})
@@ -0,0 +1,83 @@
+#
+# Solves an LP, a QP and a problem with a nonlinear constraint with 
+# conelp(), coneqp() and cpl() and options['time_limit'].  The limit is 
+# made to expire after K iterations by replacing localmisc.time_out(), 
+# and the solvers must return status 'time_limit' with the best iterate 
+# so far:  an iterate at least as good as the one after K iterations 
+# returned with options['maxiters'] = K.
+
+from cvxopt import matrix, spdiag, normal, uniform, setseed
+import localcones, localcvx, localmisc
+
+
+def rank(sol):
+    return max(sol['primal infeasibility'], sol['dual infeasibility'],
+        sol['relative gap'] or sol['gap'])
+
+
+def check(name, solve, opts, K = 3):
+    ref = solve(opts)
+    last = solve(dict(opts, maxiters = K))
+    time_out = localmisc.time_out
+    localmisc.time_out = lambda start, limit, iters: iters >= K
+    try:
+        sol = solve(dict(opts, time_limit = 1.0))
+    finally:
+        localmisc.time_out = time_out
+    if sol['status'] == 'time_limit' and sorted(sol.keys()) == \
+        sorted(ref.keys()) and rank(sol) <= rank(last): res = "OK"
+    else: res = "FAILED"
+    print "%s: %s, rank %.2e, after %d iterations %.2e %s" % (name, 
+        sol['status'], rank(sol), K, rank(last), res)
+
+    # A limit that has expired before the first iteration, and one that
+    # is never reached.
+    sol = solve(dict(opts, time_limit = 1e-9))
+    if sol['status'] == 'time_limit': res = "OK"
+    else: res = "FAILED"
+    print "%s 1e-9: %s %s" % (name, sol['status'], res)
+    sol = solve(dict(opts, time_limit = 1e3))
+    diff = max(abs(sol['x'] - ref['x']))
+    if sol['status'] == ref['status'] and diff == 0.0: res = "OK"
+    else: res = "FAILED"
+    print "%s 1e3: %s, diff=%.2e %s" % (name, sol['status'], diff, res)
+
+    for limit in (0.0, -1.0, 'x'):
+        try: 
+            solve(dict(opts, time_limit = limit))
+            res = "FAILED"
+        except ValueError:
+            res = "OK"
+        print "%s %r: ValueError %s" % (name, limit, res)
+
+
+def testtimelimit(opts):
+    setseed(6)
+    n, m, p = 30, 60, 3
+    G, A = normal(m, n), normal(p, n)
+    x0 = normal(n, 1)
+    h, b = G*x0 + uniform(m, 1), A*x0
+    c = G.T*uniform(m, 1) + A.T*normal(p, 1)
+    dims = {'l': m - 20, 'q': [10, 10], 's': []}
+    h[m - 20] += 10.0
+    h[m - 10] += 10.0
+    B = normal(n, n)
+    P = B*B.T
+    P[::n+1] += 1.0
+    check("conelp", lambda o: localcones.conelp(c, G, h, dims, A, b, 
+        options = o), opts)
+    check("coneqp", lambda o: localcones.coneqp(P, c, G, h, dims, A, b, 
+        options = o), opts)
+
+    # minimize c'*x subject to x'*x <= 1, G*x <= h
+    def F(x = None, z = None):
+        if x is None: return 1, matrix(0.0, (n, 1))
+        f = x.T*x - 1.0
+        Df = 2.0 * x.T
+        if z is None: return f, Df
+        return f, Df, spdiag(matrix(2.0 * z[0], (n, 1)))
+    h = G*(0.5 * x0 / max(abs(x0))) + uniform(m, 1)
+    check("cpl", lambda o: localcvx.cpl(c, F, G, h, options = o), opts)
+
+
+testtimelimit({'show_progress': False})
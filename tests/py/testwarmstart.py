@@ -0,0 +1,65 @@
+#
+# Solves an LP by a cutting-plane method with conelp_new(), conelp_add()
+# and conelp_solve():  each step adds a cut that removes the last 
+# solution, and solves the problem again, warm started and cold.  The 
+# solutions are compared with each other and with those of 
+# solvers.conelp(), and the warm starts must take fewer iterations.
+
+import sys
+from cvxopt import matrix, spmatrix, normal, setseed, solvers
+import localcones
+import helpers
+
+
+def check(name, sol, ref, keys, tol = 1e-5):
+    diff = max([ max(abs(sol[k] - ref[k])) / (1.0 + max(abs(ref[k])))
+        for k in keys ])
+    if sol['status'] == ref['status'] and diff < tol: res = "OK"
+    else: res = "FAILED"
+    print "%s: %s, %s, diff=%.2e %s" % (name, sol['status'], ref['status'],
+        diff, res)
+
+
+def testwarmstart(opts):
+    solvers.options.update(opts)
+    setseed(5)
+    n = 10
+    c = normal(n, 1)
+    I = spmatrix(1.0, range(n), range(n))
+    G, h = matrix([ I, -I ]), matrix(1.0, (2*n, 1))
+
+    warm = localcones.conelp_new(c, G, h)
+    cold = localcones.conelp_new(c, G, h)
+    witers, citers = 0, 0
+    for k in xrange(9):
+        if k:
+            # The cut a'*x <= a'*x0 / 2, with a'*x0 > 0, removes the last
+            # solution x0 and keeps x = 0 strictly feasible.
+            a = normal(1, n)
+            g = a * warm['sol']['x']
+            if g[0] < 0.0: a, g = -a, -g
+            g *= 0.5
+            localcones.conelp_add(warm, a, g)
+            localcones.conelp_add(cold, a, g)
+            G, h = matrix([ G, a ]), matrix([ h, g ])
+        wsol = localcones.conelp_solve(warm, options = opts)
+        csol = localcones.conelp_solve(cold, warmstart = False, 
+            options = opts)
+        ref = solvers.conelp(c, G, h)
+        check("cut %d warm" %k, wsol, ref, ('x', 's', 'z'))
+        check("cut %d cold" %k, csol, ref, ('x', 's', 'z'))
+        if k:
+            witers += wsol['iterations']
+            citers += csol['iterations']
+
+    if witers < citers: res = "OK"
+    else: res = "FAILED"
+    print "iterations: warm %d, cold %d %s" % (witers, citers, res)
+
+
+if len(sys.argv[1:]) > 0:
+    if sys.argv[1] == "-sp":
+        helpers.sp_reset("./sp.data")
+        helpers.sp_activate()
+
+testwarmstart({'show_progress': False})